@@ -1,9 +1,15 @@
 from django.contrib import admin
-from .models import DiagnosticHistory
+from .models import DiagnosticHistory, PredictionJob
 
 @admin.register(DiagnosticHistory)
 class DiagnosticHistoryAdmin(admin.ModelAdmin):
     list_display = ['patient_name', 'identification_number', 'diagnosis', 'risk_level', 'diagnosis_date']
     list_filter = ['diagnosis', 'diagnosis_date']
     search_fields = ['patient_name', 'identification_number']
-    readonly_fields = ['diagnosis_date']
\ No newline at end of file
+    readonly_fields = ['diagnosis_date']
+
+@admin.register(PredictionJob)
+class PredictionJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'status', 'priority', 'created_at', 'finished_at']
+    list_filter = ['status', 'priority']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
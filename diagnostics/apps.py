@@ -1,5 +1,23 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 class DiagnosticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'diagnostics'
+
+    def ready(self):
+        # Registra las métricas que se leen al consultar /metrics
+        from . import collectors  # noqa: F401
+        # Señales que mantienen las estadísticas materializadas
+        from . import stats  # noqa: F401
+
+        # Tope global de píxeles de PIL (bombas de descompresión) también para
+        # imágenes que no pasan por ImageUploadHandler
+        from PIL import Image
+        Image.MAX_IMAGE_PIXELS = getattr(settings, 'IMAGE_UPLOAD_MAX_PIXELS', Image.MAX_IMAGE_PIXELS)
+
+        # Precalentamiento opcional en segundo plano: carga el modelo y ejecuta
+        # una pasada ficticia sin bloquear el arranque del worker
+        if getattr(settings, 'DIAGNOSTICS_WARMUP_ON_STARTUP', False):
+            from .registry import get_registry
+            get_registry().warm_up_in_background()
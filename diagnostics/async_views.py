@@ -0,0 +1,197 @@
+"""Variantes ASGI nativas de predicción, historial y detalle.
+
+Pensadas para servirse con un servidor ASGI (``skin_cancer_dashboard.asgi``):
+la lectura de la subida y el ORM no bloquean el event loop y la inferencia se
+delega a un executor dedicado. Un semáforo limita las pasadas simultáneas del
+modelo y, cuando hay demasiadas peticiones esperando, se responde 429 con
+``Retry-After`` en lugar de acumularlas.
+"""
+import asyncio
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from users.authentication import CachedJWTAuthentication
+
+from .explain import explain_in_background
+from .history import InvalidQuery, filter_diagnostics, paginate, serialize_detail, serialize_row, visible_diagnostics
+from .models import DiagnosticHistory
+from .pipeline import describe_prediction, parse_tta, predict_served
+from .registry import get_registry
+from .renditions import renditions_in_background
+from .storage import content_key, get_blob_store
+from .uploads import UploadError, upload_error
+
+
+class InferenceGate:
+    """Concurrencia acotada de inferencia con rechazo cuando la cola se llena"""
+
+    def __init__(self, concurrency, max_pending):
+        self.concurrency = max(1, int(concurrency))
+        self.max_pending = max(self.concurrency, int(max_pending))
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='async-inference')
+        self.pending = 0
+        # Varios event loops (WSGI, hilos de sync_to_async) comparten el contador
+        self._lock = threading.Lock()
+        # Un semáforo por event loop (bajo WSGI cada petición async usa otro)
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.pending -= 1
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        async with semaphore:
+            return await loop.run_in_executor(self.executor, func, *args)
+
+
+_gate = None
+_gate_lock = threading.Lock()
+
+
+def get_inference_gate():
+    global _gate
+    if _gate is None:
+        with _gate_lock:
+            if _gate is None:
+                _gate = InferenceGate(
+                    getattr(settings, 'ASYNC_INFERENCE_CONCURRENCY', None) or os.cpu_count(),
+                    getattr(settings, 'ASYNC_INFERENCE_MAX_PENDING', 64),
+                )
+    return _gate
+
+
+def _authenticate_sync(request):
+    result = CachedJWTAuthentication().authenticate(request)
+    return result[0] if result else None
+
+
+async def authenticate(request):
+    """Usuario del token JWT o None"""
+    try:
+        return await sync_to_async(_authenticate_sync)(request)
+    except AuthenticationFailed:
+        return None
+
+
+def unauthorized():
+    return JsonResponse({'detail': 'Las credenciales de autenticación no se proveyeron.'}, status=401)
+
+
+def too_busy():
+    response = JsonResponse({'error': 'Servidor ocupado, reintente en unos segundos'}, status=429)
+    response['Retry-After'] = str(getattr(settings, 'ASYNC_RETRY_AFTER_SECONDS', 1))
+    return response
+
+
+def _read_upload(request):
+    image_file = request.FILES.get('image')
+    if upload_error(request) is not None:
+        raise upload_error(request)
+    return image_file.read() if image_file is not None else None
+
+
+def _run_prediction(image_bytes, image_hash, views):
+    registry = get_registry()
+    if not registry.ensure_loaded():
+        raise RuntimeError('Modelo no cargado en el servidor')
+    return predict_served(registry, image_bytes, image_hash, views)
+
+
+async def api_predict(request):
+    """Endpoint: POST /api/async/predict/ (form data: 'image', opcional 'tta')"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    user = await authenticate(request)
+    if user is None:
+        return unauthorized()
+
+    gate = get_inference_gate()
+    if not gate.try_acquire():
+        return too_busy()
+    try:
+        try:
+            image_bytes = await sync_to_async(_read_upload)(request)
+        except UploadError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+        if image_bytes is None:
+            return JsonResponse({'error': 'No file provided'}, status=400)
+        try:
+            views = parse_tta(request.GET.get('tta') or request.POST.get('tta'))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        image_hash = content_key(image_bytes)
+
+        try:
+            probs, model, tta, embedding = await gate.run(_run_prediction, image_bytes, image_hash, views)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+    finally:
+        gate.release()
+
+    prediction = describe_prediction(probs, model.class_names)
+    confidence = prediction.pop('risk_level')
+    image_key = await sync_to_async(get_blob_store().save)(image_bytes, key=image_hash)
+    diagnostic = await DiagnosticHistory.objects.acreate(
+        user=user,
+        patient_name=user.full_name,
+        identification_number=user.identification_number,
+        diagnosis=prediction['predicted_class'],
+        risk_level=confidence,
+        probabilities=probs,
+        image_key=image_key,
+        model_version=model.version,
+        embedding=embedding,
+    )
+    renditions_in_background([diagnostic])
+    explain_in_background(diagnostic)
+    if tta is not None:
+        prediction['tta'] = tta
+    return JsonResponse({'id': str(diagnostic.id), 'model_version': model.version, **prediction})
+
+
+async def diagnostic_history(request):
+    """Endpoint: GET /api/async/diagnostics/ (mismos parámetros que el síncrono)"""
+    user = await authenticate(request)
+    if user is None:
+        return unauthorized()
+    try:
+        queryset = filter_diagnostics(visible_diagnostics(user), request.GET, user)
+        rows, next_cursor = await sync_to_async(paginate)(queryset, request.GET)
+    except InvalidQuery as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'results': [serialize_row(row) for row in rows], 'next_cursor': next_cursor})
+
+
+async def diagnostic_detail(request, diagnostic_id):
+    """Endpoint: GET /api/async/diagnostics/<id>/"""
+    user = await authenticate(request)
+    if user is None:
+        return unauthorized()
+    try:
+        diagnostic = await visible_diagnostics(user).aget(id=diagnostic_id)
+    except DiagnosticHistory.DoesNotExist:
+        return JsonResponse({'error': 'Diagnóstico no encontrado'}, status=404)
+    return JsonResponse(serialize_detail(diagnostic))
+
+
+# csrf_exempt no envuelve vistas async en Django 4.2: se marca directamente.
+# La autenticación es por token JWT, no por cookie de sesión.
+api_predict.csrf_exempt = True
@@ -0,0 +1,229 @@
+"""Motores de inferencia intercambiables.
+
+Todos reciben un lote float32 de forma (N, 224, 224, 3) ya normalizado a
+[-1, 1] y devuelven un ``np.ndarray`` (N, clases) con las probabilidades. Los
+que tienen ``supports_embeddings`` devuelven además, con
+``predict_with_embeddings``, la activación de la penúltima capa (la entrada
+de la capa de clasificación) en la misma pasada. Este módulo no depende de
+Django para poder usarse también desde ``modelo.py``.
+"""
+import os
+import threading
+
+import numpy as np
+
+
+class InferenceBackend:
+    name = None
+    supports_embeddings = False
+    supports_gradcam = False
+
+    def __init__(self, model_path, num_threads=None, inter_op_threads=None):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.inter_op_threads = inter_op_threads
+
+    def load(self):
+        raise NotImplementedError
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+    def predict_with_embeddings(self, batch):
+        """(probabilidades (N, clases), embeddings (N, D)) en una sola pasada"""
+        raise NotImplementedError
+
+
+def _leaf_layers(model):
+    # Teachable Machine anida modelos Sequential (extractor + cabeza)
+    import keras
+
+    layers = []
+    for layer in model.layers:
+        if isinstance(layer, keras.Sequential):
+            layers.extend(_leaf_layers(layer))
+        else:
+            layers.append(layer)
+    return layers
+
+
+def embedding_model(model):
+    """Modelo con dos salidas, (entrada de la última capa, probabilidades),
+    que comparte los pesos de ``model``"""
+    import keras
+
+    layers = _leaf_layers(model)
+    inputs = keras.Input(shape=model.input_shape[1:])
+    x = inputs
+    for layer in layers[:-1]:
+        x = layer(x)
+    return keras.Model(inputs, [x, layers[-1](x)])
+
+
+def gradcam_model(model):
+    """Modelo con dos salidas, (mapa de la última capa convolucional,
+    probabilidades), para Grad-CAM"""
+    import keras
+
+    inputs = keras.Input(shape=model.input_shape[1:])
+    x = inputs
+    features = None
+    for layer in _leaf_layers(model):
+        x = layer(x)
+        if len(x.shape) == 4:
+            features = x
+    if features is None:
+        raise ValueError('El modelo no tiene capas convolucionales para Grad-CAM')
+    return keras.Model(inputs, [features, x])
+
+
+class KerasBackend(InferenceBackend):
+    """Modelo original de Teachable Machine (.h5) ejecutado con Keras"""
+    name = 'keras'
+    supports_gradcam = True
+    _gradcam_model = None
+
+    def load(self):
+        if self.num_threads or self.inter_op_threads:
+            import tensorflow as tf
+            if self.num_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(self.num_threads)
+            if self.inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(self.inter_op_threads)
+        from keras.models import load_model
+        self.model = load_model(self.model_path, compile=False)
+        try:
+            self.embedding_model = embedding_model(self.model)
+            self.supports_embeddings = True
+        except Exception:
+            # Arquitectura no secuencial: solo probabilidades
+            self.embedding_model = None
+        return self
+
+    def predict(self, batch):
+        return np.asarray(self.model.predict_on_batch(batch))
+
+    def predict_with_embeddings(self, batch):
+        embeddings, probs = self.embedding_model.predict_on_batch(batch)
+        return np.asarray(probs), np.asarray(embeddings).reshape(len(batch), -1)
+
+    def gradcam(self, batch, class_index=None):
+        """Mapas Grad-CAM (N, h, w) para ``class_index`` (por defecto, la clase
+        predicha) y las probabilidades, con una pasada hacia adelante y una hacia atrás"""
+        import tensorflow as tf
+
+        if self._gradcam_model is None:
+            self._gradcam_model = gradcam_model(self.model)
+        with tf.GradientTape() as tape:
+            features, probs = self._gradcam_model(tf.convert_to_tensor(batch), training=False)
+            if class_index is None:
+                index = tf.argmax(probs, axis=1)
+            else:
+                index = tf.fill([tf.shape(probs)[0]], tf.cast(class_index, tf.int64))
+            score = tf.gather(probs, index, axis=1, batch_dims=1)
+        gradients = tape.gradient(score, features)
+        weights = tf.reduce_mean(gradients, axis=(1, 2), keepdims=True)
+        maps = tf.nn.relu(tf.reduce_sum(weights * features, axis=-1))
+        return maps.numpy(), probs.numpy()
+
+
+class TFLiteBackend(InferenceBackend):
+    """Modelo convertido a TFLite; usa tflite_runtime si está instalado"""
+    name = 'tflite'
+
+    def __init__(self, model_path, **options):
+        super().__init__(model_path, **options)
+        self._lock = threading.Lock()
+        self._batch_size = None
+
+    def load(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        self.interpreter = Interpreter(model_path=self.model_path, num_threads=self.num_threads)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.interpreter.allocate_tensors()
+        return self
+
+    def predict(self, batch):
+        # El intérprete no es reentrante: se serializa y se redimensiona la
+        # entrada solo cuando cambia el tamaño del lote
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self._input['index'], batch)
+            self.interpreter.invoke()
+            return np.array(self.interpreter.get_tensor(self._output['index']))
+
+
+class OnnxBackend(InferenceBackend):
+    """Modelo convertido a ONNX ejecutado con ONNX Runtime en CPU"""
+    name = 'onnx'
+
+    def load(self):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        if self.inter_op_threads:
+            options.inter_op_num_threads = self.inter_op_threads
+        self.session = ort.InferenceSession(
+            self.model_path, sess_options=options, providers=['CPUExecutionProvider']
+        )
+        self._input_name = self.session.get_inputs()[0].name
+        return self
+
+    def predict(self, batch):
+        return self.session.run(None, {self._input_name: batch})[0]
+
+
+class ServiceBackend(InferenceBackend):
+    """Delegado al servicio local de inferencia multiproceso.
+
+    ``model_path`` es la ruta del socket Unix de ``manage.py
+    run_inference_service``; el modelo vive solo en los procesos del servicio.
+    """
+    name = 'service'
+
+    def load(self):
+        from django.conf import settings
+
+        from .inference_service import InferenceServiceClient
+        self.client = InferenceServiceClient(
+            self.model_path,
+            connections=getattr(settings, 'INFERENCE_SERVICE_CONNECTIONS', None)
+            or getattr(settings, 'INFERENCE_SERVICE_PROCESSES', None),
+        )
+        return self
+
+    def predict(self, batch):
+        return self.client.predict(batch)
+
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    TFLiteBackend.name: TFLiteBackend,
+    OnnxBackend.name: OnnxBackend,
+    ServiceBackend.name: ServiceBackend,
+}
+
+
+def default_artifact_path(keras_path, backend_name):
+    """Ruta del artefacto convertido junto al .h5 (keras_model.tflite, .onnx)"""
+    if backend_name == KerasBackend.name:
+        return keras_path
+    root, _ = os.path.splitext(keras_path)
+    return f"{root}.{backend_name}"
+
+
+def get_backend(name, model_path, **options):
+    """Instancia (sin cargar) el motor ``name`` sobre ``model_path``"""
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Motor de inferencia desconocido: {name!r} (opciones: {', '.join(BACKENDS)})")
+    return backend_class(model_path, **options)
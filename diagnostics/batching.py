@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def _row(output, i):
+    if isinstance(output, tuple):
+        return tuple(part[i] for part in output)
+    return output[i]
+
+
+class MicroBatcher:
+    """Agrupa peticiones concurrentes de predicción en un solo tensor.
+
+    Cada llamada a ``predict`` encola una imagen ya normalizada (224x224x3) y
+    espera su resultado. Un hilo de fondo junta hasta ``max_batch_size``
+    imágenes o lo que llegue en ``max_wait_ms`` milisegundos, ejecuta una sola
+    pasada hacia adelante y reparte a cada petición su fila de la salida. Si
+    ``predict_fn`` devuelve una tupla de arreglos (probabilidades y
+    embeddings), cada petición recibe la tupla de sus filas.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=10):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._batches = 0
+        self._items = 0
+        self._fill_histogram = [0] * self.max_batch_size
+        self._buffer = None
+        self._stopped = False
+        self._submit_lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='diagnostics-microbatcher', daemon=True
+                )
+                self._thread.start()
+
+    def predict(self, image_array, timeout=None):
+        """Encola una imagen y bloquea hasta obtener su vector de probabilidades"""
+        future = Future()
+        with self._submit_lock:
+            stopped = self._stopped
+            if not stopped:
+                self.start()
+                self._queue.put((image_array, future))
+        if stopped:
+            # Lote detenido (modelo reemplazado): pasada individual directa
+            return _row(self.predict_fn(image_array[np.newaxis, ...]), 0)
+        return future.result(timeout=timeout)
+
+    def stop(self):
+        """Deja de aceptar imágenes; las ya encoladas se procesan antes de salir"""
+        with self._submit_lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._queue.put(None)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        items = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _stack(self, arrays):
+        # Búfer de lote preasignado: solo lo usa el hilo de fondo
+        shape = (self.max_batch_size,) + arrays[0].shape
+        if self._buffer is None or self._buffer.shape != shape:
+            self._buffer = np.empty(shape, dtype=np.float32)
+        return np.stack(arrays, out=self._buffer[:len(arrays)])
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            items, stopping = self._collect()
+            if not items:
+                continue
+            futures = [future for _, future in items]
+            try:
+                batch = self._stack([array for array, _ in items])
+                output = self.predict_fn(batch)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            with self._lock:
+                self._batches += 1
+                self._items += len(items)
+                self._fill_histogram[len(items) - 1] += 1
+
+            for i, future in enumerate(futures):
+                future.set_result(_row(output, i))
+
+    def stats(self):
+        """Estadísticas de llenado de lotes"""
+        with self._lock:
+            batches = self._batches
+            items = self._items
+            histogram = list(self._fill_histogram)
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'batches': batches,
+            'items': items,
+            'queue_depth': self._queue.qsize(),
+            'avg_batch_size': round(items / batches, 3) if batches else 0.0,
+            'avg_fill_ratio': round(items / (batches * self.max_batch_size), 3) if batches else 0.0,
+            'fill_histogram': {str(size + 1): count for size, count in enumerate(histogram) if count},
+        }
@@ -0,0 +1,134 @@
+"""Utilidades de ``manage.py benchmark``: corpus sintético, cronómetros y
+generador de carga HTTP."""
+import io
+import json
+import random
+import resource
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageOps
+
+
+def synthetic_corpus(source_path, count, seed=0):
+    """Variantes JPEG distintas de ``source_path`` (recortes, giros, brillo y
+    tamaño), para que ninguna coincida en la caché de predicciones"""
+    rng = random.Random(seed)
+    base = Image.open(source_path).convert('RGB')
+    corpus = []
+    for _ in range(count):
+        image = base
+        width, height = image.size
+        crop = rng.uniform(0.7, 1.0)
+        left = rng.randint(0, int(width * (1 - crop)))
+        top = rng.randint(0, int(height * (1 - crop)))
+        image = image.crop((left, top, left + int(width * crop), top + int(height * crop)))
+        if rng.random() < 0.5:
+            image = ImageOps.mirror(image)
+        image = image.rotate(rng.choice((0, 90, 180, 270)), expand=True)
+        image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.85, 1.15))
+        scale = rng.uniform(0.5, 1.5)
+        image = image.resize((max(224, int(image.width * scale)), max(224, int(image.height * scale))))
+        buffered = io.BytesIO()
+        image.save(buffered, format='JPEG', quality=rng.randint(80, 95))
+        corpus.append(buffered.getvalue())
+    return corpus
+
+
+def summarize(latencies, wall_seconds=None):
+    """p50/p95/p99 (ms) y rendimiento de una serie de latencias en segundos"""
+    values = np.asarray(latencies, dtype=np.float64) * 1000.0
+    if values.size == 0:
+        return {'count': 0}
+    total = wall_seconds if wall_seconds is not None else float(values.sum() / 1000.0)
+    return {
+        'count': int(values.size),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'max_ms': round(float(values.max()), 3),
+        'throughput_per_s': round(values.size / total, 2) if total > 0 else None,
+    }
+
+
+def time_stage(func, inputs, iterations):
+    """Ejecuta ``func`` sobre ``inputs`` (cíclicamente) y mide cada llamada"""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        value = inputs[i % len(inputs)]
+        t0 = time.perf_counter()
+        func(value)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KiB, macOS bytes
+    return round(usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024, 1)
+
+
+def multipart_body(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        'Content-Type: image/jpeg\r\n\r\n'
+    ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def run_load(make_request, total, concurrency):
+    """Lanza ``total`` peticiones con ``concurrency`` hilos y mide cada una.
+
+    ``make_request(i)`` devuelve un ``urllib.request.Request``.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            request = make_request(i)
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=120) as response:
+                    response.read()
+                elapsed = time.perf_counter() - t0
+                with lock:
+                    latencies.append(elapsed)
+            except (urllib.error.URLError, OSError) as e:
+                with lock:
+                    errors.append(str(e))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies, time.perf_counter() - started)
+    result['errors'] = len(errors)
+    if errors:
+        result['first_error'] = errors[0]
+    return result
+
+
+def dump(report, path=None):
+    text = json.dumps(report, indent=2, ensure_ascii=False, default=str)
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    return text
@@ -0,0 +1,106 @@
+"""Caché de predicciones por hash de contenido de la imagen.
+
+La clave combina el SHA-256 de los bytes subidos con la versión del modelo,
+así que al reemplazar ``keras_model.h5`` (o ``labels.txt``) las entradas
+anteriores dejan de coincidir. No se vacía al cambiar de versión: en modo
+shadow o canary dos versiones se consultan a la vez, y las entradas que ya no
+se usan salen solas por el LRU.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class PredictionCache:
+    def __init__(self, max_entries=10000, backend=None, timeout=None):
+        self.max_entries = max(1, int(max_entries))
+        self.backend = backend
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(model_version, image_hash):
+        return f"prediction:{model_version}:{image_hash}"
+
+    def get(self, model_version, image_hash):
+        """Entrada cacheada (probabilidades y embedding, ver pipeline) o None"""
+        key = self._key(model_version, image_hash)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        if self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                with self._lock:
+                    self._store(key, value)
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, model_version, image_hash, value):
+        key = self._key(model_version, image_hash)
+        with self._lock:
+            self._store(key, value)
+        if self.backend is not None:
+            self.backend.set(key, value, self.timeout)
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'lru+django' if self.backend is not None else 'lru',
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_prediction_cache():
+    """Caché compartida del proceso; None si ``PREDICTION_CACHE_ENABLED`` es False"""
+    global _cache
+    if not getattr(settings, 'PREDICTION_CACHE_ENABLED', True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend = None
+                alias = getattr(settings, 'PREDICTION_CACHE_ALIAS', None)
+                if alias:
+                    from django.core.cache import caches
+                    backend = caches[alias]
+                _cache = PredictionCache(
+                    max_entries=getattr(settings, 'PREDICTION_CACHE_MAX_ENTRIES', 10000),
+                    backend=backend,
+                    timeout=getattr(settings, 'PREDICTION_CACHE_TIMEOUT', None),
+                )
+    return _cache
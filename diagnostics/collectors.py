@@ -0,0 +1,66 @@
+"""Métricas leídas al momento de la consulta de componentes que ya llevan sus
+propios contadores (modelo, micro-lotes, caché, cola de trabajos e índice de
+embeddings)."""
+from django.db.models import Count
+
+from .cache import get_prediction_cache
+from .embeddings import loaded_indexes
+from .metrics import register_collector
+from .models import PredictionJob
+from .registry import get_registry
+
+
+@register_collector
+def model_metrics():
+    registry = get_registry()
+    status = registry.status()
+    samples = [
+        ('diagnostics_model_loaded', 'gauge', 'Modelo cargado (1) o no (0)', int(status['loaded'])),
+        ('diagnostics_model_ready', 'gauge', 'Modelo cargado y precalentado', int(status['ready'])),
+        ('diagnostics_model_load_seconds', 'gauge', 'Segundos que tardó la carga del modelo', status['load_seconds']),
+        ('diagnostics_model_warmup_seconds', 'gauge', 'Segundos del precalentamiento', status['warmup_seconds']),
+    ]
+    if registry.is_loaded:
+        stats = registry.batcher.stats()
+        samples += [
+            ('diagnostics_batcher_queue_depth', 'gauge', 'Imágenes esperando lote', stats['queue_depth']),
+            ('diagnostics_batcher_batches_total', 'counter', 'Lotes ejecutados', stats['batches']),
+            ('diagnostics_batcher_items_total', 'counter', 'Imágenes inferidas en micro-lotes', stats['items']),
+        ]
+    return samples
+
+
+@register_collector
+def cache_metrics():
+    cache = get_prediction_cache()
+    if cache is None:
+        return []
+    stats = cache.stats()
+    return [
+        ('diagnostics_prediction_cache_entries', 'gauge', 'Entradas en la caché LRU', stats['entries']),
+        ('diagnostics_prediction_cache_hits_total', 'counter', 'Aciertos de caché', stats['hits']),
+        ('diagnostics_prediction_cache_misses_total', 'counter', 'Fallos de caché', stats['misses']),
+        ('diagnostics_prediction_cache_evictions_total', 'counter', 'Entradas expulsadas', stats['evictions']),
+    ]
+
+
+@register_collector
+def job_metrics():
+    counts = PredictionJob.objects.values_list('status').annotate(total=Count('id')).order_by()
+    by_status = dict.fromkeys((value for value, _ in PredictionJob.STATUS_CHOICES), 0)
+    by_status.update(counts)
+    return [(
+        'diagnostics_prediction_jobs', 'gauge', 'Trabajos de predicción por estado',
+        [({'status': status}, total) for status, total in by_status.items()],
+    )]
+
+
+@register_collector
+def embedding_index_metrics():
+    indexes = [index.stats() for index in loaded_indexes()]
+    return [
+        ('diagnostics_embedding_index_rows', 'gauge', 'Filas en el índice de embeddings',
+         [({'version': stats['model_version']}, stats['rows']) for stats in indexes]),
+        ('diagnostics_embedding_index_bytes', 'gauge', 'Memoria de la matriz del índice',
+         [({'version': stats['model_version']}, stats['bytes']) for stats in indexes]),
+    ]
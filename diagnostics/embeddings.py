@@ -0,0 +1,205 @@
+"""Embeddings de las lesiones e índice de vecinos más cercanos.
+
+La inferencia guarda en cada ``DiagnosticHistory`` la activación de la
+penúltima capa del modelo como float16 (``encode``). Cada proceso mantiene,
+por versión del modelo, un índice en memoria con los vectores normalizados en
+una matriz float32 contigua: una búsqueda top-k es un producto matriz-vector
+más ``argpartition``, sin volver a ejecutar el modelo.
+
+El índice se construye en la primera consulta y después solo lee las filas
+nuevas (por ``diagnosis_date``, sobre el índice ``diag_date_idx``) como mucho
+cada ``EMBEDDING_INDEX_REFRESH_SECONDS``. Los borrados del propio proceso se
+marcan al instante; los de otros procesos se descartan al leer los resultados.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .history import HISTORY_FIELDS
+from .models import DiagnosticHistory
+
+# Margen al releer filas nuevas: transacciones que confirman tarde
+REFRESH_OVERLAP = timedelta(seconds=30)
+CHUNK_SIZE = 5000
+
+
+def encode(vector):
+    """Embedding como bytes float16 (lo que se guarda en la base de datos)"""
+    return np.asarray(vector, dtype=np.float16).ravel().tobytes()
+
+
+def decode(data):
+    return np.frombuffer(bytes(data), dtype=np.float16)
+
+
+def _normalized(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingIndex:
+    """Índice en memoria de los embeddings de una versión del modelo"""
+
+    def __init__(self, model_version, refresh_interval=2.0):
+        self.model_version = model_version
+        self.refresh_interval = refresh_interval
+        self.dimension = None
+        self.size = 0
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        # Pacientes como códigos enteros (los id de usuario son UUID)
+        self._user_ids = np.empty(0, dtype=np.int32)
+        self._user_codes = {}
+        self._alive = np.empty(0, dtype=bool)
+        self._ids = []
+        self._positions = {}
+        self._watermark = None
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, extra):
+        needed = self.size + extra
+        capacity = len(self._user_ids)
+        if needed <= capacity:
+            return
+        # Crece al doble: agregar filas cuesta O(1) amortizado
+        capacity = max(needed, 2 * capacity, 1024)
+        vectors = np.empty((capacity, self.dimension), dtype=np.float32)
+        user_ids = np.zeros(capacity, dtype=np.int32)
+        alive = np.zeros(capacity, dtype=bool)
+        if self.size:
+            vectors[:self.size] = self._vectors[:self.size]
+            user_ids[:self.size] = self._user_ids[:self.size]
+            alive[:self.size] = self._alive[:self.size]
+        self._vectors, self._user_ids, self._alive = vectors, user_ids, alive
+
+    def _append(self, rows):
+        rows = [row for row in rows if str(row[0]) not in self._positions]
+        if not rows:
+            return
+        vectors = [decode(embedding) for _, _, embedding in rows]
+        if self.dimension is None:
+            self.dimension = len(vectors[0])
+        keep = [i for i, vector in enumerate(vectors) if len(vector) == self.dimension]
+        if not keep:
+            return
+        self._reserve(len(keep))
+        start = self.size
+        end = start + len(keep)
+        self._vectors[start:end] = _normalized(np.stack([vectors[i] for i in keep]))
+        for position, i in enumerate(keep, start=start):
+            diagnostic_id, user_id, _ = rows[i]
+            self._user_ids[position] = self._user_codes.setdefault(str(user_id), len(self._user_codes))
+            self._alive[position] = True
+            self._positions[str(diagnostic_id)] = position
+            self._ids.append(str(diagnostic_id))
+        self.size = end
+
+    def refresh(self, force=False):
+        """Agrega las filas insertadas desde la última lectura"""
+        now = time.monotonic()
+        if not force and now < self._next_refresh:
+            return
+        with self._lock:
+            if not force and now < self._next_refresh:
+                return
+            queryset = DiagnosticHistory.objects.filter(model_version=self.model_version, embedding__isnull=False)
+            if self._watermark is not None:
+                queryset = queryset.filter(diagnosis_date__gte=self._watermark - REFRESH_OVERLAP)
+            rows = queryset.order_by('diagnosis_date', 'id').values_list(
+                'id', 'user_id', 'embedding', 'diagnosis_date'
+            ).iterator(chunk_size=CHUNK_SIZE)
+            chunk = []
+            for diagnostic_id, user_id, embedding, diagnosis_date in rows:
+                chunk.append((diagnostic_id, user_id, embedding))
+                self._watermark = diagnosis_date
+                if len(chunk) == CHUNK_SIZE:
+                    self._append(chunk)
+                    chunk = []
+            self._append(chunk)
+            self._next_refresh = time.monotonic() + self.refresh_interval
+
+    def discard(self, diagnostic_id):
+        position = self._positions.get(str(diagnostic_id))
+        if position is not None:
+            self._alive[position] = False
+
+    def search(self, vector, k=10, user_id=None, exclude=None):
+        """[(id, similitud coseno)] de los ``k`` vecinos más cercanos.
+
+        ``user_id`` restringe la búsqueda a los diagnósticos de un paciente y
+        ``exclude`` omite un diagnóstico (normalmente el de la consulta).
+        """
+        self.refresh()
+        with self._lock:
+            size, vectors, user_ids, alive, ids = self.size, self._vectors, self._user_ids, self._alive, self._ids
+        if not size or len(vector) != self.dimension:
+            return []
+        query = _normalized(vector)
+        scores = vectors[:size] @ query
+        excluded = ~alive[:size]
+        if user_id is not None:
+            excluded |= user_ids[:size] != self._user_codes.get(str(user_id), -1)
+        if exclude is not None and str(exclude) in self._positions:
+            excluded[self._positions[str(exclude)]] = True
+        scores[excluded] = -np.inf
+        k = min(k, size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[i], float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def stats(self):
+        return {
+            'model_version': self.model_version,
+            'rows': self.size,
+            'dimension': self.dimension,
+            'bytes': self._vectors.nbytes,
+        }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(model_version):
+    """Índice compartido del proceso para ``model_version``"""
+    index = _indexes.get(model_version)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(model_version)
+            if index is None:
+                index = _indexes[model_version] = EmbeddingIndex(
+                    model_version, getattr(settings, 'EMBEDDING_INDEX_REFRESH_SECONDS', 2.0)
+                )
+    return index
+
+
+def loaded_indexes():
+    return list(_indexes.values())
+
+
+@receiver(post_delete, sender=DiagnosticHistory, dispatch_uid='embedding_index_delete')
+def _diagnostic_deleted(sender, instance, **kwargs):
+    index = _indexes.get(instance.model_version)
+    if index is not None:
+        index.discard(instance.pk)
+
+
+def similar_diagnostics(diagnostic, k=10, user_id=None, extra=10):
+    """Diagnósticos más parecidos a ``diagnostic`` con su similitud.
+
+    Pide ``extra`` vecinos de más para cubrir filas borradas por otros
+    procesos, que no aparecen al leerlas de la base de datos.
+    """
+    index = get_index(diagnostic.model_version)
+    matches = index.search(decode(diagnostic.embedding), k + extra, user_id=user_id, exclude=diagnostic.pk)
+    rows = DiagnosticHistory.objects.filter(id__in=[diagnostic_id for diagnostic_id, _ in matches]) \
+        .values(*HISTORY_FIELDS)
+    by_id = {str(row['id']): row for row in rows}
+    return [(by_id[diagnostic_id], score) for diagnostic_id, score in matches if diagnostic_id in by_id][:k]
@@ -0,0 +1,176 @@
+"""Mapas de explicabilidad: dónde mira el modelo para cada diagnóstico.
+
+``occlusion`` tapa la imagen con un parche gris (cero tras normalizar) en una
+grilla y mide cuánto cae la probabilidad de la clase predicha. Todas las
+variantes tapadas (169 con parche 32 y paso 16) se evalúan en uno o dos lotes
+de EXPLAIN_BATCH_SIZE, junto con la imagen original. ``gradcam`` pondera el
+mapa de la última capa convolucional con sus gradientes; solo lo ofrece el
+motor Keras.
+
+El resultado es un PNG RGBA de 224x224 para superponer al recorte de la
+imagen. Se guarda como derivado del blob de la imagen, con el método y la
+versión del modelo en el nombre, así que se calcula una sola vez.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from .metrics import stage
+from .pipeline import preprocess_kwargs
+from .preprocessing import IMAGE_SIZE, preprocess
+from .registry import get_registry
+from .storage import get_blob_store
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('occlusion', 'gradcam')
+# Niveles de opacidad del PNG: menos colores distintos, archivo más pequeño
+LEVELS = 32
+MAX_ALPHA = 0.7
+
+
+def overlay_name(method, model_version):
+    return f"explain_{method}_{model_version}.png"
+
+
+def occluded_batches(image, patch, stride, batch_size):
+    """Genera (lote, posiciones) con la imagen original primero y luego cada
+    parche tapado; las copias se hacen lote a lote para acotar la memoria"""
+    height, width = image.shape[:2]
+    positions = [None] + [
+        (y, x) for y in range(0, height - patch + 1, stride) for x in range(0, width - patch + 1, stride)
+    ]
+    batch = np.empty((min(batch_size, len(positions)),) + image.shape, dtype=np.float32)
+    for start in range(0, len(positions), batch_size):
+        chunk = positions[start:start + batch_size]
+        for i, position in enumerate(chunk):
+            batch[i] = image
+            if position is not None:
+                y, x = position
+                batch[i, y:y + patch, x:x + patch] = 0.0
+        yield batch[:len(chunk)], chunk
+
+
+def occlusion_map(predict, image, class_index=None, patch=32, stride=16, batch_size=128):
+    """Caída de probabilidad de la clase al tapar cada zona; devuelve (mapa, probabilidades)"""
+    heat = np.zeros(image.shape[:2], dtype=np.float32)
+    counts = np.zeros(image.shape[:2], dtype=np.float32)
+    baseline = probs = None
+    for batch, positions in occluded_batches(image, patch, stride, batch_size):
+        output = np.asarray(predict(batch))
+        if baseline is None:
+            probs = output[0]
+            class_index = int(np.argmax(probs)) if class_index is None else class_index
+            baseline = probs[class_index]
+        for row, position in zip(output, positions):
+            if position is not None:
+                y, x = position
+                heat[y:y + patch, x:x + patch] += baseline - row[class_index]
+                counts[y:y + patch, x:x + patch] += 1
+    np.divide(heat, counts, out=heat, where=counts > 0)
+    return np.maximum(heat, 0), probs
+
+
+def render_overlay(heatmap, size=IMAGE_SIZE):
+    """PNG RGBA con el mapa normalizado: colores tipo 'jet' y opacidad creciente"""
+    heatmap = np.asarray(heatmap, dtype=np.float32)
+    peak = float(heatmap.max())
+    if peak > 0:
+        heatmap = heatmap / peak
+    resized = np.asarray(Image.fromarray(heatmap, mode='F').resize(size, Image.Resampling.BILINEAR))
+    values = np.round(np.clip(resized, 0, 1) * (LEVELS - 1)) / (LEVELS - 1)
+    rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+    for channel, offset in enumerate((3, 2, 1)):
+        rgba[..., channel] = np.clip(1.5 - np.abs(4 * values - offset), 0, 1) * 255
+    rgba[..., 3] = values * MAX_ALPHA * 255
+    buffered = io.BytesIO()
+    Image.fromarray(rgba, mode='RGBA').save(buffered, format='PNG', optimize=True)
+    return buffered.getvalue()
+
+
+def compute_overlay(model, image_bytes, method):
+    """PNG del mapa ``method`` de la imagen con la versión ``model``"""
+    _, image = preprocess(io.BytesIO(image_bytes), **preprocess_kwargs())
+    if method == 'gradcam':
+        if not model.model.supports_gradcam:
+            raise ValueError(f"Grad-CAM no está disponible con el motor {model.model.name}")
+        with stage('explain_gradcam'):
+            maps, _ = model.model.gradcam(image[np.newaxis, ...])
+        heatmap = maps[0]
+    else:
+        with stage('explain_occlusion'):
+            heatmap, _ = occlusion_map(
+                model.model.predict, image,
+                patch=getattr(settings, 'EXPLAIN_OCCLUSION_PATCH', 32),
+                stride=getattr(settings, 'EXPLAIN_OCCLUSION_STRIDE', 16),
+                batch_size=getattr(settings, 'EXPLAIN_BATCH_SIZE', 128),
+            )
+    return render_overlay(heatmap)
+
+
+def model_for(diagnostic):
+    """La versión que hizo el diagnóstico si sigue cargada; si no, la activa"""
+    registry = get_registry()
+    return registry.for_version(diagnostic.model_version) or registry.current()
+
+
+# Un cálculo a la vez por mapa aunque lleguen varias peticiones
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def ensure_overlay(diagnostic, method, model):
+    """Calcula (una sola vez) y guarda el mapa; devuelve el nombre del derivado"""
+    store = get_blob_store()
+    name = overlay_name(method, model.version)
+    if store.has_derived(diagnostic.image_key, name):
+        return name
+    key = (diagnostic.image_key, name)
+    with _locks_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            if not store.has_derived(diagnostic.image_key, name):
+                data = compute_overlay(model, store.read(diagnostic.image_key), method)
+                store.save_derived(diagnostic.image_key, name, data)
+    finally:
+        with _locks_lock:
+            _locks.pop(key, None)
+    return name
+
+
+_executor = None
+# Mapas pendientes en segundo plano; si se acumulan, se calculan a pedido
+_slots = None
+
+
+def _explain(diagnostic, methods):
+    try:
+        model = model_for(diagnostic)
+        for method in methods:
+            if method == 'gradcam' and not model.model.supports_gradcam:
+                continue
+            ensure_overlay(diagnostic, method, model)
+    except Exception:
+        logger.exception("Error calculando los mapas del diagnóstico %s", diagnostic.pk)
+    finally:
+        _slots.release()
+
+
+def explain_in_background(diagnostic):
+    """Encola los métodos de EXPLAIN_AFTER_PREDICT para un diagnóstico recién guardado"""
+    global _executor, _slots
+    methods = [m for m in getattr(settings, 'EXPLAIN_AFTER_PREDICT', ()) if m in METHODS]
+    if not methods or not diagnostic.image_key:
+        return
+    with _locks_lock:
+        if _executor is None:
+            _slots = threading.BoundedSemaphore(getattr(settings, 'EXPLAIN_BACKGROUND_MAX_PENDING', 32))
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='diagnostics-explain')
+    if _slots.acquire(blocking=False):
+        _executor.submit(_explain, diagnostic, methods)
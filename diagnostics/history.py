@@ -0,0 +1,151 @@
+"""Consultas del historial: filtros compartidos y paginación por cursor.
+
+El cursor codifica la última fila entregada (``diagnosis_date``, ``id``) y la
+siguiente página se obtiene con una condición de keyset sobre el índice
+compuesto, de modo que el costo no crece con el tamaño de la tabla.
+"""
+import base64
+import uuid
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import DiagnosticHistory
+
+HISTORY_FIELDS = ('id', 'patient_name', 'identification_number', 'diagnosis_date', 'diagnosis', 'risk_level')
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidQuery(ValueError):
+    """Parámetro de consulta inválido (se responde con 400)"""
+
+
+def encode_cursor(diagnosis_date, diagnostic_id):
+    raw = f"{diagnosis_date.isoformat()}|{diagnostic_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_date, raw_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        diagnosis_date = parse_datetime(raw_date)
+        if diagnosis_date is None:
+            raise ValueError
+        return diagnosis_date, uuid.UUID(raw_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidQuery('Cursor inválido')
+
+
+def parse_bound(value, end_of_day=False):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise InvalidQuery(f"Fecha inválida: {value!r}")
+        parsed = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_decimal(value, name):
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise InvalidQuery(f"Valor numérico inválido para {name}: {value!r}")
+
+
+def visible_diagnostics(user):
+    """Médicos ven todos los diagnósticos, pacientes solo los suyos"""
+    if user.role == 'doctor':
+        return DiagnosticHistory.objects.all()
+    return DiagnosticHistory.objects.filter(user=user)
+
+
+def filter_diagnostics(queryset, params, user):
+    """Aplica los filtros de servidor del historial.
+
+    ``patient`` (número de identificación, solo médicos), ``date_from`` /
+    ``date_to`` (fecha o fecha-hora ISO), ``diagnosis`` (prefijo de clase, p. ej.
+    ``Maligno``), ``risk_min`` / ``risk_max`` (porcentaje de confianza).
+    ``user=None`` (comandos de ``manage.py``) no aplica restricciones de rol.
+    """
+    patient = params.get('patient')
+    if patient and (user is None or user.role == 'doctor'):
+        queryset = queryset.filter(identification_number=patient)
+    if params.get('date_from'):
+        queryset = queryset.filter(diagnosis_date__gte=parse_bound(params['date_from']))
+    if params.get('date_to'):
+        queryset = queryset.filter(diagnosis_date__lte=parse_bound(params['date_to'], end_of_day=True))
+    if params.get('diagnosis'):
+        queryset = queryset.filter(diagnosis__istartswith=params['diagnosis'])
+    if params.get('risk_min'):
+        queryset = queryset.filter(risk_level__gte=_parse_decimal(params['risk_min'], 'risk_min'))
+    if params.get('risk_max'):
+        queryset = queryset.filter(risk_level__lte=_parse_decimal(params['risk_max'], 'risk_max'))
+    return queryset
+
+
+def page_size(params):
+    try:
+        limit = int(params.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise InvalidQuery('limit debe ser un entero')
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def serialize_row(row):
+    """Fila del historial (dict de ``.values()``) en el formato del API"""
+    return {
+        'id': str(row['id']),
+        'patient_name': row['patient_name'],
+        'identification_number': row['identification_number'],
+        'date': row['diagnosis_date'].strftime('%d/%m/%Y, %H:%M:%S'),
+        'diagnosis': row['diagnosis'],
+        'risk_level': float(row['risk_level']),
+    }
+
+
+def serialize_detail(diagnostic):
+    """Detalle de un diagnóstico (instancia) en el formato del API"""
+    image_url = reverse('diagnostic_image', args=[diagnostic.id]) if diagnostic.image_key else None
+    return {
+        'id': str(diagnostic.id),
+        'patient_name': diagnostic.patient_name,
+        'identification_number': diagnostic.identification_number,
+        'date': diagnostic.diagnosis_date.strftime('%d/%m/%Y, %H:%M:%S'),
+        'diagnosis': diagnostic.diagnosis,
+        'risk_level': float(diagnostic.risk_level),
+        'probabilities': diagnostic.probabilities,
+        'model_version': diagnostic.model_version,
+        'image_url': image_url,
+        # Versiones reducidas ya generadas (diagnostics.renditions)
+        'renditions': {
+            name: {**info, 'url': f"{image_url}?rendition={name}"}
+            for name, info in (diagnostic.renditions or {}).items()
+        } if image_url else {},
+    }
+
+
+def paginate(queryset, params, fields=HISTORY_FIELDS):
+    """Devuelve (filas, siguiente cursor) ordenando por fecha e id descendentes"""
+    limit = page_size(params)
+    queryset = queryset.order_by('-diagnosis_date', '-id')
+    cursor = params.get('cursor')
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(diagnosis_date__lt=last_date) | Q(diagnosis_date=last_date, id__lt=last_id)
+        )
+    rows = list(queryset.values(*fields)[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['diagnosis_date'], rows[-1]['id'])
+    return rows, next_cursor
@@ -0,0 +1,218 @@
+"""Servicio local de inferencia multiproceso sobre un socket Unix.
+
+El proceso principal abre el socket y lanza N procesos (modelo pre-fork, como
+gunicorn) que comparten el mismo socket de escucha. Cada proceso se fija a un
+subconjunto de núcleos, ajusta los hilos intra/inter-op del motor y carga el
+modelo una sola vez; con TFLite el archivo se mapea en memoria, así que los
+pesos se comparten entre procesos a través de la caché de páginas. Los workers
+web solo envían tensores ya normalizados, sin cargar TensorFlow.
+
+Protocolo (mensajes de ``multiprocessing.connection``, sin pickle):
+petición ``!IIII`` (N, alto, ancho, canales) + float32; respuesta ``b'\\x00'`` +
+``!II`` (N, clases) + float32, o ``b'\\x01'`` + mensaje de error en UTF-8.
+"""
+import multiprocessing
+import os
+import signal
+import struct
+import threading
+from collections import deque
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from .backends import get_backend
+
+REQUEST_HEADER = struct.Struct('!IIII')
+RESPONSE_HEADER = struct.Struct('!II')
+STATUS_OK = b'\x00'
+STATUS_ERROR = b'\x01'
+
+
+class InferenceServiceError(RuntimeError):
+    pass
+
+
+def encode_request(batch):
+    return REQUEST_HEADER.pack(*batch.shape) + np.ascontiguousarray(batch, dtype=np.float32).tobytes()
+
+
+def decode_request(message):
+    shape = REQUEST_HEADER.unpack_from(message)
+    return np.frombuffer(message, dtype=np.float32, offset=REQUEST_HEADER.size).reshape(shape)
+
+
+def encode_response(output):
+    output = np.ascontiguousarray(output, dtype=np.float32)
+    return STATUS_OK + RESPONSE_HEADER.pack(*output.shape) + output.tobytes()
+
+
+def decode_response(message):
+    if message[:1] == STATUS_ERROR:
+        raise InferenceServiceError(message[1:].decode('utf-8', 'replace'))
+    shape = RESPONSE_HEADER.unpack_from(message, 1)
+    return np.frombuffer(message, dtype=np.float32, offset=1 + RESPONSE_HEADER.size).reshape(shape)
+
+
+def core_sets(processes, cores=None):
+    """Reparte los núcleos disponibles en ``processes`` grupos contiguos"""
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    processes = max(1, processes)
+    if processes >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(processes)]
+    per_process, extra = divmod(len(cores), processes)
+    groups, start = [], 0
+    for i in range(processes):
+        end = start + per_process + (1 if i < extra else 0)
+        groups.append(cores[start:end])
+        start = end
+    return groups
+
+
+def _handle_connection(conn, backend):
+    with conn:
+        while True:
+            try:
+                message = conn.recv_bytes()
+            except (EOFError, OSError):
+                return
+            try:
+                reply = encode_response(backend.predict(decode_request(message)))
+            except Exception as e:
+                reply = STATUS_ERROR + str(e).encode('utf-8')
+            conn.send_bytes(reply)
+
+
+def worker_main(listener, backend_name, model_path, cores, intra_op_threads, inter_op_threads):
+    """Proceso de inferencia: fija núcleos, carga el modelo y atiende conexiones"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    threads = intra_op_threads or len(cores) or 1
+    # Antes de importar el motor: limita los pools de OpenMP / TensorFlow
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(inter_op_threads or 1)
+
+    backend = get_backend(
+        backend_name, model_path, num_threads=threads, inter_op_threads=inter_op_threads or 1
+    ).load()
+
+    # Cada conexión (un worker web) se atiende en su hilo; el cómputo pesado
+    # ocurre fuera del GIL dentro del motor
+    while True:
+        try:
+            conn = listener.accept()
+        except OSError:
+            return
+        threading.Thread(target=_handle_connection, args=(conn, backend), daemon=True).start()
+
+
+class InferenceService:
+    def __init__(self, address, backend_name, model_path, processes=None,
+                 intra_op_threads=None, inter_op_threads=1):
+        self.address = address
+        self.backend_name = backend_name
+        self.model_path = model_path
+        self.processes = processes or max(1, (os.cpu_count() or 1) // 2)
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.workers = []
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        listener = Listener(self.address, family='AF_UNIX')
+        os.chmod(self.address, 0o660)
+        context = multiprocessing.get_context('fork')
+        try:
+            for cores in core_sets(self.processes):
+                process = context.Process(
+                    target=worker_main,
+                    args=(listener, self.backend_name, self.model_path, cores,
+                          self.intra_op_threads, self.inter_op_threads),
+                    daemon=True,
+                )
+                process.start()
+                self.workers.append((process, cores))
+            for process, _ in self.workers:
+                process.join()
+        finally:
+            for process, _ in self.workers:
+                if process.is_alive():
+                    process.terminate()
+            listener.close()
+
+
+class InferenceServiceClient:
+    """Cliente del servicio con un pequeño pool de conexiones.
+
+    Cada conexión la acepta uno de los procesos del servicio (el kernel las
+    reparte entre los que esperan en ``accept``). El pool abre hasta
+    ``connections`` conexiones y las usa por turnos (FIFO), así que incluso un
+    único hilo, como el del micro-lote, reparte sus lotes entre procesos en
+    lugar de atarse siempre al mismo. Si varios hilos piden a la vez y no hay
+    conexiones libres se abre una más, que se cierra al devolverla si el pool
+    ya está completo.
+    """
+
+    def __init__(self, address, connections=None):
+        self.address = address
+        self.connections = max(1, connections or (os.cpu_count() or 2) // 2)
+        self._idle = deque()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            # Mientras el pool no está completo se abre otra conexión en lugar
+            # de reutilizar, para que todas entren en la rotación
+            if self._idle and self._opened >= self.connections:
+                return self._idle.popleft()
+            self._opened += 1
+        try:
+            return Client(self.address, family='AF_UNIX')
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.connections:
+                self._idle.append(conn)
+                return
+            self._opened -= 1
+        conn.close()
+
+    def _discard(self, conn):
+        with self._lock:
+            self._opened -= 1
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+            self._opened -= len(idle)
+        for conn in idle:
+            conn.close()
+
+    def predict(self, batch):
+        message = encode_request(batch)
+        for attempt in range(2):
+            conn = self._acquire()
+            try:
+                conn.send_bytes(message)
+                reply = conn.recv_bytes()
+            except (EOFError, OSError):
+                # El proceso que atendía la conexión se reinició: reconectar una vez
+                self._discard(conn)
+                if attempt:
+                    raise
+                continue
+            self._release(conn)
+            return decode_response(reply)
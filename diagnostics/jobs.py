@@ -0,0 +1,178 @@
+"""Cola de predicciones asíncronas sobre la tabla ``PredictionJob``.
+
+El endpoint solo guarda la imagen en el almacén por contenido y encola un
+trabajo; los workers de ``manage.py run_prediction_workers`` reclaman lotes en
+orden de prioridad (los clínicos antes que los lotes masivos), los procesan en
+una sola pasada del modelo y crean los ``DiagnosticHistory``. No requiere
+ningún servicio externo: la base de datos hace de cola.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .explain import explain_in_background
+from .models import DiagnosticHistory, PredictionJob
+from .pipeline import describe_prediction, get_confidence_display, get_simplified_class_name, predict_many
+from .renditions import renditions_in_background
+from .stats import record_diagnostics
+from .storage import get_blob_store
+
+PRIORITIES = {
+    'clinician': PredictionJob.PRIORITY_CLINICIAN,
+    'bulk': PredictionJob.PRIORITY_BULK,
+}
+
+
+def parse_priority(value, default):
+    if value in (None, ''):
+        return default
+    try:
+        return PRIORITIES[value]
+    except KeyError:
+        raise ValueError(f"Prioridad desconocida: {value!r} (opciones: {', '.join(PRIORITIES)})")
+
+
+def enqueue(user, items, priority=PredictionJob.PRIORITY_CLINICIAN):
+    """Guarda las imágenes [(nombre, bytes)] y crea sus trabajos en cola"""
+    store = get_blob_store()
+    jobs = [
+        PredictionJob(user=user, priority=priority, filename=filename[:255], image_key=store.save(data))
+        for filename, data in items
+    ]
+    PredictionJob.objects.bulk_create(jobs)
+    return jobs
+
+
+def claim_jobs(limit):
+    """Reclama hasta ``limit`` trabajos en cola, los de mayor prioridad primero"""
+    queued = PredictionJob.objects.filter(status=PredictionJob.STATUS_QUEUED).order_by('priority', 'created_at')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            queued = queued.select_for_update(skip_locked=True)
+        candidates = list(queued.values_list('id', flat=True)[:limit])
+        now = timezone.now()
+        # Actualización condicional: en backends sin SKIP LOCKED otro worker
+        # puede haber tomado el trabajo entre la lectura y la escritura
+        claimed = [
+            job_id for job_id in candidates
+            if PredictionJob.objects.filter(id=job_id, status=PredictionJob.STATUS_QUEUED)
+            .update(status=PredictionJob.STATUS_RUNNING, started_at=now)
+        ]
+    return list(PredictionJob.objects.select_related('user').filter(id__in=claimed))
+
+
+def process_jobs(registry, jobs):
+    """Ejecuta un lote de trabajos reclamados y registra sus resultados"""
+    store = get_blob_store()
+    images = []
+    runnable = []
+    for job in jobs:
+        try:
+            images.append(store.read(job.image_key))
+            runnable.append(job)
+        except Exception as e:
+            job.status = PredictionJob.STATUS_FAILED
+            job.error = f"Imagen no disponible: {e}"
+
+    model = registry.current()
+    outcomes, embeddings = predict_many(model, images, [job.image_key for job in runnable]) if runnable else ([], [])
+
+    class_names = model.class_names
+    diagnostics = []
+    for job, outcome, embedding in zip(runnable, outcomes, embeddings):
+        if isinstance(outcome, Exception):
+            job.status = PredictionJob.STATUS_FAILED
+            job.error = str(outcome)
+            continue
+        prediction = describe_prediction(outcome, class_names)
+        job.diagnostic = DiagnosticHistory(
+            user=job.user,
+            patient_name=job.user.full_name,
+            identification_number=job.user.identification_number,
+            diagnosis=prediction['predicted_class'],
+            risk_level=prediction['risk_level'],
+            probabilities=outcome,
+            image_key=job.image_key,
+            model_version=model.version,
+            embedding=embedding,
+        )
+        job.status = PredictionJob.STATUS_DONE
+        diagnostics.append(job.diagnostic)
+
+    now = timezone.now()
+    for job in jobs:
+        job.finished_at = now
+    with transaction.atomic():
+        DiagnosticHistory.objects.bulk_create(diagnostics)
+        record_diagnostics(diagnostics)
+        PredictionJob.objects.bulk_update(jobs, ['status', 'error', 'diagnostic', 'finished_at'])
+    renditions_in_background(diagnostics)
+    for diagnostic in diagnostics:
+        explain_in_background(diagnostic)
+    return jobs
+
+
+def requeue_stale(max_age_seconds):
+    """Devuelve a la cola los trabajos 'running' de un worker que murió"""
+    cutoff = timezone.now() - timedelta(seconds=max_age_seconds)
+    return PredictionJob.objects.filter(
+        status=PredictionJob.STATUS_RUNNING, started_at__lt=cutoff
+    ).update(status=PredictionJob.STATUS_QUEUED, started_at=None)
+
+
+def run_worker(registry, stop_event, batch_size=16, poll_interval=0.5):
+    """Bucle de un worker: reclama, procesa y espera cuando la cola está vacía"""
+    while not stop_event.is_set():
+        close_old_connections()
+        jobs = claim_jobs(batch_size)
+        if not jobs:
+            stop_event.wait(poll_interval)
+            continue
+        try:
+            process_jobs(registry, jobs)
+        except Exception as e:
+            PredictionJob.objects.filter(id__in=[job.id for job in jobs]).update(
+                status=PredictionJob.STATUS_FAILED, error=str(e), finished_at=timezone.now()
+            )
+    close_old_connections()
+
+
+def stored_prediction(diagnostic):
+    """Resultado guardado de un diagnóstico, en el formato de ``describe_prediction``.
+
+    Sale de la fila y no de las etiquetas del modelo activo, que pueden ser
+    otras (u otro orden) si desde entonces se recargó o promovió una versión.
+    """
+    confidence = float(diagnostic.risk_level)
+    confidence_level, confidence_range = get_confidence_display(confidence)
+    return {
+        'id': str(diagnostic.id),
+        'probabilities': diagnostic.probabilities,
+        'predicted_index': int(np.argmax(diagnostic.probabilities)),
+        'predicted_class': diagnostic.diagnosis,
+        'simplified_class': get_simplified_class_name(diagnostic.diagnosis),
+        'confidence': round(confidence, 2),
+        'confidence_level': confidence_level,
+        'confidence_range': confidence_range,
+        'model_version': diagnostic.model_version,
+    }
+
+
+def job_payload(job):
+    """Representación del trabajo para el endpoint de estado"""
+    data = {
+        'id': str(job.id),
+        'status': job.status,
+        'priority': job.get_priority_display(),
+        'filename': job.filename,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == PredictionJob.STATUS_DONE and job.diagnostic is not None:
+        data['result'] = stored_prediction(job.diagnostic)
+    elif job.status == PredictionJob.STATUS_FAILED:
+        data['error'] = job.error
+    return data
@@ -0,0 +1,228 @@
+import base64
+import io
+import os
+import platform
+import subprocess
+import urllib.request
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from diagnostics.benchmark import dump, multipart_body, peak_rss_mb, run_load, synthetic_corpus, time_stage
+from diagnostics.models import DiagnosticHistory
+from diagnostics.preprocessing import INPUT_SHAPE, augment_batch, get_resample, normalize_into, preprocess
+from diagnostics.registry import get_registry
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmarks por etapa y prueba de carga de extremo a extremo del pipeline de predicción'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', default=os.path.join(settings.BASE_DIR, 'B.jpg'),
+                            help='Imagen base del corpus sintético')
+        parser.add_argument('--corpus-size', type=int, default=64)
+        parser.add_argument('--iterations', type=int, default=200, help='Llamadas por etapa')
+        parser.add_argument('--batch-size', type=int, default=16, help='Tamaño de lote para model.predict')
+        parser.add_argument('--stages', nargs='+',
+                            default=['decode', 'fit', 'normalize', 'predict', 'base64', 'insert'],
+                            choices=['decode', 'fit', 'normalize', 'predict', 'tta', 'base64', 'insert'])
+        parser.add_argument('--tta-views', type=int, default=getattr(settings, 'TTA_VIEWS', 8),
+                            help='Vistas por imagen de la etapa tta')
+        parser.add_argument('--e2e', action='store_true',
+                            help='Prueba de carga HTTP contra un servidor de pruebas con base de datos temporal')
+        parser.add_argument('--requests', type=int, default=200, help='Peticiones de la prueba de carga')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--json', dest='json_path', help='Guardar el informe JSON en este archivo')
+
+    def handle(self, *args, **options):
+        corpus = synthetic_corpus(options['image'], options['corpus_size'])
+        report = {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'backend': getattr(settings, 'INFERENCE_BACKEND', 'keras'),
+            'corpus_size': len(corpus),
+            'stages': self.run_stages(corpus, options),
+        }
+        if options['e2e']:
+            report['e2e'] = self.run_e2e(corpus, options)
+        report['peak_rss_mb'] = peak_rss_mb()
+
+        text = dump(report, options['json_path'])
+        self.stdout.write(text)
+
+    def run_stages(self, corpus, options):
+        iterations = options['iterations']
+        stages = options['stages']
+        resample = get_resample(getattr(settings, 'PREPROCESS_RESAMPLE', 'lanczos'))
+        results = {}
+
+        def decode(data):
+            image = Image.open(io.BytesIO(data))
+            image.draft('RGB', INPUT_SHAPE[:2])
+            return image.convert('RGB')
+
+        decoded = [decode(data) for data in corpus]
+        fitted = [ImageOps.fit(image, INPUT_SHAPE[:2], resample) for image in decoded]
+
+        if 'decode' in stages:
+            results['decode'] = time_stage(decode, corpus, iterations)
+            results['decode_full'] = time_stage(lambda data: Image.open(io.BytesIO(data)).convert('RGB'),
+                                                corpus, iterations)
+        if 'fit' in stages:
+            results['fit'] = time_stage(lambda image: ImageOps.fit(image, INPUT_SHAPE[:2], resample),
+                                        decoded, iterations)
+        if 'normalize' in stages:
+            out = np.empty(INPUT_SHAPE, dtype=np.float32)
+            results['normalize'] = time_stage(lambda image: normalize_into(image, out), fitted, iterations)
+        if 'predict' in stages:
+            registry = get_registry()
+            if not registry.warm_up():
+                raise CommandError(f"No se pudo cargar el modelo: {registry.error}")
+            single = np.zeros((1,) + INPUT_SHAPE, dtype=np.float32)
+            batch = np.zeros((options['batch_size'],) + INPUT_SHAPE, dtype=np.float32)
+            results['predict_batch_1'] = time_stage(registry.model.predict, [single], iterations)
+            results[f"predict_batch_{options['batch_size']}"] = time_stage(
+                registry.model.predict, [batch], max(1, iterations // options['batch_size'])
+            )
+        if 'tta' in stages:
+            results.update(self.time_tta(corpus, options['tta_views'], iterations))
+        if 'base64' in stages:
+            results['base64'] = time_stage(lambda data: base64.b64encode(data).decode(), corpus, iterations)
+        if 'insert' in stages:
+            results['insert'] = self.time_insert(iterations)
+        return results
+
+    def time_tta(self, corpus, views, iterations):
+        """TTA: K vistas en una pasada frente a K pasadas y frente a una sola vista"""
+        registry = get_registry()
+        if not registry.warm_up():
+            raise CommandError(f"No se pudo cargar el modelo: {registry.error}")
+        options = {
+            'resample': getattr(settings, 'PREPROCESS_RESAMPLE', 'lanczos'),
+            'draft': getattr(settings, 'PREPROCESS_JPEG_DRAFT', True),
+        }
+        model = registry.model
+        single = np.zeros((1,) + INPUT_SHAPE, dtype=np.float32)
+        batch = np.zeros((views,) + INPUT_SHAPE, dtype=np.float32)
+
+        def sequential(_):
+            for _ in range(views):
+                model.predict(single)
+
+        def end_to_end(data):
+            model.predict(augment_batch(io.BytesIO(data), views, **options))
+
+        def baseline(data):
+            model.predict(preprocess(io.BytesIO(data), **options)[1][np.newaxis, ...])
+
+        results = {
+            'tta_preprocess': time_stage(lambda data: augment_batch(io.BytesIO(data), views, **options),
+                                         corpus, iterations),
+            f'tta_predict_batched_{views}': time_stage(model.predict, [batch], iterations),
+            f'tta_predict_sequential_{views}': time_stage(sequential, [None], max(1, iterations // views)),
+            'tta_end_to_end': time_stage(end_to_end, corpus, iterations),
+            'single_view_end_to_end': time_stage(baseline, corpus, iterations),
+        }
+        # Costo de la TTA en latencia, en múltiplos de la predicción sin aumentación
+        results['tta_latency_ratio'] = round(
+            results['tta_end_to_end']['p50_ms'] / results['single_view_end_to_end']['p50_ms'], 2
+        ) if results['single_view_end_to_end']['p50_ms'] else None
+        return results
+
+    def time_insert(self, iterations):
+        """Inserciones de DiagnosticHistory dentro de una transacción que se revierte"""
+        from users.models import User
+
+        result = {}
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    email='benchmark@example.invalid', password='Benchmark123',
+                    identification_number='benchmark', first_name='Bench', last_name='Mark',
+                    gender='Otro', phone='0', date_of_birth=date(2000, 1, 1),
+                )
+                probs = [0.1, 0.8, 0.1]
+                result.update(time_stage(lambda _: DiagnosticHistory.objects.create(
+                    user=user, patient_name=user.full_name,
+                    identification_number=user.identification_number,
+                    diagnosis='Benigno (no peligroso)', risk_level=80.0,
+                    probabilities=probs, image_key='0' * 64,
+                ), [None], iterations))
+                raise Rollback
+        except Rollback:
+            pass
+        return result
+
+    def run_e2e(self, corpus, options):
+        """Servidor de pruebas en un hilo + base de datos temporal + carga HTTP"""
+        from django.test.testcases import LiveServerThread
+        from django.test.utils import setup_databases, setup_test_environment, teardown_databases, \
+            teardown_test_environment
+        from users.models import User
+        from users.tokens import token_pair
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        server = None
+        try:
+            # Las bases SQLite en memoria deben compartirse con el hilo del servidor
+            overrides = {}
+            for conn in connections.all():
+                if conn.vendor == 'sqlite' and conn.is_in_memory_db():
+                    conn.inc_thread_sharing()
+                    overrides[conn.alias] = conn
+
+            server = LiveServerThread('localhost', lambda handler: handler, overrides, port=0)
+            server.daemon = True
+            server.start()
+            server.is_ready.wait()
+            if server.error:
+                raise server.error
+            base_url = f'http://localhost:{server.port}'
+
+            user = User.objects.create_user(
+                email='benchmark@example.invalid', password='Benchmark123',
+                identification_number='benchmark', first_name='Bench', last_name='Mark',
+                gender='Otro', phone='0', date_of_birth=date(2000, 1, 1), role='doctor',
+            )
+            token = token_pair(user)['access_token']
+            headers = {'Authorization': f'Bearer {token}'}
+
+            def predict_request(i):
+                body, content_type = multipart_body('image', f'synthetic_{i}.jpg', corpus[i % len(corpus)])
+                return urllib.request.Request(
+                    f'{base_url}/api/predict/', data=body, method='POST',
+                    headers={**headers, 'Content-Type': content_type},
+                )
+
+            def history_request(i):
+                return urllib.request.Request(f'{base_url}/api/diagnostics/?limit=50', headers=headers)
+
+            return {
+                'predict': run_load(predict_request, options['requests'], options['concurrency']),
+                'history': run_load(history_request, options['requests'], options['concurrency']),
+            }
+        finally:
+            if server is not None:
+                server.terminate()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
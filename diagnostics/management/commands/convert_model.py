@@ -0,0 +1,80 @@
+import glob
+import os
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from diagnostics.backends import KerasBackend, default_artifact_path, get_backend
+from diagnostics.preprocessing import preprocess_batch
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def load_image_set(paths):
+    """Carga un conjunto fijo de imágenes con el mismo preprocesamiento del API"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                f for f in glob.glob(os.path.join(path, '*'))
+                if f.lower().endswith(IMAGE_EXTENSIONS)
+            ))
+        else:
+            files.append(path)
+    if not files:
+        raise CommandError('No se encontraron imágenes para verificar')
+
+    return files, preprocess_batch(files)
+
+
+class Command(BaseCommand):
+    help = 'Convierte keras_model.h5 a TFLite / ONNX y verifica que las salidas coincidan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=settings.MODEL_PATH, help='Modelo Keras de origen (.h5)')
+        parser.add_argument('--formats', nargs='+', default=['tflite', 'onnx'], choices=['tflite', 'onnx'])
+        parser.add_argument('--verify-images', nargs='+', default=[os.path.join(settings.BASE_DIR, 'B.jpg')],
+                            help='Imágenes o carpetas usadas para comparar las salidas')
+        parser.add_argument('--atol', type=float, default=1e-4,
+                            help='Diferencia absoluta máxima permitida entre probabilidades')
+        parser.add_argument('--skip-verify', action='store_true')
+
+    def handle(self, *args, **options):
+        import tensorflow as tf
+
+        source = options['source']
+        model = tf.keras.models.load_model(source, compile=False)
+
+        artifacts = {}
+        for fmt in options['formats']:
+            output_path = default_artifact_path(source, fmt)
+            if fmt == 'tflite':
+                converter = tf.lite.TFLiteConverter.from_keras_model(model)
+                with open(output_path, 'wb') as f:
+                    f.write(converter.convert())
+            elif fmt == 'onnx':
+                try:
+                    import tf2onnx
+                except ImportError:
+                    raise CommandError('La conversión a ONNX requiere tf2onnx (pip install tf2onnx)')
+                signature = [tf.TensorSpec((None, 224, 224, 3), tf.float32, name='input')]
+                tf2onnx.convert.from_keras(model, input_signature=signature, output_path=output_path)
+            artifacts[fmt] = output_path
+            self.stdout.write(f"✅ {fmt}: {output_path} ({os.path.getsize(output_path) / 1e6:.1f} MB)")
+
+        if options['skip_verify']:
+            return
+
+        files, batch = load_image_set(options['verify_images'])
+        reference = KerasBackend(source).load().predict(batch)
+        for fmt, path in artifacts.items():
+            output = get_backend(fmt, path).load().predict(batch)
+            max_diff = float(np.max(np.abs(output - reference)))
+            agreement = float(np.mean(np.argmax(output, axis=1) == np.argmax(reference, axis=1)))
+            self.stdout.write(
+                f"🔍 {fmt}: {len(files)} imágenes, diferencia máxima {max_diff:.2e}, "
+                f"concordancia argmax {agreement:.0%}"
+            )
+            if max_diff > options['atol'] or agreement < 1.0:
+                raise CommandError(f"Las salidas de {fmt} no coinciden con Keras (atol={options['atol']})")
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from diagnostics.export import CHUNK_SIZE, FORMATS, IMAGE_MODES, export_stream
+from diagnostics.history import InvalidQuery, filter_diagnostics
+from diagnostics.models import DiagnosticHistory
+
+
+class Command(BaseCommand):
+    help = ('Exporta el historial de diagnósticos (con probabilidades) en CSV, NDJSON o Parquet '
+            'leyendo la base de datos por bloques, con memoria constante')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', required=True, help='Archivo de salida ("-" = salida estándar)')
+        parser.add_argument('--format', choices=list(FORMATS),
+                            help='Formato (por defecto, según la extensión de --output; csv para "-")')
+        parser.add_argument('--images', choices=IMAGE_MODES, default='none')
+        parser.add_argument('--patient', help='Número de identificación del paciente')
+        parser.add_argument('--date-from')
+        parser.add_argument('--date-to')
+        parser.add_argument('--diagnosis', help='Prefijo de la clase, p. ej. Maligno')
+        parser.add_argument('--risk-min')
+        parser.add_argument('--risk-max')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Filas leídas de la base de datos por bloque')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        output_format = options['format'] or next(
+            (name for name, (_, extension) in FORMATS.items() if output.endswith(f'.{extension}')), 'csv'
+        )
+        params = {
+            name: options[name] for name in ('patient', 'date_from', 'date_to', 'diagnosis', 'risk_min', 'risk_max')
+            if options[name]
+        }
+        try:
+            queryset = filter_diagnostics(DiagnosticHistory.objects.all(), params, None)
+            stream = export_stream(queryset, output_format, options['images'], max(1, options['chunk_size']))
+        except (InvalidQuery, ImportError) as e:
+            raise CommandError(str(e))
+
+        started = time.perf_counter()
+        written = 0
+        # Se escribe a un temporal y se renombra: nunca queda un archivo a medias
+        target = sys.stdout.buffer if output == '-' else open(f"{output}.tmp", 'wb')
+        try:
+            for chunk in stream:
+                target.write(chunk)
+                written += len(chunk)
+        except BaseException:
+            if output != '-':
+                target.close()
+                os.remove(f"{output}.tmp")
+            raise
+        if output == '-':
+            target.flush()
+            return
+        target.close()
+        os.replace(f"{output}.tmp", output)
+        self.stdout.write(
+            f"✅ Historial exportado ({output_format}) en {time.perf_counter() - started:.1f} s "
+            f"({written / 1e6:.1f} MB) → {os.path.abspath(output)}"
+        )
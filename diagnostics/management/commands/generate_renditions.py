@@ -0,0 +1,63 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from diagnostics.models import DiagnosticHistory
+from diagnostics.renditions import generate_renditions, rendition_specs
+
+
+class Command(BaseCommand):
+    help = ('Genera las versiones reducidas (DIAGNOSTICS_RENDITIONS) de las imágenes que aún no las '
+            'tienen y las anota en el historial')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Revisa también las filas que ya tienen versiones (p. ej. tras agregar una)')
+        parser.add_argument('--workers', type=int, default=4, help='Hilos de codificación')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Claves leídas por bloque')
+
+    def handle(self, *args, **options):
+        specs = rendition_specs()
+        if not specs:
+            raise CommandError('DIAGNOSTICS_RENDITIONS está vacío o ningún formato es compatible con Pillow')
+
+        queryset = DiagnosticHistory.objects.filter(image_key__isnull=False).exclude(image_key='')
+        if not options['all']:
+            queryset = queryset.filter(renditions={})
+        # Una vez por imagen aunque varias filas la compartan
+        keys = queryset.order_by().values_list('image_key', flat=True).distinct() \
+            .iterator(chunk_size=options['chunk_size'])
+
+        done = failed = 0
+        started = last_report = time.perf_counter()
+        workers = max(1, options['workers'])
+        pending = deque()
+
+        def collect(key, future):
+            nonlocal done, failed
+            try:
+                future.result()
+                done += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"❌ {key}: {e}")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for key in keys:
+                pending.append((key, executor.submit(generate_renditions, key)))
+                # Pocas imágenes en vuelo: la memoria no crece con el historial
+                if len(pending) >= 4 * workers:
+                    collect(*pending.popleft())
+                now = time.perf_counter()
+                if now - last_report >= 10:
+                    last_report = now
+                    self.stdout.write(f"   {done} imágenes ({done / (now - started):.1f}/s)")
+            while pending:
+                collect(*pending.popleft())
+
+        self.stdout.write(
+            f"✅ Versiones {', '.join(specs)} generadas para {done} imágenes en "
+            f"{time.perf_counter() - started:.1f} s ({failed} con error)"
+        )
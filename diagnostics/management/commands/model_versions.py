@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from diagnostics.model_store import (
+    CANDIDATE_MODES, ModelStoreError, add_version, list_versions, read_state, state_path, version_dir,
+    write_state,
+)
+
+
+class Command(BaseCommand):
+    help = ('Administra las versiones del modelo: agregar, activar y probar candidatas '
+            '(los servidores recargan en caliente en unos segundos)')
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+
+        subcommands.add_parser('list', help='Lista las versiones y el estado actual')
+
+        add = subcommands.add_parser('add', help='Agrega un export de Teachable Machine como nueva versión')
+        add.add_argument('version')
+        add.add_argument('--model', required=True, help='keras_model.h5')
+        add.add_argument('--labels', required=True, help='labels.txt')
+
+        activate = subcommands.add_parser('activate', help='Activa una versión (o vuelve a MODEL_PATH con --legacy)')
+        activate.add_argument('version', nargs='?')
+        activate.add_argument('--legacy', action='store_true')
+
+        candidate = subcommands.add_parser('candidate', help='Prueba una versión en modo shadow o canary')
+        candidate.add_argument('version', nargs='?')
+        candidate.add_argument('--mode', choices=CANDIDATE_MODES, default='shadow')
+        candidate.add_argument('--fraction', type=float, default=0.1, help='Fracción del tráfico (0-1)')
+        candidate.add_argument('--clear', action='store_true', help='Quita la candidata')
+
+        subcommands.add_parser('promote', help='Activa la versión candidata')
+
+    def handle(self, *args, **options):
+        try:
+            getattr(self, f"handle_{options['action']}")(options)
+        except (ModelStoreError, OSError) as e:
+            raise CommandError(str(e))
+
+    def _require(self, version):
+        if version not in list_versions():
+            raise CommandError(f"La versión {version!r} no existe (ver `manage.py model_versions list`)")
+
+    @staticmethod
+    def _uses_service():
+        return getattr(settings, 'INFERENCE_BACKEND', 'keras') == 'service'
+
+    def _remind_service_restart(self):
+        if self._uses_service():
+            self.stdout.write('   Reinicie manage.py run_inference_service para que sirva esta versión')
+
+    def handle_list(self, options):
+        state = read_state()
+        candidate = state['candidate'] or {}
+        for version in list_versions():
+            marks = []
+            if version == state['active']:
+                marks.append('activa')
+            if version == candidate.get('version'):
+                marks.append(f"candidata {candidate.get('mode')} {float(candidate.get('fraction', 0)):.0%}")
+            self.stdout.write(f"{version}{' (' + ', '.join(marks) + ')' if marks else ''}")
+        if not state['active']:
+            self.stdout.write('Sin versión activa: se sirve MODEL_PATH / LABELS_PATH')
+
+    def handle_add(self, options):
+        path = add_version(options['version'], options['model'], options['labels'])
+        self.stdout.write(f"✅ Versión {options['version']} en {path}")
+        self.stdout.write(f"   Para servirla con TFLite/ONNX: manage.py convert_model --source {version_dir(options['version'])}/keras_model.h5")
+
+    def handle_activate(self, options):
+        state = read_state()
+        if options['legacy']:
+            state['active'] = None
+        else:
+            if not options['version']:
+                raise CommandError('Indique la versión o --legacy')
+            self._require(options['version'])
+            state['active'] = options['version']
+        if state['candidate'] and state['candidate'].get('version') == state['active']:
+            state['candidate'] = None
+        write_state(state)
+        self.stdout.write(f"🔄 Versión activa: {state['active'] or 'MODEL_PATH'} ({state_path()})")
+        self._remind_service_restart()
+
+    def handle_candidate(self, options):
+        state = read_state()
+        if options['clear']:
+            state['candidate'] = None
+        else:
+            if not options['version']:
+                raise CommandError('Indique la versión o --clear')
+            if self._uses_service():
+                raise CommandError('Con INFERENCE_BACKEND=service no hay candidatas: el servicio de inferencia '
+                                   'sirve solo la versión activa')
+            self._require(options['version'])
+            if not 0 <= options['fraction'] <= 1:
+                raise CommandError('--fraction debe estar entre 0 y 1')
+            state['candidate'] = {
+                'version': options['version'],
+                'mode': options['mode'],
+                'fraction': options['fraction'],
+            }
+        write_state(state)
+        candidate = state['candidate']
+        self.stdout.write(
+            f"🧪 Candidata: {candidate['version']} ({candidate['mode']}, {candidate['fraction']:.0%})"
+            if candidate else '🧪 Sin candidata'
+        )
+
+    def handle_promote(self, options):
+        state = read_state()
+        if not state['candidate']:
+            raise CommandError('No hay versión candidata')
+        state['active'] = state['candidate']['version']
+        state['candidate'] = None
+        write_state(state)
+        self.stdout.write(f"🔄 Versión activa: {state['active']}")
+        self._remind_service_restart()
@@ -0,0 +1,101 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from diagnostics.backends import KerasBackend
+from diagnostics.management.commands.convert_model import load_image_set
+from diagnostics.preprocessing import preprocess_batch
+from diagnostics.quantization import (
+    VARIANTS, convert_variant, evaluate, gate, labeled_files, malignant_index, read_manifest, run_variant,
+    time_predictions, variant_path, write_manifest,
+)
+
+
+class Command(BaseCommand):
+    help = ('Genera variantes cuantizadas (dynamic, float16, int8) de keras_model.h5 y '
+            'rechaza las que pierden precisión frente al modelo float32')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=settings.MODEL_PATH, help='Modelo Keras de origen (.h5)')
+        parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=VARIANTS)
+        parser.add_argument('--eval-dir', required=True,
+                            help='Carpeta etiquetada: una subcarpeta por clase (Maligno, Benigno, ... o 0, 1, ...)')
+        parser.add_argument('--calibration', nargs='+',
+                            help='Imágenes o carpetas para calibrar int8 (por defecto, las de evaluación)')
+        parser.add_argument('--calibration-size', type=int, default=200)
+        parser.add_argument('--max-accuracy-drop', type=float, default=settings.QUANTIZATION_MAX_ACCURACY_DROP)
+        parser.add_argument('--max-sensitivity-drop', type=float, default=settings.QUANTIZATION_MAX_SENSITIVITY_DROP,
+                            help='Caída máxima de sensibilidad para la clase Maligno')
+        parser.add_argument('--min-agreement', type=float, default=settings.QUANTIZATION_MIN_AGREEMENT,
+                            help='Concordancia mínima de argmax con el modelo float32')
+        parser.add_argument('--threads', type=int, default=None, help='Hilos del intérprete al medir latencia')
+
+    def handle(self, *args, **options):
+        import tensorflow as tf
+
+        source = options['source']
+        with open(settings.LABELS_PATH, 'r', encoding='utf-8') as f:
+            class_names = [line.strip() for line in f.readlines()]
+
+        try:
+            files, labels = labeled_files(options['eval_dir'], class_names)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        if not files:
+            raise CommandError('La carpeta de evaluación no contiene imágenes')
+        batch = preprocess_batch(files)
+        positive = malignant_index(class_names)
+
+        # Referencia: el modelo float32 original
+        reference_backend = KerasBackend(source).load()
+        reference = reference_backend.predict(batch)
+        baseline = evaluate(reference, labels, None, positive)
+        baseline['latency_ms'] = time_predictions(reference_backend, batch[:32])
+        baseline['size_mb'] = round(os.path.getsize(source) / 1e6, 2)
+        self.stdout.write(
+            f"📏 float32: {len(files)} imágenes, precisión {baseline['accuracy']:.2%}, "
+            f"sensibilidad {self._fmt(baseline['sensitivity'])}, {baseline['latency_ms']} ms/imagen"
+        )
+
+        calibration = None
+        if 'int8' in options['variants']:
+            if options['calibration']:
+                _, calibration = load_image_set(options['calibration'])
+            else:
+                calibration = batch
+            calibration = calibration[:options['calibration_size']]
+
+        model = tf.keras.models.load_model(source, compile=False)
+        manifest = read_manifest(source)
+        manifest['baseline'] = baseline
+        manifest['thresholds'] = {
+            'max_accuracy_drop': options['max_accuracy_drop'],
+            'max_sensitivity_drop': options['max_sensitivity_drop'],
+            'min_agreement': options['min_agreement'],
+        }
+        manifest.setdefault('variants', {})
+
+        for variant in options['variants']:
+            path = variant_path(source, variant)
+            with open(path, 'wb') as f:
+                f.write(convert_variant(model, variant, calibration))
+            metrics = run_variant(path, batch, labels, reference, positive, num_threads=options['threads'])
+            reasons = gate(metrics, baseline, options['max_accuracy_drop'],
+                           options['max_sensitivity_drop'], options['min_agreement'])
+            metrics['accepted'] = not reasons
+            metrics['rejected_because'] = reasons
+            manifest['variants'][variant] = metrics
+
+            status = '✅ aceptada' if not reasons else f"❌ rechazada ({'; '.join(reasons)})"
+            self.stdout.write(
+                f"{variant}: {metrics['size_mb']} MB, {metrics['latency_ms']} ms/imagen, "
+                f"precisión {metrics['accuracy']:.2%}, sensibilidad {self._fmt(metrics['sensitivity'])}, "
+                f"concordancia {metrics['argmax_agreement']:.2%} → {status}"
+            )
+
+        self.stdout.write(f"📝 Manifiesto: {write_manifest(source, manifest)}")
+
+    @staticmethod
+    def _fmt(value):
+        return 'n/d' if value is None else f"{value:.2%}"
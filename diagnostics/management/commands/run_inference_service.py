@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from diagnostics.inference_service import InferenceService, core_sets
+from diagnostics.model_store import desired_specs
+
+
+class Command(BaseCommand):
+    help = ('Ejecuta el servicio local de inferencia multiproceso (socket Unix) con la versión activa '
+            'de registry.json; tras activar otra versión hay que reiniciarlo')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=settings.INFERENCE_SERVICE_SOCKET)
+        parser.add_argument('--backend', default=settings.INFERENCE_SERVICE_BACKEND,
+                            choices=['keras', 'tflite', 'onnx'],
+                            help='Motor que ejecutan los procesos del servicio')
+        parser.add_argument('--processes', type=int, default=settings.INFERENCE_SERVICE_PROCESSES)
+        parser.add_argument('--intra-op-threads', type=int, default=settings.INFERENCE_SERVICE_INTRA_OP_THREADS,
+                            help='Hilos por operación (por defecto, los núcleos asignados al proceso)')
+        parser.add_argument('--inter-op-threads', type=int, default=settings.INFERENCE_SERVICE_INTER_OP_THREADS)
+
+    def handle(self, *args, **options):
+        active, candidate, mode, _ = desired_specs(options['backend'])
+        if candidate is not None:
+            self.stderr.write(f"⚠️ La candidata {candidate.version} ({mode}) no se sirve a través del servicio; "
+                              f"solo la versión activa {active.version}")
+        model_path = active.model_path
+        service = InferenceService(
+            options['socket'],
+            options['backend'],
+            model_path,
+            processes=options['processes'],
+            intra_op_threads=options['intra_op_threads'],
+            inter_op_threads=options['inter_op_threads'],
+        )
+        for i, cores in enumerate(core_sets(service.processes)):
+            self.stdout.write(f"⚙️ proceso {i}: núcleos {cores}")
+        self.stdout.write(f"🚀 Servicio de inferencia ({options['backend']}, versión {active.version}, {model_path}) en {options['socket']} (Ctrl+C para detener)")
+        try:
+            service.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('🛑 Servicio detenido')
@@ -0,0 +1,54 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from diagnostics.jobs import requeue_stale, run_worker
+from diagnostics.registry import get_registry
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta el pool de workers que procesa la cola de predicciones asíncronas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'PREDICTION_WORKERS', 2),
+                            help='Hilos de inferencia (comparten un único modelo cargado)')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'PREDICTION_JOB_BATCH_SIZE', 16),
+                            help='Trabajos reclamados y evaluados por pasada del modelo')
+        parser.add_argument('--poll-interval', type=float, default=0.5,
+                            help='Segundos de espera cuando la cola está vacía')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Reencolar trabajos en proceso con más de N segundos (worker caído)')
+
+    def handle(self, *args, **options):
+        registry = get_registry()
+        if not registry.warm_up():
+            raise CommandError(f"No se pudo cargar el modelo: {registry.error}")
+
+        requeued = requeue_stale(options['stale_after'])
+        if requeued:
+            self.stdout.write(f"♻️ {requeued} trabajos reencolados")
+
+        stop_event = threading.Event()
+        threads = [
+            threading.Thread(
+                target=run_worker,
+                args=(registry, stop_event, options['batch_size'], options['poll_interval']),
+                name=f'prediction-worker-{i}',
+                daemon=True,
+            )
+            for i in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"🚀 {len(threads)} workers de predicción en ejecución (Ctrl+C para detener)")
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write('🛑 Deteniendo workers...')
+            stop_event.set()
+            for thread in threads:
+                thread.join()
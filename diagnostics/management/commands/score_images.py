@@ -0,0 +1,92 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from diagnostics.backends import BACKENDS
+from diagnostics.model_store import ModelStoreError, desired_specs, version_spec
+from diagnostics.registry import LoadedModel
+from diagnostics.scoring import (
+    BASE_COLUMNS, decoded_stream, iter_sources, open_results, probability_columns, result_row, score,
+    source_name,
+)
+
+
+class Command(BaseCommand):
+    help = ('Puntúa carpetas, patrones glob o archivos .zip de imágenes y escribe los resultados '
+            'en CSV o Parquet; una ejecución interrumpida se reanuda donde quedó')
+
+    def add_arguments(self, parser):
+        parser.add_argument('inputs', nargs='+', help='Carpetas, patrones glob ("data/**/*.jpg"), .zip o imágenes')
+        parser.add_argument('--output', required=True, help='Archivo .csv o carpeta .parquet')
+        parser.add_argument('--format', choices=['csv', 'parquet'],
+                            help='Formato de salida (por defecto, según la extensión de --output)')
+        parser.add_argument('--model-version',
+                            help='Versión de model_versions a usar (por defecto, la activa)')
+        parser.add_argument('--backend', default=getattr(settings, 'INFERENCE_BACKEND', 'keras'),
+                            choices=[name for name in BACKENDS if name != 'service'])
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'INFERENCE_BATCH_CHUNK', 64))
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Procesos de decodificación (por defecto, os.cpu_count(); 0 = sin pool)')
+        parser.add_argument('--prefetch', type=int, default=None,
+                            help='Imágenes decodificándose por adelantado (por defecto, 4 lotes)')
+        parser.add_argument('--threads', type=int, default=getattr(settings, 'INFERENCE_NUM_THREADS', None),
+                            help='Hilos del motor de inferencia')
+        parser.add_argument('--no-resume', action='store_true', help='Sobrescribe la salida en lugar de reanudar')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        output_format = options['format'] or ('parquet' if output.rstrip('/').endswith('.parquet') else 'csv')
+        batch_size = max(1, options['batch_size'])
+        prefetch = max(batch_size, options['prefetch'] or 4 * batch_size)
+
+        try:
+            spec = version_spec(options['model_version'], options['backend']) if options['model_version'] \
+                else desired_specs(options['backend'])[0]
+        except ModelStoreError as e:
+            raise CommandError(str(e))
+        model = LoadedModel(spec, options['backend'], num_threads=options['threads']).load()
+        class_names = model.class_names
+
+        columns = BASE_COLUMNS + probability_columns(class_names)
+        try:
+            results = open_results(output, output_format, columns, resume=not options['no_resume'])
+        except (ImportError, ValueError) as e:
+            raise CommandError(str(e))
+        if results.done:
+            self.stdout.write(f"↩️  Reanudando: {len(results.done)} imágenes ya puntuadas en {output}")
+
+        done = results.done
+        locators = (locator for locator in iter_sources(options['inputs']) if source_name(locator) not in done)
+        stream = decoded_stream(
+            locators, workers=options['workers'], prefetch=prefetch,
+            resample=getattr(settings, 'PREPROCESS_RESAMPLE', 'lanczos'),
+            draft=getattr(settings, 'PREPROCESS_JPEG_DRAFT', True),
+        )
+
+        scored = failed = 0
+        started = last_report = time.perf_counter()
+        try:
+            for batch in score(model.model.predict, stream, batch_size):
+                results.write([result_row(source, probs, error, class_names, model.version)
+                               for source, probs, error in batch])
+                scored += len(batch)
+                failed += sum(1 for _, probs, _ in batch if probs is None)
+                now = time.perf_counter()
+                if now - last_report >= 10:
+                    last_report = now
+                    self.stdout.write(f"   {scored} imágenes ({scored / (now - started):.1f}/s)")
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Interrumpido: vuelva a ejecutar el comando para reanudar'))
+        finally:
+            results.close()
+
+        elapsed = time.perf_counter() - started
+        rate = scored / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(
+            f"✅ {scored} imágenes puntuadas con la versión {model.version} en {elapsed:.1f} s "
+            f"({rate:.1f}/s, {failed} con error) → {os.path.abspath(output)}"
+        )
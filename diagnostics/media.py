@@ -0,0 +1,147 @@
+"""Entrega de imágenes de diagnóstico en streaming con soporte de caché HTTP.
+
+Como las imágenes están direccionadas por contenido, la clave SHA-256 sirve
+directamente de ETag fuerte y las respuestas pueden cachearse indefinidamente
+en el navegador (``private``, porque son datos clínicos).
+"""
+import io
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from PIL import Image
+
+from .preprocessing import CONTENT_TYPES, sniff_format
+from .renditions import generate_renditions, rendition_name, rendition_specs
+from .storage import get_blob_store
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+
+def thumbnail_sizes():
+    return tuple(getattr(settings, 'DIAGNOSTICS_THUMBNAIL_SIZES', (128, 256, 512)))
+
+
+def thumbnail_name(size):
+    return f"thumb_{size}.jpg"
+
+
+def render_thumbnail(data, size, quality=85):
+    """Miniatura JPEG que cabe en ``size`` x ``size`` conservando proporciones"""
+    image = Image.open(io.BytesIO(data))
+    if image.format == 'JPEG':
+        image.draft('RGB', (size, size))
+    image = image.convert('RGB')
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    buffered = io.BytesIO()
+    image.save(buffered, format='JPEG', quality=quality, optimize=True)
+    return buffered.getvalue()
+
+
+def ensure_thumbnail(key, size):
+    """Genera (una sola vez) y guarda la miniatura de ``key``"""
+    store = get_blob_store()
+    name = thumbnail_name(size)
+    if not store.has_derived(key, name):
+        store.save_derived(key, name, render_thumbnail(store.read(key), size))
+    return name
+
+
+def _parse_range(header, length):
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if start == '':
+        if end == '':
+            return None
+        start, end = max(0, length - int(end)), length - 1
+    else:
+        start = int(start)
+        end = min(int(end), length - 1) if end else length - 1
+    if start > end or start >= length:
+        return None
+    return start, end
+
+
+def _finish(response, etag, last_modified, ranges=True):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = CACHE_CONTROL
+    if ranges:
+        response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve_image(request, diagnostic, size=None, rendition=None):
+    """Respuesta en streaming (con Range y ETag) para la imagen de ``diagnostic``,
+    una miniatura (``size``) o una de sus versiones (``rendition``)"""
+    store = get_blob_store()
+    key = diagnostic.image_key
+    last_modified = diagnostic.diagnosis_date.timestamp()
+    content_type = None
+
+    if rendition is not None:
+        _, image_format, _ = rendition_specs()[rendition]
+        name = rendition_name(rendition, image_format)
+        etag = f'"{key}-{rendition}"'
+        content_type = CONTENT_TYPES.get(image_format)
+        # Si el trabajo de segundo plano aún no terminó, se generan aquí
+        ensure = lambda: store.has_derived(key, name) or generate_renditions(key)
+    elif size is not None:
+        name = thumbnail_name(size)
+        etag = f'"{key}-{size}"'
+        ensure = lambda: ensure_thumbnail(key, size)
+    else:
+        etag = f'"{key}"'
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if not_modified is not None:
+        return _finish(not_modified, etag, last_modified)
+
+    if size is None and rendition is None:
+        f = store.open(key)
+        length = store.size(key)
+    else:
+        ensure()
+        f = store.open_derived(key, name)
+        length = store.storage.size(store.derived_path(key, name))
+
+    if content_type is None:
+        content_type = CONTENT_TYPES.get(sniff_format(f.read(16)), 'application/octet-stream')
+        f.seek(0)
+
+    byte_range = _parse_range(request.headers.get('Range', ''), length) if 'Range' in request.headers else None
+    if byte_range is not None:
+        start, end = byte_range
+        f.seek(start)
+        response = HttpResponse(f.read(end - start + 1), status=206, content_type=content_type)
+        f.close()
+        response['Content-Range'] = f'bytes {start}-{end}/{length}'
+    else:
+        response = FileResponse(f, content_type=content_type)
+        response['Content-Length'] = length
+    return _finish(response, etag, last_modified)
+
+
+def serve_derived(request, diagnostic, name, etag, ensure):
+    """Derivado pequeño de la imagen (p. ej. un mapa de explicabilidad).
+
+    ``ensure`` lo genera si falta; no se llama cuando el navegador ya tiene
+    la versión vigente (304).
+    """
+    store = get_blob_store()
+    last_modified = diagnostic.diagnosis_date.timestamp()
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if not_modified is not None:
+        return _finish(not_modified, etag, last_modified, ranges=False)
+
+    ensure()
+    with store.open_derived(diagnostic.image_key, name) as f:
+        data = f.read()
+    response = HttpResponse(data, content_type=CONTENT_TYPES.get(sniff_format(data[:16]), 'application/octet-stream'))
+    response['Content-Length'] = len(data)
+    return _finish(response, etag, last_modified, ranges=False)
@@ -0,0 +1,150 @@
+"""Métricas en formato de exposición de Prometheus, sin dependencias.
+
+Contadores e histogramas con etiquetas protegidos por un lock; registrar una
+observación cuesta unas pocas operaciones. Los valores que ya mantienen otros
+componentes (caché, micro-lotes, cola de trabajos) se leen al momento de la
+consulta mediante *collectors* en lugar de duplicarse.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, labels), value) for labels, value in items]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+        samples = []
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                samples.append((f'{self.name}_bucket',
+                                _format_labels(self.labelnames, labels, [('le', le)]), cumulative))
+            samples.append((f'{self.name}_sum', _format_labels(self.labelnames, labels), total))
+            samples.append((f'{self.name}_count', _format_labels(self.labelnames, labels), count))
+        return samples
+
+
+def register_collector(func):
+    """``func()`` devuelve [(nombre, tipo, ayuda, valor)], donde valor es un
+    número o una lista de ({etiqueta: valor}, número)"""
+    _collectors.append(func)
+    return func
+
+
+def render():
+    """Texto de exposición de todas las métricas"""
+    lines = []
+    for metric in _metrics:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {value}')
+    for collector in _collectors:
+        try:
+            collected = collector()
+        except Exception:
+            continue
+        for name, kind, documentation, value in collected:
+            if value is None:
+                continue
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {kind}')
+            if isinstance(value, list):
+                for labels, labeled_value in value:
+                    lines.append(f'{name}{_format_labels(labels.keys(), labels.values())} {labeled_value}')
+            else:
+                lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+# Métricas del pipeline de predicción
+STAGE_SECONDS = Histogram(
+    'diagnostics_stage_seconds', 'Duración de cada etapa del pipeline de predicción', ['stage'])
+REQUESTS_TOTAL = Counter(
+    'diagnostics_http_requests_total', 'Peticiones HTTP atendidas', ['view', 'status'])
+REQUEST_SECONDS = Histogram(
+    'diagnostics_http_request_seconds', 'Latencia de las peticiones HTTP', ['view'])
+DB_SECONDS = Histogram(
+    'diagnostics_db_seconds', 'Tiempo total de base de datos por petición', ['view'])
+DB_QUERIES = Counter(
+    'diagnostics_db_queries_total', 'Consultas SQL ejecutadas', ['view'])
+MODEL_PREDICTIONS = Counter(
+    'diagnostics_model_predictions_total', 'Predicciones servidas por versión del modelo', ['version'])
+SHADOW_COMPARISONS = Counter(
+    'diagnostics_shadow_comparisons_total', 'Comparaciones con la versión candidata en modo shadow',
+    ['version', 'outcome'])
+
+
+def stage(name):
+    """Cronómetro de una etapa: ``with stage('preprocess'): ...``"""
+    return STAGE_SECONDS.time(name)
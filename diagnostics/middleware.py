@@ -0,0 +1,114 @@
+import logging
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .metrics import DB_QUERIES, DB_SECONDS, REQUEST_SECONDS, REQUESTS_TOTAL
+from .profiling import SamplingProfiler
+
+logger = logging.getLogger(__name__)
+
+
+class _QueryTimer:
+    """``execute_wrapper`` que acumula el tiempo y número de consultas"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+# Temporizador de la petición asíncrona en curso. ``sync_to_async`` copia el
+# contexto al hilo donde corre el ORM, cuya conexión es otra que la del bucle
+# de eventos, así que ``execute_wrapper`` en el middleware no la vería
+_async_timer = ContextVar('diagnostics_async_query_timer', default=None)
+
+
+def _context_timer(execute, sql, params, many, context):
+    timer = _async_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+@receiver(connection_created, dispatch_uid='diagnostics_query_timer')
+def _install_context_timer(sender, connection, **kwargs):
+    if _context_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_context_timer)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.url_name or match.view_name if match is not None else 'unmatched'
+
+
+class MetricsMiddleware:
+    """Latencia, estado y tiempo de base de datos por vista.
+
+    Con PROFILING_ENABLED, una petición con la cabecera ``X-Profile: 1`` se
+    perfila por muestreo y las pilas se guardan en PROFILE_DIR. Bajo ASGI
+    funciona en modo asíncrono y las consultas se cuentan con ``_async_timer``
+    (en ese modo el perfil muestrea el hilo del bucle de eventos).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer, profiler = _QueryTimer(), self._profiler(request)
+        started = time.perf_counter()
+        with connections['default'].execute_wrapper(timer):
+            response = self.get_response(request)
+        return self._record(request, response, timer, profiler, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timer, profiler = _QueryTimer(), self._profiler(request)
+        started = time.perf_counter()
+        token = _async_timer.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _async_timer.reset(token)
+        return self._record(request, response, timer, profiler, time.perf_counter() - started)
+
+    @staticmethod
+    def _profiler(request):
+        if getattr(settings, 'PROFILING_ENABLED', False) and request.headers.get('X-Profile') == '1':
+            return SamplingProfiler(interval=getattr(settings, 'PROFILING_INTERVAL', 0.005)).start()
+        return None
+
+    @staticmethod
+    def _record(request, response, timer, profiler, elapsed):
+        view = _view_name(request)
+        REQUESTS_TOTAL.inc(1, view, str(response.status_code))
+        REQUEST_SECONDS.observe(elapsed, view)
+        DB_SECONDS.observe(timer.seconds, view)
+        if timer.queries:
+            DB_QUERIES.inc(timer.queries, view)
+
+        if profiler is not None:
+            profiler.stop()
+            path = profiler.dump(getattr(settings, 'PROFILE_DIR', 'profiles'), view)
+            response['X-Profile-File'] = os.path.basename(path)
+            logger.info("Perfil de %s (%.1f ms) guardado en %s", view, elapsed * 1000.0, path)
+        return response
@@ -0,0 +1,57 @@
+import base64
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def move_images_to_blob_store(apps, schema_editor):
+    """Mueve las imágenes base64 de la tabla al almacén por contenido"""
+    from diagnostics.storage import get_blob_store
+
+    DiagnosticHistory = apps.get_model('diagnostics', 'DiagnosticHistory')
+    store = get_blob_store()
+    pending = (
+        DiagnosticHistory.objects
+        .filter(image_data__isnull=False, image_key__isnull=True)
+        .exclude(image_data='')
+        .only('id', 'image_data')
+    )
+    batch = []
+    for diagnostic in pending.iterator(chunk_size=BATCH_SIZE):
+        diagnostic.image_key = store.save(base64.b64decode(diagnostic.image_data))
+        diagnostic.image_data = None
+        batch.append(diagnostic)
+        if len(batch) >= BATCH_SIZE:
+            DiagnosticHistory.objects.bulk_update(batch, ['image_key', 'image_data'])
+            batch = []
+    if batch:
+        DiagnosticHistory.objects.bulk_update(batch, ['image_key', 'image_data'])
+
+
+def restore_images_from_blob_store(apps, schema_editor):
+    from diagnostics.storage import get_blob_store
+
+    DiagnosticHistory = apps.get_model('diagnostics', 'DiagnosticHistory')
+    store = get_blob_store()
+    stored = DiagnosticHistory.objects.filter(image_key__isnull=False).only('id', 'image_key')
+    batch = []
+    for diagnostic in stored.iterator(chunk_size=BATCH_SIZE):
+        diagnostic.image_data = base64.b64encode(store.read(diagnostic.image_key)).decode()
+        batch.append(diagnostic)
+        if len(batch) >= BATCH_SIZE:
+            DiagnosticHistory.objects.bulk_update(batch, ['image_data'])
+            batch = []
+    if batch:
+        DiagnosticHistory.objects.bulk_update(batch, ['image_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostics', '0002_diagnostichistory_image_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_images_to_blob_store, restore_images_from_blob_store),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostics', '0003_move_image_data_to_blob_store'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='diagnostichistory',
+            name='image_data',
+        ),
+    ]
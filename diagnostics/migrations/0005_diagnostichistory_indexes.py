@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostics', '0004_remove_diagnostichistory_image_data'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='diagnostichistory',
+            index=models.Index(fields=['user', 'diagnosis_date', 'id'], name='diag_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diagnostichistory',
+            index=models.Index(fields=['diagnosis_date', 'id'], name='diag_date_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('diagnostics', '0005_diagnostichistory_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PredictionJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('queued', 'En cola'), ('running', 'En proceso'), ('done', 'Completado'), ('failed', 'Fallido')], default='queued', max_length=20)),
+                ('priority', models.SmallIntegerField(choices=[(0, 'Clínico'), (10, 'Lote')], default=0)),
+                ('filename', models.CharField(blank=True, max_length=255)),
+                ('image_key', models.CharField(max_length=64)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('diagnostic', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='diagnostics.diagnostichistory')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'diagnostics_predictionjob',
+                'ordering': ['priority', 'created_at'],
+                'indexes': [models.Index(fields=['status', 'priority', 'created_at'], name='job_queue_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_stats(apps, schema_editor):
+    """Calcula los contadores a partir del historial existente"""
+    from diagnostics.stats import stats_key
+
+    DiagnosticHistory = apps.get_model('diagnostics', 'DiagnosticHistory')
+    DiagnosticStats = apps.get_model('diagnostics', 'DiagnosticStats')
+    rows = DiagnosticHistory.objects.only('user_id', 'diagnosis_date', 'diagnosis', 'risk_level')
+    counts = Counter(stats_key(row) for row in rows.iterator(chunk_size=2000))
+    DiagnosticStats.objects.bulk_create(
+        [
+            DiagnosticStats(user_id=user_id, day=day, diagnosis_class=diagnosis_class, risk_bucket=bucket, count=count)
+            for (user_id, day, diagnosis_class, bucket), count in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('diagnostics', '0006_predictionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiagnosticStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('diagnosis_class', models.CharField(max_length=20)),
+                ('risk_bucket', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'diagnostics_diagnosticstats',
+                'indexes': [models.Index(fields=['day'], name='stats_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'day', 'diagnosis_class', 'risk_bucket'), name='stats_key_unique')],
+            },
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostics', '0007_diagnosticstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diagnostichistory',
+            name='model_version',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostics', '0008_diagnostichistory_model_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diagnostichistory',
+            name='embedding',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostics', '0009_diagnostichistory_embedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diagnostichistory',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnostics', '0010_diagnostichistory_renditions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='diagnostichistory',
+            index=models.Index(fields=['image_key'], name='diag_image_key_idx'),
+        ),
+    ]
@@ -0,0 +1,178 @@
+"""Versiones del modelo guardadas lado a lado.
+
+Cada versión es un directorio ``MODEL_VERSIONS_DIR/<versión>/`` con su
+``keras_model.h5``, ``labels.txt`` y los artefactos convertidos. El archivo
+``registry.json`` del mismo directorio indica la versión activa y, si la hay,
+la candidata en modo ``shadow`` (se ejecuta aparte y solo se registran las
+discrepancias) o ``canary`` (responde a una fracción del tráfico). Se escribe
+de forma atómica, así que cada proceso puede vigilarlo y recargar en caliente.
+
+Sin ``registry.json`` (o sin versión activa) se sirve ``MODEL_PATH`` /
+``LABELS_PATH`` como hasta ahora, con una huella de los archivos como versión.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+from collections import namedtuple
+from stat import S_ISREG
+
+from django.conf import settings
+
+from .backends import default_artifact_path
+from .quantization import select_variant
+
+MODEL_FILENAME = 'keras_model.h5'
+LABELS_FILENAME = 'labels.txt'
+STATE_FILENAME = 'registry.json'
+CANDIDATE_MODES = ('shadow', 'canary')
+VERSION_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$')
+
+# Qué cargar: nombre de la versión, artefacto para el motor y etiquetas
+ModelSpec = namedtuple('ModelSpec', ['version', 'model_path', 'labels_path'])
+
+
+class ModelStoreError(ValueError):
+    pass
+
+
+def versions_dir():
+    return str(getattr(settings, 'MODEL_VERSIONS_DIR', os.path.join(settings.BASE_DIR, 'models')))
+
+
+def state_path():
+    return os.path.join(versions_dir(), STATE_FILENAME)
+
+
+def version_dir(version):
+    return os.path.join(versions_dir(), version)
+
+
+def read_state():
+    try:
+        with open(state_path(), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    state.setdefault('active', None)
+    state.setdefault('candidate', None)
+    return state
+
+
+def write_state(state):
+    """Reemplaza registry.json de forma atómica (los procesos nunca leen uno a medias)"""
+    os.makedirs(versions_dir(), exist_ok=True)
+    temporary = f"{state_path()}.{os.getpid()}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, state_path())
+
+
+def state_signature():
+    """Cambia cuando se reescribe registry.json; barato de consultar"""
+    try:
+        stat = os.stat(state_path())
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def list_versions():
+    root = versions_dir()
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        entry for entry in os.listdir(root)
+        if os.path.isfile(os.path.join(root, entry, MODEL_FILENAME))
+    )
+
+
+def add_version(version, model_path, labels_path):
+    """Copia un export de Teachable Machine como nueva versión (inmutable)"""
+    if not VERSION_NAME.match(version):
+        raise ModelStoreError(f"Nombre de versión inválido: {version!r}")
+    target = version_dir(version)
+    if os.path.exists(target):
+        raise ModelStoreError(f"La versión {version!r} ya existe")
+    temporary = f"{target}.tmp"
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    shutil.copy2(model_path, os.path.join(temporary, MODEL_FILENAME))
+    shutil.copy2(labels_path, os.path.join(temporary, LABELS_FILENAME))
+    os.replace(temporary, target)
+    return target
+
+
+def file_fingerprint(paths):
+    """Huella del tamaño y fecha de los archivos (cambia si se reemplazan)"""
+    parts = []
+    for path in dict.fromkeys(p for p in paths if p):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            parts.append(f"{path}:missing")
+            continue
+        # El socket del servicio no es un archivo de modelo
+        if S_ISREG(stat.st_mode):
+            parts.append(f"{path}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:16]
+
+
+def resolve_model_path(backend_name, keras_path=None):
+    """Artefacto a servir con ``backend_name`` para el .h5 ``keras_path``.
+
+    Con INFERENCE_MODEL_VARIANT y el motor TFLite se usa la variante
+    cuantizada indicada solo si pasó el control de precisión de
+    ``manage.py quantize_model``; si no, el modelo convertido sin cuantizar.
+    """
+    if backend_name == 'service':
+        return settings.INFERENCE_SERVICE_SOCKET
+    if keras_path is None:
+        explicit = getattr(settings, 'INFERENCE_MODEL_PATH', None)
+        if explicit:
+            return explicit
+        keras_path = settings.MODEL_PATH
+    requested = getattr(settings, 'INFERENCE_MODEL_VARIANT', None)
+    if requested and backend_name == 'tflite':
+        _, path = select_variant(keras_path, requested)
+        if path is not None:
+            return path
+    return default_artifact_path(keras_path, backend_name)
+
+
+def version_spec(version, backend_name):
+    directory = version_dir(version)
+    keras_path = os.path.join(directory, MODEL_FILENAME)
+    if not os.path.isfile(keras_path):
+        raise ModelStoreError(f"La versión {version!r} no existe en {versions_dir()}")
+    return ModelSpec(version, resolve_model_path(backend_name, keras_path), os.path.join(directory, LABELS_FILENAME))
+
+
+def legacy_spec(backend_name):
+    model_path = resolve_model_path(backend_name)
+    paths = (settings.MODEL_PATH, model_path, settings.LABELS_PATH)
+    return ModelSpec(file_fingerprint(paths), model_path, settings.LABELS_PATH)
+
+
+def desired_specs(backend_name, state=None):
+    """(spec activa, spec candidata o None, modo, fracción) según registry.json.
+
+    Con el motor ``service`` la candidata se ignora: las dos versiones irían
+    al mismo socket, que sirve solo la versión activa con la que arrancó
+    ``manage.py run_inference_service``.
+    """
+    state = state if state is not None else read_state()
+    active = version_spec(state['active'], backend_name) if state['active'] else legacy_spec(backend_name)
+    candidate = state['candidate'] or {}
+    if not candidate.get('version') or candidate['version'] == active.version or backend_name == 'service':
+        return active, None, None, 0.0
+    return (
+        active,
+        version_spec(candidate['version'], backend_name),
+        candidate.get('mode', 'shadow'),
+        float(candidate.get('fraction', 0.0)),
+    )
@@ -11,7 +11,10 @@ class DiagnosticHistory(models.Model):
     diagnosis = models.CharField(max_length=100)
     risk_level = models.DecimalField(max_digits=5, decimal_places=2)
     probabilities = models.JSONField()
-    image_data = models.TextField(blank=True, null=True)  # Base64 de la imagen
+    image_key = models.CharField(max_length=64, blank=True, null=True)  # SHA-256 en diagnostics.storage
+    model_version = models.CharField(max_length=64, blank=True, null=True)  # diagnostics.model_store
+    embedding = models.BinaryField(blank=True, null=True, editable=False)  # float16, diagnostics.embeddings
+    renditions = models.JSONField(default=dict, blank=True, editable=False)  # diagnostics.renditions
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -19,4 +22,79 @@ class DiagnosticHistory(models.Model):
     
     class Meta:
         db_table = 'diagnostics_diagnostichistory'
-        ordering = ['-diagnosis_date']
\ No newline at end of file
+        ordering = ['-diagnosis_date']
+        indexes = [
+            # Historial por paciente y paginación por cursor (diagnosis_date, id)
+            models.Index(fields=['user', 'diagnosis_date', 'id'], name='diag_user_date_idx'),
+            models.Index(fields=['diagnosis_date', 'id'], name='diag_date_idx'),
+            # Filas que comparten una imagen (versiones reducidas, borrado de blobs)
+            models.Index(fields=['image_key'], name='diag_image_key_idx'),
+        ]
+
+class PredictionJob(models.Model):
+    """Predicción encolada para los workers de inferencia (cola en tabla local)"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'En cola'),
+        (STATUS_RUNNING, 'En proceso'),
+        (STATUS_DONE, 'Completado'),
+        (STATUS_FAILED, 'Fallido'),
+    ]
+
+    # Menor número = mayor prioridad
+    PRIORITY_CLINICIAN = 0
+    PRIORITY_BULK = 10
+    PRIORITY_CHOICES = [
+        (PRIORITY_CLINICIAN, 'Clínico'),
+        (PRIORITY_BULK, 'Lote'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    priority = models.SmallIntegerField(choices=PRIORITY_CHOICES, default=PRIORITY_CLINICIAN)
+    filename = models.CharField(max_length=255, blank=True)
+    image_key = models.CharField(max_length=64)
+    diagnostic = models.ForeignKey(DiagnosticHistory, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Trabajo {self.id} ({self.status})"
+
+    class Meta:
+        db_table = 'diagnostics_predictionjob'
+        ordering = ['priority', 'created_at']
+        indexes = [
+            models.Index(fields=['status', 'priority', 'created_at'], name='job_queue_idx'),
+        ]
+
+
+class DiagnosticStats(models.Model):
+    """Contadores pre-agregados del historial (ver ``diagnostics.stats``).
+
+    Una fila por paciente, día, clase y decil de confianza; se incrementa al
+    insertar diagnósticos para que las estadísticas no recorran el historial.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    day = models.DateField()
+    diagnosis_class = models.CharField(max_length=20)
+    risk_bucket = models.PositiveSmallIntegerField()  # 0..9 = confianza 0-10%, ..., 90-100%
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day} {self.diagnosis_class} [{self.risk_bucket}]: {self.count}"
+
+    class Meta:
+        db_table = 'diagnostics_diagnosticstats'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'diagnosis_class', 'risk_bucket'], name='stats_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='stats_day_idx'),
+        ]
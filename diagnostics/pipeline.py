@@ -0,0 +1,348 @@
+"""Etapas de predicción compartidas por los endpoints individual y por lotes.
+
+Las funciones reciben la versión del modelo que atiende la petición
+(``registry.current()``): cualquier objeto con ``model``, ``batcher``,
+``class_names`` y ``model_version()``.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+from .cache import get_prediction_cache
+from .embeddings import encode as encode_embedding
+from .metrics import MODEL_PREDICTIONS, SHADOW_COMPARISONS, stage
+from .preprocessing import INPUT_SHAPE, TTA_TRANSFORMS, augment_batch, load_image, normalize_into, preprocess
+from .storage import content_key
+
+logger = logging.getLogger(__name__)
+
+def get_confidence_display(confidence_percentage):
+    """Convierte porcentaje a nivel de semáforo y rango aproximado"""
+    rounded_confidence = round(confidence_percentage / 5) * 5
+    
+    if confidence_percentage >= 80:
+        return "🟢 Bajo riesgo", f"≈ {rounded_confidence}%"
+    elif confidence_percentage >= 50:
+        return "🟡 Riesgo intermedio", f"≈ {rounded_confidence}%"
+    else:
+        return "🔴 Alto riesgo", f"≈ {rounded_confidence}%"
+
+def get_user_friendly_class_name(full_class_name):
+    """Convierte nombres técnicos a nombres comprensibles para el usuario"""
+    if "Maligno" in full_class_name:
+        return "Maligno (sospecha de melanoma)"
+    elif "Benigno" in full_class_name:
+        return "Benigno (no peligroso)"
+    elif "Indeterminado" in full_class_name or "Desconocido" in full_class_name:
+        return "Indeterminado (evaluación médica recomendada)"
+    else:
+        return full_class_name
+
+def get_simplified_class_name(full_class_name):
+    """Extrae solo la parte principal del nombre de la clase para gráficos"""
+    if "Maligno" in full_class_name:
+        return "Maligno"
+    elif "Benigno" in full_class_name:
+        return "Benigno"
+    elif "Indeterminado" in full_class_name or "Desconocido" in full_class_name:
+        return "Indeterminado"
+    else:
+        return full_class_name
+
+def describe_prediction(probs, class_names):
+    """Campos de respuesta a partir del vector de probabilidades"""
+    index = int(np.argmax(probs))
+
+    # Obtener nombre original y convertirlo a formato amigable
+    original_class_name = class_names[index] if index < len(class_names) else f"Clase {index}"
+    user_friendly_class = get_user_friendly_class_name(original_class_name)
+    simplified_class = get_simplified_class_name(original_class_name)
+
+    confidence = float(probs[index]) * 100.0
+
+    # Calcular nivel de confianza y rango
+    confidence_level, confidence_range = get_confidence_display(confidence)
+
+    return {
+        'probabilities': probs,
+        'predicted_index': index,
+        'predicted_class': user_friendly_class,
+        'simplified_class': simplified_class,
+        'confidence': round(confidence, 2),
+        'confidence_level': confidence_level,
+        'confidence_range': confidence_range,
+        'risk_level': confidence,
+    }
+
+
+def preprocess_kwargs():
+    return {
+        'resample': getattr(settings, 'PREPROCESS_RESAMPLE', 'lanczos'),
+        'draft': getattr(settings, 'PREPROCESS_JPEG_DRAFT', True),
+    }
+
+
+def _lookup(cache, model, key):
+    """(valor cacheado, embedding) o (None, None) si falta algo en la caché.
+
+    Probabilidades y embedding se guardan juntos en una sola entrada, así una
+    consulta cuenta un solo acierto o fallo.
+    """
+    if cache is None:
+        return None, None
+    entry = cache.get(model.model_version(), key)
+    # Entradas anteriores (solo probabilidades) o sin el embedding que ahora se pide
+    if not isinstance(entry, dict) or (model.embeddings and entry['embedding'] is None):
+        return None, None
+    return entry['probabilities'], entry['embedding']
+
+
+def _store(cache, model, key, value, embedding):
+    if cache is not None:
+        cache.set(model.model_version(), key, {'probabilities': value, 'embedding': embedding})
+
+
+def predict_one(model, image_bytes, image_hash=None):
+    """(probabilidades, embedding float16 o None) de una imagen: caché o
+    preprocesamiento + micro-lote"""
+    image_hash = image_hash or content_key(image_bytes)
+
+    # Una imagen ya vista con la misma versión del modelo no se vuelve a inferir
+    cache = get_prediction_cache()
+    with stage('cache_lookup'):
+        probs, embedding = _lookup(cache, model, image_hash)
+
+    if probs is None:
+        # Decodificar, recortar y normalizar sobre un búfer reutilizable
+        with stage('preprocess'):
+            _, normalized_image_array = preprocess(io.BytesIO(image_bytes), **preprocess_kwargs())
+
+        # Predecir (la imagen se agrupa con otras peticiones concurrentes)
+        with stage('inference'):
+            probs, embedding = model.split(model.batcher.predict(normalized_image_array))
+        probs = np.asarray(probs).tolist()
+        embedding = encode_embedding(embedding) if embedding is not None else None
+        _store(cache, model, image_hash, probs, embedding)
+    return probs, embedding
+
+
+def parse_tta(value=None):
+    """Vistas de TTA pedidas en el parámetro ``tta``; 1 = sin aumentación.
+
+    ``1``/``true`` usa TTA_VIEWS, un entero >= 2 fija K (hasta
+    len(TTA_TRANSFORMS)) y ``0``/``false`` la desactiva. Sin parámetro se
+    aplica TTA_DEFAULT.
+    """
+    if value is None or value == '':
+        value = getattr(settings, 'TTA_DEFAULT', False)
+    text = str(value).strip().lower()
+    if text in ('0', 'false', 'no', 'off'):
+        return 1
+    if text in ('1', 'true', 'yes', 'on'):
+        views = int(getattr(settings, 'TTA_VIEWS', 8))
+    else:
+        try:
+            views = int(text)
+        except ValueError:
+            raise ValueError(f"Parámetro tta inválido: {value!r}")
+        if views < 0:
+            raise ValueError(f"Parámetro tta inválido: {value!r}")
+    return max(1, min(views, len(TTA_TRANSFORMS)))
+
+
+def aggregate_views(view_probs):
+    """Promedio de las vistas y su dispersión.
+
+    ``uncertainty`` es la desviación estándar, entre vistas, de la
+    probabilidad de la clase elegida; ``agreement`` la fracción de vistas
+    que eligen esa misma clase.
+    """
+    view_probs = np.asarray(view_probs, dtype=np.float64)
+    probs = view_probs.mean(axis=0)
+    index = int(np.argmax(probs))
+    return probs.tolist(), {
+        'views': len(view_probs),
+        'uncertainty': round(float(view_probs[:, index].std()), 4),
+        'agreement': round(float(np.mean(view_probs.argmax(axis=1) == index)), 4),
+    }
+
+
+def predict_tta(model, image_bytes, image_hash=None, views=8):
+    """Predicción con TTA: las K vistas se evalúan en una sola pasada del modelo.
+
+    Devuelve (probabilidades promediadas, {'views', 'uncertainty', 'agreement'},
+    embedding de la vista sin aumentar o None). La caché guarda las K filas
+    bajo una clave propia por número de vistas.
+    """
+    image_hash = image_hash or content_key(image_bytes)
+    cache = get_prediction_cache()
+    cache_key = f"{image_hash}:tta{views}"
+    with stage('cache_lookup'):
+        view_probs, embedding = _lookup(cache, model, cache_key)
+
+    if view_probs is None:
+        with stage('tta_preprocess'):
+            batch = augment_batch(io.BytesIO(image_bytes), views, **preprocess_kwargs())
+        with stage('tta_inference'):
+            output, embeddings = model.predict_batch(batch)
+        view_probs = np.asarray(output).tolist()
+        embedding = encode_embedding(embeddings[0]) if embeddings is not None else None
+        _store(cache, model, cache_key, view_probs, embedding)
+    return aggregate_views(view_probs) + (embedding,)
+
+
+def predict_views(model, image_bytes, image_hash=None, views=1):
+    """(probabilidades, resumen de TTA o None, embedding o None) con o sin aumentación"""
+    if views > 1:
+        return predict_tta(model, image_bytes, image_hash, views)
+    probs, embedding = predict_one(model, image_bytes, image_hash)
+    return probs, None, embedding
+
+
+_shadow_executor = None
+_shadow_lock = threading.Lock()
+# Comparaciones shadow pendientes; si la candidata no da abasto se omiten
+_shadow_slots = threading.BoundedSemaphore(32)
+
+
+def _get_shadow_executor():
+    global _shadow_executor
+    if _shadow_executor is None:
+        with _shadow_lock:
+            if _shadow_executor is None:
+                _shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='diagnostics-shadow')
+    return _shadow_executor
+
+
+def _compare_with_shadow(candidate, served, image_bytes, image_hash, probs, views):
+    try:
+        candidate_probs, _, _ = predict_views(candidate, image_bytes, image_hash, views)
+    except Exception:
+        logger.exception("Error en la predicción shadow de la versión %s", candidate.version)
+        return
+    finally:
+        _shadow_slots.release()
+    served_index = int(np.argmax(probs))
+    candidate_index = int(np.argmax(candidate_probs))
+    agree = served_index == candidate_index
+    SHADOW_COMPARISONS.inc(1, candidate.version, 'agree' if agree else 'disagree')
+    if not agree:
+        logger.warning(
+            "Discrepancia shadow en la imagen %s: %s predice %s (%.1f%%), %s predice %s (%.1f%%)",
+            image_hash[:12],
+            served.version, served.class_names[served_index], probs[served_index] * 100,
+            candidate.version, candidate.class_names[candidate_index], candidate_probs[candidate_index] * 100,
+        )
+
+
+def predict_served(registry, image_bytes, image_hash=None, views=1):
+    """Predicción de una petición individual con la versión que le toca.
+
+    Devuelve (probabilidades, versión, resumen de TTA o None, embedding o
+    None); con ``views`` > 1 se usa ``predict_tta``. En modo canary una fracción de las
+    imágenes la atiende la candidata; en modo shadow la candidata se ejecuta
+    después, fuera de la petición, y solo se registran las discrepancias.
+    """
+    image_hash = image_hash or content_key(image_bytes)
+    model = registry.current(image_hash)
+    probs, tta, embedding = predict_views(model, image_bytes, image_hash, views)
+    MODEL_PREDICTIONS.inc(1, model.version)
+
+    candidate = registry.shadow_for(image_hash)
+    if candidate is not None and _shadow_slots.acquire(blocking=False):
+        _get_shadow_executor().submit(_compare_with_shadow, candidate, model, image_bytes, image_hash, probs, views)
+    return probs, model, tta, embedding
+
+
+_preprocess_pool = None
+_preprocess_lock = threading.Lock()
+
+
+def _get_preprocess_pool():
+    """Pool de hilos del proceso para decodificar lotes (se crea una sola vez)"""
+    global _preprocess_pool
+    if _preprocess_pool is None:
+        with _preprocess_lock:
+            if _preprocess_pool is None:
+                workers = getattr(settings, 'BATCH_PREDICT_WORKERS', None) or os.cpu_count()
+                _preprocess_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='diagnostics-preprocess')
+    return _preprocess_pool
+
+
+def preprocess_many(images, out):
+    """Decodifica y normaliza en paralelo sobre ``out`` (N, 224, 224, 3).
+
+    PIL libera el GIL al decodificar y redimensionar, así que el pool de hilos
+    aprovecha varios núcleos. Las imágenes válidas quedan contiguas al
+    principio de ``out``; devuelve sus posiciones en ``images`` y
+    {posición: excepción} de las demás.
+    """
+    errors = {}
+    options = preprocess_kwargs()
+
+    def work(i):
+        try:
+            normalize_into(load_image(io.BytesIO(images[i]), **options), out[i])
+        except Exception as e:
+            errors[i] = e
+
+    list(_get_preprocess_pool().map(work, range(len(images))))
+    valid = [i for i in range(len(images)) if i not in errors]
+    # Compactar en el sitio: cada fila válida solo puede moverse hacia delante
+    for row, i in enumerate(valid):
+        if row != i:
+            out[row] = out[i]
+    return valid, errors
+
+
+def predict_many(model, images, hashes=None):
+    """Predice una lista de imágenes (bytes) en lotes grandes.
+
+    Devuelve dos listas alineadas con ``images``: el vector de probabilidades
+    o la excepción que impidió procesar cada imagen, y su embedding (o None).
+    Usa la caché de predicciones para las imágenes ya vistas.
+    """
+    hashes = hashes or [content_key(data) for data in images]
+    results = [None] * len(images)
+    embeddings = [None] * len(images)
+    cache = get_prediction_cache()
+    model_version = model.model_version()
+
+    pending = []
+    for i, image_hash in enumerate(hashes):
+        cached, embedding = _lookup(cache, model, image_hash)
+        if cached is not None:
+            results[i], embeddings[i] = cached, embedding
+        else:
+            pending.append(i)
+    if not pending:
+        MODEL_PREDICTIONS.inc(len(results), model_version)
+        return results, embeddings
+
+    # Un búfer del tamaño de una pasada del modelo, reutilizado entre bloques
+    chunk = max(1, int(getattr(settings, 'INFERENCE_BATCH_CHUNK', 64)))
+    buffer = np.empty((min(chunk, len(pending)),) + INPUT_SHAPE, dtype=np.float32)
+    failed = 0
+    for start in range(0, len(pending), chunk):
+        block = pending[start:start + chunk]
+        with stage('batch_preprocess'):
+            valid, errors = preprocess_many([images[i] for i in block], buffer)
+        for position, error in errors.items():
+            results[block[position]] = error
+        failed += len(errors)
+        if not valid:
+            continue
+        with stage('batch_inference'):
+            output, vectors = model.predict_batch(buffer[:len(valid)])
+        for j, (position, row) in enumerate(zip(valid, output)):
+            i = block[position]
+            results[i] = np.asarray(row).tolist()
+            embeddings[i] = encode_embedding(vectors[j]) if vectors is not None else None
+            _store(cache, model, hashes[i], results[i], embeddings[i])
+    MODEL_PREDICTIONS.inc(len(images) - failed, model_version)
+    return results, embeddings
@@ -0,0 +1,190 @@
+"""Preprocesamiento compartido por el API, los comandos y ``modelo.py``.
+
+Replica el preprocesamiento de Teachable Machine (recorte centrado a 224x224 y
+normalización a [-1, 1]) evitando copias intermedias: los JPEG se reducen
+durante la decodificación (modo draft) y la normalización se hace en sitio
+sobre búferes float32 reutilizables. No depende de Django.
+
+``augment_batch`` genera las vistas de la predicción con aumentación en
+tiempo de prueba (TTA) sobre un único lote, para evaluarlas en una pasada.
+"""
+import math
+import threading
+
+import numpy as np
+from PIL import Image, ImageOps
+
+IMAGE_SIZE = (224, 224)
+INPUT_SHAPE = IMAGE_SIZE + (3,)
+
+RESAMPLING_FILTERS = {
+    'nearest': Image.Resampling.NEAREST,
+    'box': Image.Resampling.BOX,
+    'bilinear': Image.Resampling.BILINEAR,
+    'hamming': Image.Resampling.HAMMING,
+    'bicubic': Image.Resampling.BICUBIC,
+    'lanczos': Image.Resampling.LANCZOS,
+}
+
+# Firmas (magic bytes) de los formatos aceptados
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP'),
+)
+
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'BMP': 'image/bmp',
+    'WEBP': 'image/webp',
+    'AVIF': 'image/avif',
+}
+
+# Vistas de TTA en orden de uso: con K vistas se toman las K primeras, así
+# que se alternan giros y recortes. Los giros se aplican sobre el arreglo ya
+# normalizado (IMAGE_SIZE es cuadrado); los recortes cubren CROP_SCALE del
+# encuadre y se remuestrean desde la imagen decodificada
+TTA_TRANSFORMS = (
+    'identity', 'hflip', 'vflip', 'crop_center', 'rot90', 'rot270', 'crop_top_left',
+    'crop_bottom_right', 'rot180', 'crop_top_right', 'crop_bottom_left', 'transpose', 'transverse',
+)
+CROP_SCALE = 0.875
+
+ARRAY_TRANSFORMS = {
+    'hflip': lambda a: a[:, ::-1],
+    'vflip': lambda a: a[::-1],
+    'rot90': lambda a: np.rot90(a, 1),
+    'rot180': lambda a: np.rot90(a, 2),
+    'rot270': lambda a: np.rot90(a, 3),
+    'transpose': lambda a: a.transpose(1, 0, 2),
+    'transverse': lambda a: np.rot90(a, 2).transpose(1, 0, 2),
+}
+
+# Posición relativa del recorte dentro del encuadre
+CROP_ANCHORS = {
+    'crop_center': (0.5, 0.5),
+    'crop_top_left': (0.0, 0.0),
+    'crop_top_right': (1.0, 0.0),
+    'crop_bottom_left': (0.0, 1.0),
+    'crop_bottom_right': (1.0, 1.0),
+}
+
+_local = threading.local()
+
+
+def sniff_format(head):
+    """Formato de imagen a partir de los primeros bytes, o None si no se reconoce"""
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def get_resample(name):
+    """Filtro de remuestreo de PIL a partir de su nombre (p. ej. 'lanczos')"""
+    try:
+        return RESAMPLING_FILTERS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Filtro de remuestreo desconocido: {name!r} (opciones: {', '.join(RESAMPLING_FILTERS)})")
+
+
+def load_image(source, size=IMAGE_SIZE, resample='lanczos', draft=True):
+    """Abre la imagen y la recorta centrada a ``size``.
+
+    Con JPEG se usa ``Image.draft`` para que el decodificador entregue
+    directamente una versión reducida (1/2, 1/4 u 1/8) que sigue cubriendo
+    ``size``, con lo que se decodifican muchos menos píxeles.
+    """
+    image = Image.open(source)
+    if draft and image.format == 'JPEG':
+        image.draft('RGB', size)
+    image = image.convert('RGB')
+    return ImageOps.fit(image, size, get_resample(resample))
+
+
+def normalize_into(image, out):
+    """Escribe la imagen normalizada a [-1, 1] en ``out`` (float32) sin temporales"""
+    np.copyto(out, np.asarray(image), casting='unsafe')
+    out /= 127.5
+    out -= 1
+    return out
+
+
+def batch_buffer(batch_size, shape=INPUT_SHAPE):
+    """Búfer float32 (batch_size, *shape) reutilizado por hilo.
+
+    Devuelve una vista sobre un arreglo que solo crece; el contenido es válido
+    hasta la siguiente llamada desde el mismo hilo. Solo para la ruta de una
+    petición (``preprocess``, ``augment_batch``), que usa el resultado antes
+    de volver a llamarla.
+    """
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None or buffer.shape[0] < batch_size or buffer.shape[1:] != shape:
+        buffer = np.empty((batch_size,) + shape, dtype=np.float32)
+        _local.buffer = buffer
+    return buffer[:batch_size]
+
+
+def preprocess(source, out=None, size=IMAGE_SIZE, resample='lanczos', draft=True):
+    """Carga y normaliza una imagen; devuelve (imagen PIL recortada, arreglo)"""
+    image = load_image(source, size, resample, draft)
+    if out is None:
+        out = batch_buffer(1, size + (3,))[0]
+    return image, normalize_into(image, out)
+
+
+def preprocess_batch(sources, out=None, size=IMAGE_SIZE, resample='lanczos', draft=True):
+    """Preprocesa varias imágenes en un lote (nuevo, o ``out`` si se indica)"""
+    batch = np.empty((len(sources),) + size + (3,), dtype=np.float32) if out is None else out
+    for i, source in enumerate(sources):
+        normalize_into(load_image(source, size, resample, draft), batch[i])
+    return batch
+
+
+def fit_box(image_size, size=IMAGE_SIZE):
+    """Encuadre centrado (left, top, ancho, alto) con la proporción de ``size``"""
+    width, height = image_size
+    ratio = size[0] / size[1]
+    if width / height > ratio:
+        box_width, box_height = height * ratio, height
+    else:
+        box_width, box_height = width, width / ratio
+    return (width - box_width) / 2, (height - box_height) / 2, box_width, box_height
+
+
+def augment_batch(source, views, size=IMAGE_SIZE, resample='lanczos', draft=True):
+    """Decodifica una vez y escribe las ``views`` primeras vistas de TTA_TRANSFORMS.
+
+    Devuelve un lote (views, *size, 3) sobre el búfer reutilizable del hilo;
+    la vista 0 es el recorte centrado habitual.
+    """
+    views = max(1, min(int(views), len(TTA_TRANSFORMS)))
+    transforms = TTA_TRANSFORMS[:views]
+    filter_ = get_resample(resample)
+
+    image = Image.open(source)
+    if draft and image.format == 'JPEG':
+        # Los recortes necesitan algo más de resolución que el encuadre completo
+        image.draft('RGB', tuple(math.ceil(side / CROP_SCALE) for side in size))
+    image = image.convert('RGB')
+
+    batch = batch_buffer(views, size + (3,))
+    normalize_into(ImageOps.fit(image, size, filter_), batch[0])
+    left, top, box_width, box_height = fit_box(image.size, size)
+    crop_width, crop_height = box_width * CROP_SCALE, box_height * CROP_SCALE
+    for i, name in enumerate(transforms[1:], start=1):
+        if name in ARRAY_TRANSFORMS:
+            np.copyto(batch[i], ARRAY_TRANSFORMS[name](batch[0]))
+        else:
+            x_anchor, y_anchor = CROP_ANCHORS[name]
+            x = left + (box_width - crop_width) * x_anchor
+            y = top + (box_height - crop_height) * y_anchor
+            crop = image.resize(size, filter_, box=(x, y, x + crop_width, y + crop_height))
+            normalize_into(crop, batch[i])
+    return batch
@@ -0,0 +1,63 @@
+"""Perfilador por muestreo para una petición concreta.
+
+Un hilo lee periódicamente la pila del hilo que atiende la petición
+(``sys._current_frames``) y acumula pilas plegadas (``a;b;c N``), el formato
+que consumen flamegraph.pl y speedscope. No instrumenta cada llamada, así que
+el sobrecoste es proporcional a la frecuencia de muestreo y no al código.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def _folded(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            self.samples[_folded(frame)] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='diagnostics-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def dump(self, directory, name):
+        """Escribe las pilas plegadas en ``directory`` y devuelve la ruta"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{time.strftime("%Y%m%d-%H%M%S")}-{name}-{os.getpid()}.folded')
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
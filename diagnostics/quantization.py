@@ -0,0 +1,181 @@
+"""Variantes cuantizadas del modelo y su control de precisión.
+
+``manage.py quantize_model`` genera, a partir de keras_model.h5, modelos TFLite
+con cuantización de rango dinámico, float16 e int8 (calibrada con imágenes
+reales), los evalúa contra el modelo float32 sobre una carpeta etiquetada y
+anota el resultado en ``keras_model.variants.json``. El servidor solo sirve
+variantes aceptadas: ninguna puede perder más sensibilidad para melanoma de la
+tolerada, aunque sea más rápida.
+
+Este módulo no depende de Django.
+"""
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+from .backends import TFLiteBackend
+
+VARIANTS = ('dynamic', 'float16', 'int8')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def variant_path(keras_path, variant):
+    """keras_model.h5 -> keras_model.int8.tflite"""
+    root, _ = os.path.splitext(keras_path)
+    return f"{root}.{variant}.tflite"
+
+
+def manifest_path(keras_path):
+    root, _ = os.path.splitext(keras_path)
+    return f"{root}.variants.json"
+
+
+def convert_variant(model, variant, representative_batch=None):
+    """Bytes del modelo TFLite cuantizado en ``variant``"""
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == 'int8':
+        if representative_batch is None or not len(representative_batch):
+            raise ValueError('La cuantización int8 requiere imágenes de calibración')
+
+        def representative_dataset():
+            for image in representative_batch:
+                yield [image[np.newaxis, ...]]
+
+        # Pesos y activaciones en int8; la entrada y salida siguen en float32
+        # para que el preprocesamiento y el backend no cambien
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif variant != 'dynamic':
+        raise ValueError(f"Variante desconocida: {variant!r} (opciones: {', '.join(VARIANTS)})")
+    return converter.convert()
+
+
+def _class_index(folder_name, class_names):
+    """Índice de clase de una subcarpeta: '0', 'Maligno', '0 Maligno (...)'"""
+    name = folder_name.strip().lower()
+    for index, class_name in enumerate(class_names):
+        number, _, label = class_name.partition(' ')
+        if name in (number.lower(), class_name.lower(), label.lower()) or \
+                label.lower().split(' (')[0] == name:
+            return index
+    return None
+
+
+def labeled_files(folder, class_names):
+    """Imágenes de ``folder/<clase>/*`` con su índice de clase"""
+    files, labels = [], []
+    for entry in sorted(os.listdir(folder)):
+        path = os.path.join(folder, entry)
+        if not os.path.isdir(path):
+            continue
+        index = _class_index(entry, class_names)
+        if index is None:
+            raise ValueError(f"La carpeta {entry!r} no corresponde a ninguna clase de labels.txt")
+        for file in sorted(glob.glob(os.path.join(path, '*'))):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                files.append(file)
+                labels.append(index)
+    return files, np.asarray(labels, dtype=np.int64)
+
+
+def malignant_index(class_names):
+    for index, class_name in enumerate(class_names):
+        if 'Maligno' in class_name:
+            return index
+    return 0
+
+
+def evaluate(probs, labels, reference, positive_index):
+    """Precisión, sensibilidad de la clase ``positive_index`` y acuerdo con
+    las predicciones de referencia (float32)"""
+    predicted = np.argmax(probs, axis=1)
+    positives = labels == positive_index
+    metrics = {
+        'images': int(labels.size),
+        'accuracy': round(float(np.mean(predicted == labels)), 4) if labels.size else None,
+        'sensitivity': round(float(np.mean(predicted[positives] == positive_index)), 4) if positives.any() else None,
+    }
+    if reference is not None:
+        metrics['argmax_agreement'] = round(float(np.mean(predicted == np.argmax(reference, axis=1))), 4)
+        metrics['max_abs_diff'] = round(float(np.max(np.abs(probs - reference))), 6)
+    return metrics
+
+
+def time_predictions(backend, batch, repeats=3):
+    """Milisegundos por imagen (mejor de ``repeats``) prediciendo de a una"""
+    best = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for image in batch:
+            backend.predict(image[np.newaxis, ...])
+        elapsed = (time.perf_counter() - started) / max(1, len(batch))
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000.0, 3)
+
+
+def gate(metrics, baseline, max_accuracy_drop, max_sensitivity_drop, min_agreement):
+    """Motivos de rechazo de una variante frente al modelo float32 (vacío = aceptada)"""
+    reasons = []
+    if metrics.get('argmax_agreement') is not None and metrics['argmax_agreement'] < min_agreement:
+        reasons.append(f"concordancia {metrics['argmax_agreement']:.2%} < {min_agreement:.2%}")
+    for key, max_drop in (('accuracy', max_accuracy_drop), ('sensitivity', max_sensitivity_drop)):
+        if metrics.get(key) is None or baseline.get(key) is None:
+            continue
+        drop = baseline[key] - metrics[key]
+        if drop > max_drop + 1e-9:
+            reasons.append(f"{key} cae {drop:.2%} (máximo {max_drop:.2%})")
+    return reasons
+
+
+def run_variant(path, batch, labels, reference, positive_index, num_threads=None):
+    backend = TFLiteBackend(path, num_threads=num_threads).load()
+    probs = backend.predict(batch)
+    metrics = evaluate(probs, labels, reference, positive_index)
+    metrics['latency_ms'] = time_predictions(backend, batch[:32])
+    metrics['size_mb'] = round(os.path.getsize(path) / 1e6, 2)
+    return metrics
+
+
+def read_manifest(keras_path):
+    try:
+        with open(manifest_path(keras_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'variants': {}}
+
+
+def write_manifest(keras_path, manifest):
+    path = manifest_path(keras_path)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    return path
+
+
+def select_variant(keras_path, requested):
+    """Ruta del artefacto de la variante ``requested`` si fue aceptada.
+
+    ``'auto'`` elige la variante aceptada de menor latencia. Devuelve
+    (variante, ruta) o (None, None) si no hay ninguna utilizable, en cuyo caso
+    se sirve el modelo sin cuantizar.
+    """
+    variants = read_manifest(keras_path).get('variants', {})
+    accepted = {
+        name: info for name, info in variants.items()
+        if info.get('accepted') and os.path.isfile(variant_path(keras_path, name))
+    }
+    if requested == 'auto':
+        if not accepted:
+            return None, None
+        requested = min(accepted, key=lambda name: accepted[name].get('latency_ms') or float('inf'))
+    if requested not in accepted:
+        return None, None
+    return requested, variant_path(keras_path, requested)
@@ -0,0 +1,323 @@
+import logging
+import random
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .backends import get_backend
+from .batching import MicroBatcher
+from .model_store import desired_specs
+from .preprocessing import INPUT_SHAPE
+
+logger = logging.getLogger(__name__)
+
+
+def read_labels(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f.readlines()]
+
+
+def sampled(route_key, fraction):
+    """Decide si una petición entra en la muestra; estable por hash de imagen"""
+    if fraction <= 0:
+        return False
+    if fraction >= 1:
+        return True
+    if route_key:
+        return int(route_key[:8], 16) / 0xFFFFFFFF < fraction
+    return random.random() < fraction
+
+
+class LoadedModel:
+    """Una versión del modelo cargada: motor, micro-lotes y etiquetas.
+
+    Expone lo que usa ``diagnostics.pipeline`` (``model``, ``batcher``,
+    ``class_names``, ``predict_batch`` y ``model_version()``), así una petición
+    trabaja de principio a fin con la misma versión aunque otra la reemplace
+    mientras. Con ``embeddings`` cada pasada devuelve también la activación de
+    la penúltima capa.
+    """
+
+    def __init__(self, spec, backend_name, num_threads=None):
+        self.spec = spec
+        self.version = spec.version
+        self.backend_name = backend_name
+        self.num_threads = num_threads
+        self.model = None
+        self.batcher = None
+        self.class_names = []
+        self.embeddings = False
+        self.warm = False
+        self.load_seconds = None
+        self.warmup_seconds = None
+
+    def load(self):
+        started = time.perf_counter()
+        self.model = get_backend(self.backend_name, self.spec.model_path, num_threads=self.num_threads).load()
+        self.class_names = read_labels(self.spec.labels_path)
+        self.embeddings = self.model.supports_embeddings and getattr(settings, 'EMBEDDINGS_ENABLED', True)
+        self.batcher = MicroBatcher(
+            self.model.predict_with_embeddings if self.embeddings else self.model.predict,
+            max_batch_size=getattr(settings, 'INFERENCE_MAX_BATCH_SIZE', 16),
+            max_wait_ms=getattr(settings, 'INFERENCE_MAX_WAIT_MS', 10),
+        )
+        self.load_seconds = time.perf_counter() - started
+        logger.info("Modelo %s (%s, versión %s) cargado en %.2f s",
+                    self.spec.model_path, self.backend_name, self.version, self.load_seconds)
+        return self
+
+    def warm_up(self):
+        """Pasada ficticia para trazar el grafo antes de recibir tráfico"""
+        if not self.warm:
+            started = time.perf_counter()
+            self.predict_batch(np.zeros((1,) + INPUT_SHAPE, dtype=np.float32))
+            self.batcher.start()
+            self.warmup_seconds = time.perf_counter() - started
+            self.warm = True
+            logger.info("Versión %s precalentada en %.2f s", self.version, self.warmup_seconds)
+        return self
+
+    def predict_batch(self, batch):
+        """(probabilidades, embeddings o None) de un lote en una sola pasada"""
+        if self.embeddings:
+            return self.model.predict_with_embeddings(batch)
+        return self.model.predict(batch), None
+
+    def split(self, output):
+        """Separa la salida del micro-lote en (probabilidades, embedding o None)"""
+        if self.embeddings:
+            return output
+        return output, None
+
+    def model_version(self):
+        return self.version
+
+    def retire(self):
+        # Las imágenes ya encoladas se terminan de procesar
+        if self.batcher is not None:
+            self.batcher.stop()
+
+
+class ModelRegistry:
+    """Carga perezosa y recarga en caliente del modelo.
+
+    Nada de TensorFlow se importa hasta la primera predicción o hasta que se
+    llama explícitamente a ``warm_up``, así los comandos de ``manage.py`` y las
+    migraciones arrancan sin pagar la deserialización del modelo.
+
+    Cada ``reload_interval`` segundos se compara la versión servida con
+    ``diagnostics.model_store`` (registry.json o la huella de MODEL_PATH). Si
+    cambió, la nueva versión se carga y precalienta en un hilo aparte mientras
+    la anterior sigue atendiendo, y luego se reemplaza con una sola
+    asignación; las peticiones en curso terminan con la versión que tomaron.
+    """
+
+    def __init__(self, backend_name='keras', num_threads=None, reload_interval=5.0):
+        self.backend_name = backend_name
+        self.num_threads = num_threads
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._active = None
+        self._candidate = None
+        self._candidate_mode = None
+        self._candidate_fraction = 0.0
+        self._class_names = None
+        self._next_check = 0.0
+        self._reloading = False
+        self._reload_lock = threading.Lock()
+        self.error = None
+
+    def _new_model(self, spec):
+        return LoadedModel(spec, self.backend_name, num_threads=self.num_threads).load()
+
+    def ensure_loaded(self):
+        """Carga el modelo una sola vez; devuelve False si no se pudo cargar"""
+        if self._active is not None:
+            self._check_for_update()
+            return True
+        with self._lock:
+            if self._active is None:
+                try:
+                    desired = desired_specs(self.backend_name)
+                    self._active = self._new_model(desired[0])
+                    self.error = None
+                except Exception as e:
+                    self.error = str(e)
+                    logger.exception("Error cargando modelo: %s", e)
+                    return False
+                self._next_check = time.monotonic() + self.reload_interval
+                if desired[1] is not None:
+                    self._start_reload(desired)
+        return True
+
+    def _check_for_update(self, force=False):
+        now = time.monotonic()
+        if self._reloading or (not force and now < self._next_check):
+            return
+        self._next_check = now + self.reload_interval
+        try:
+            desired = desired_specs(self.backend_name)
+        except Exception as e:
+            logger.warning("No se pudo leer el registro de versiones: %s", e)
+            return
+        active, candidate, mode, fraction = desired
+        current_candidate = self._candidate.version if self._candidate is not None else None
+        if active.version == self._active.version and \
+                (candidate.version if candidate else None) == current_candidate:
+            self._candidate_mode, self._candidate_fraction = mode, fraction
+            return
+        self._start_reload(desired)
+
+    def _start_reload(self, desired):
+        with self._reload_lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, args=(desired,), name='diagnostics-reload', daemon=True).start()
+
+    def _reload(self, desired):
+        active_spec, candidate_spec, mode, fraction = desired
+        try:
+            loaded = {m.version: m for m in (self._active, self._candidate) if m is not None}
+
+            def obtain(spec):
+                model = loaded.get(spec.version) or self._new_model(spec)
+                return model.warm_up()
+
+            active = obtain(active_spec)
+            candidate = obtain(candidate_spec) if candidate_spec is not None else None
+            with self._lock:
+                previous = [self._active, self._candidate]
+                self._active, self._candidate = active, candidate
+                self._candidate_mode, self._candidate_fraction = mode, fraction
+                self._class_names = None
+            for model in previous:
+                if model is not None and model not in (active, candidate):
+                    model.retire()
+            self.error = None
+            logger.info("Versión activa %s%s", active.version,
+                        f", candidata {candidate.version} ({mode} {fraction:.0%})" if candidate else '')
+        except Exception as e:
+            self.error = str(e)
+            logger.exception("Error recargando el modelo: %s", e)
+        finally:
+            self._reloading = False
+
+    def reload(self):
+        """Fuerza la comprobación de versión (la carga sigue siendo en segundo plano)"""
+        if self.ensure_loaded():
+            self._check_for_update(force=True)
+
+    def warm_up(self):
+        """Carga el modelo y ejecuta una pasada ficticia para trazar el grafo"""
+        if not self.ensure_loaded():
+            return False
+        self._active.warm_up()
+        return True
+
+    def warm_up_in_background(self):
+        thread = threading.Thread(target=self.warm_up, name='diagnostics-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    def current(self, route_key=None):
+        """Versión que atiende una petición: la activa, o la candidata en modo
+        canary para la fracción de tráfico configurada"""
+        self.ensure_loaded()
+        candidate = self._candidate
+        if candidate is not None and self._candidate_mode == 'canary' and \
+                sampled(route_key, self._candidate_fraction):
+            return candidate
+        return self._active
+
+    def shadow_for(self, route_key=None):
+        """Candidata en modo shadow si la petición entra en la muestra, o None"""
+        candidate = self._candidate
+        if candidate is not None and self._candidate_mode == 'shadow' and \
+                sampled(route_key, self._candidate_fraction):
+            return candidate
+        return None
+
+    def for_version(self, version):
+        """Versión cargada (activa o candidata) con ese nombre, o None"""
+        for model in (self._active, self._candidate):
+            if model is not None and model.version == version:
+                return model
+        return None
+
+    @property
+    def model(self):
+        """Motor de inferencia de la versión activa (ver ``diagnostics.backends``)"""
+        self.ensure_loaded()
+        return self._active.model if self._active is not None else None
+
+    @property
+    def class_names(self):
+        """Etiquetas de la versión activa; se leen sin cargar el modelo"""
+        if self._active is not None:
+            return self._active.class_names
+        if self._class_names is None:
+            try:
+                self._class_names = read_labels(desired_specs(self.backend_name)[0].labels_path)
+            except Exception as e:
+                logger.error("Error cargando labels: %s", e)
+                return []
+        return self._class_names
+
+    @property
+    def batcher(self):
+        self.ensure_loaded()
+        return self._active.batcher if self._active is not None else None
+
+    def model_version(self):
+        """Versión activa (nombre en el registro o huella de los archivos)"""
+        if self._active is not None:
+            return self._active.version
+        return desired_specs(self.backend_name)[0].version
+
+    @property
+    def is_loaded(self):
+        return self._active is not None
+
+    @property
+    def is_ready(self):
+        return self._active is not None and self._active.warm
+
+    def status(self):
+        active = self._active
+        candidate = self._candidate
+        return {
+            'backend': self.backend_name,
+            'version': active.version if active is not None else None,
+            'loaded': self.is_loaded,
+            'ready': self.is_ready,
+            'error': self.error,
+            'load_seconds': active.load_seconds if active is not None else None,
+            'warmup_seconds': active.warmup_seconds if active is not None else None,
+            'reloading': self._reloading,
+            'candidate': {
+                'version': candidate.version,
+                'mode': self._candidate_mode,
+                'fraction': self._candidate_fraction,
+            } if candidate is not None else None,
+        }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Devuelve el registro compartido del proceso (sin cargar el modelo)"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry(
+                    backend_name=getattr(settings, 'INFERENCE_BACKEND', 'keras'),
+                    num_threads=getattr(settings, 'INFERENCE_NUM_THREADS', None),
+                    reload_interval=getattr(settings, 'MODEL_RELOAD_INTERVAL', 5.0),
+                )
+    return _registry
@@ -0,0 +1,144 @@
+"""Versiones reducidas de cada imagen, generadas una vez al guardarla.
+
+``DIAGNOSTICS_RENDITIONS`` define el conjunto fijo (miniatura, vista media,
+WebP...). Tras cada predicción un pool de hilos decodifica el original una
+sola vez, encadena los redimensionados de mayor a menor y guarda cada versión
+como derivado del blob; luego las anota en ``DiagnosticHistory.renditions``
+de todas las filas con esa imagen. La respuesta de la predicción no espera.
+Si la cola está llena (``DIAGNOSTICS_RENDITION_MAX_PENDING``) la imagen se
+omite; esas filas y las anteriores se completan con ``manage.py
+generate_renditions``.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from PIL import Image, features
+
+from .models import DiagnosticHistory
+from .storage import get_blob_store
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'AVIF': 'avif', 'PNG': 'png'}
+# Formatos que dependen de cómo se compiló Pillow
+OPTIONAL_CODECS = {'WEBP': 'webp', 'AVIF': 'avif'}
+DEFAULT_RENDITIONS = {
+    'thumb': (128, 'JPEG', 80),
+    'medium': (512, 'JPEG', 85),
+    'medium_webp': (512, 'WEBP', 80),
+}
+
+
+def rendition_specs():
+    """{nombre: (lado máximo, formato, calidad)} que este Pillow puede codificar"""
+    specs = getattr(settings, 'DIAGNOSTICS_RENDITIONS', DEFAULT_RENDITIONS)
+    return {
+        name: spec for name, spec in specs.items()
+        if spec[1] not in OPTIONAL_CODECS or features.check(OPTIONAL_CODECS[spec[1]])
+    }
+
+
+def rendition_name(name, image_format):
+    return f"{name}.{EXTENSIONS.get(image_format, image_format.lower())}"
+
+
+def render_renditions(data, specs):
+    """Codifica todas las versiones de una imagen decodificándola una sola vez.
+
+    Devuelve {nombre: (bytes, ancho, alto)}. Cada tamaño se obtiene del
+    anterior (mayor o igual), así que solo el primero parte del original.
+    """
+    image = Image.open(io.BytesIO(data))
+    largest = max(size for size, _, _ in specs.values())
+    if image.format == 'JPEG':
+        image.draft('RGB', (largest, largest))
+    image = image.convert('RGB')
+
+    results = {}
+    current = image
+    for name, (size, image_format, quality) in sorted(specs.items(), key=lambda item: -item[1][0]):
+        if max(current.size) > size:
+            current = current.copy()
+            current.thumbnail((size, size), Image.Resampling.LANCZOS)
+        buffered = io.BytesIO()
+        options = {'quality': quality}
+        if image_format == 'JPEG':
+            options.update(optimize=True, progressive=True)
+        elif image_format == 'WEBP':
+            options.update(method=4)
+        current.save(buffered, format=image_format, **options)
+        results[name] = (buffered.getvalue(), current.width, current.height)
+    return results
+
+
+def ensure_renditions(key, specs=None):
+    """Genera las versiones que falten de ``key``; devuelve lo que se anota en la fila"""
+    store = get_blob_store()
+    specs = specs if specs is not None else rendition_specs()
+    names = {name: rendition_name(name, image_format) for name, (_, image_format, _) in specs.items()}
+    missing = {name: spec for name, spec in specs.items() if not store.has_derived(key, names[name])}
+
+    rendered = render_renditions(store.read(key), missing) if missing else {}
+    info = {}
+    for name, (_, image_format, _) in specs.items():
+        if name in rendered:
+            data, width, height = rendered[name]
+            store.save_derived(key, names[name], data)
+            size = len(data)
+        else:
+            with store.open_derived(key, names[name]) as f:
+                width, height = Image.open(f).size
+            size = store.storage.size(store.derived_path(key, names[name]))
+        info[name] = {'format': image_format, 'width': width, 'height': height, 'bytes': size}
+    return info
+
+
+def generate_renditions(key):
+    """Genera y anota las versiones de una imagen en todas sus filas"""
+    info = ensure_renditions(key)
+    DiagnosticHistory.objects.filter(image_key=key).update(renditions=info)
+    return info
+
+
+_executor = None
+_executor_lock = threading.Lock()
+# Imágenes esperando su turno; si el pool no da abasto se omiten
+_slots = None
+
+
+def _generate(key):
+    close_old_connections()
+    try:
+        generate_renditions(key)
+    except Exception:
+        logger.exception("Error generando las versiones de la imagen %s", key)
+    finally:
+        _slots.release()
+        close_old_connections()
+
+
+def renditions_in_background(diagnostics):
+    """Encola la generación para las imágenes de diagnósticos recién guardados"""
+    global _executor, _slots
+    keys = {diagnostic.image_key for diagnostic in diagnostics if diagnostic.image_key}
+    if not keys or not rendition_specs():
+        return
+    with _executor_lock:
+        if _executor is None:
+            _slots = threading.BoundedSemaphore(getattr(settings, 'DIAGNOSTICS_RENDITION_MAX_PENDING', 256))
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'DIAGNOSTICS_RENDITION_WORKERS', 2),
+                thread_name_prefix='diagnostics-renditions',
+            )
+    skipped = 0
+    for key in keys:
+        if _slots.acquire(blocking=False):
+            _executor.submit(_generate, key)
+        else:
+            skipped += 1
+    if skipped:
+        logger.warning("Cola de versiones reducidas llena: %d imágenes quedan para generate_renditions", skipped)
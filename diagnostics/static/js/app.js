@@ -17,6 +17,7 @@
   let probChartId = null;
   let classDistChart = null;
   let confidenceLineChart = null;
+  let historyCursor = null;
 
   // Inicializar aplicación del dashboard
   function initDashboard() {
@@ -103,6 +104,14 @@
       });
     }
 
+    // Botón para cargar la siguiente página del historial
+    const loadMoreBtn = qs('#loadMoreHistory');
+    if (loadMoreBtn) {
+      loadMoreBtn.addEventListener('click', function () {
+        updateHistoryTable(historyCursor);
+      });
+    }
+
     // Función para mostrar vistas
     function showView(id) {
       console.log('👀 Mostrando vista:', id);
@@ -504,23 +513,26 @@
 
   // Verificar si hay resultados para mostrar
   function checkEnableResults() {
-    loadDiagnostics().then(diagnostics => {
-      if (diagnostics.length === 0) {
+    loadStatistics().then(stats => {
+      if (stats && stats.total === 0) {
         alert('ℹ️ No hay diagnósticos previos. Primero haga un diagnóstico.');
         showView('diagnose');
       }
     });
   }
 
-  // Actualizar tabla de historial
-  async function updateHistoryTable() {
+  // Actualizar tabla de historial (paginada: con cursor agrega la siguiente página)
+  async function updateHistoryTable(cursor = null) {
     const tbody = qs('#historyTable tbody');
     if (!tbody) return;
 
-    tbody.innerHTML = '';
+    if (!cursor) tbody.innerHTML = '';
 
     try {
-      const response = await fetch('/api/diagnostics/', {
+      const params = new URLSearchParams({ limit: 50 });
+      if (cursor) params.set('cursor', cursor);
+
+      const response = await fetch(`/api/diagnostics/?${params}`, {
         headers: {
           'Authorization': `Bearer ${token}`,
           'Content-Type': 'application/json'
@@ -528,9 +540,14 @@
       });
 
       if (response.ok) {
-        const diagnostics = await response.json();
+        const page = await response.json();
+        const diagnostics = page.results;
         console.log('📋 Diagnósticos cargados:', diagnostics.length);
 
+        historyCursor = page.next_cursor;
+        const loadMoreBtn = qs('#loadMoreHistory');
+        if (loadMoreBtn) loadMoreBtn.classList.toggle('hidden', !historyCursor);
+
         diagnostics.forEach(r => {
           const tr = document.createElement('tr');
 
@@ -557,12 +574,9 @@
             <td class="${riskClass}">${riskDisplay}<br>≈ ${Math.round(r.risk_level || 0)}%</td>
             <td><button class="view-id" data-id="${r.id || ''}">Ver</button></td>
           `;
-          tbody.appendChild(tr);
-        });
 
-        // Configurar botones de ver
-        qsa('.view-id').forEach(btn => {
-          btn.addEventListener('click', async (e) => {
+          // Configurar botón de ver
+          tr.querySelector('.view-id').addEventListener('click', async (e) => {
             const id = e.target.dataset.id;
             if (id) {
               qs('#queryId').value = id;
@@ -570,6 +584,8 @@
               showView('results');
             }
           });
+
+          tbody.appendChild(tr);
         });
 
       } else {
@@ -611,6 +627,8 @@
     if (showId) showId.textContent = diagnostic.id ? diagnostic.id.slice(-8) : 'N/A';
     if (resultForId) resultForId.classList.remove('hidden');
 
+    loadDiagnosticImage(diagnostic);
+
     // Destruir gráfico anterior
     if (probChartId) {
       probChartId.destroy();
@@ -673,30 +691,62 @@
     }
   }
 
-  // Cargar diagnósticos
-  async function loadDiagnostics() {
+  // Cargar imagen del diagnóstico (el navegador la cachea por ETag): la
+  // versión WebP generada al guardarla o, si aún no existe, la miniatura
+  async function loadDiagnosticImage(diagnostic) {
+    const detailImage = qs('#detailImage');
+    if (!detailImage) return;
+
+    if (detailImage.src.startsWith('blob:')) {
+      URL.revokeObjectURL(detailImage.src);
+    }
+    detailImage.src = '';
+    detailImage.classList.add('hidden');
+    if (!diagnostic.image_url) return;
+
+    const renditions = diagnostic.renditions || {};
+    const rendition = renditions.medium_webp || renditions.medium;
+    const imageUrl = rendition ? rendition.url : `${diagnostic.image_url}?size=512`;
+
     try {
-      const response = await fetch('/api/diagnostics/', {
+      const response = await fetch(imageUrl, {
         headers: {
-          'Authorization': `Bearer ${token}`,
-          'Content-Type': 'application/json'
+          'Authorization': `Bearer ${token}`
         }
       });
 
       if (response.ok) {
-        return await response.json();
+        const blob = await response.blob();
+        detailImage.src = URL.createObjectURL(blob);
+        detailImage.classList.remove('hidden');
       }
-      return [];
     } catch (error) {
-      console.error('❌ Error cargando diagnósticos:', error);
-      return [];
+      console.error('❌ Error cargando imagen:', error);
+    }
+  }
+
+  // Cargar estadísticas agregadas (contadores materializados en el servidor)
+  async function loadStatistics() {
+    try {
+      const response = await fetch('/api/diagnostics/stats/', {
+        headers: {
+          'Authorization': `Bearer ${token}`,
+          'Content-Type': 'application/json'
+        }
+      });
+
+      if (!response.ok) return null;
+      return await response.json();
+    } catch (error) {
+      console.error('❌ Error cargando estadísticas:', error);
+      return null;
     }
   }
 
   // Dibujar gráficos agregados
   function drawAggregatedCharts() {
-    loadDiagnostics().then(diagnostics => {
-      if (diagnostics.length === 0) {
+    loadStatistics().then(stats => {
+      if (!stats || stats.total === 0) {
         console.log('ℹ️ No hay datos para gráficos agregados');
         return;
       }
@@ -704,13 +754,7 @@
       console.log('📈 Dibujando gráficos agregados...');
 
       // Distribución de clases
-      const counts = {};
-      diagnostics.forEach(r => {
-        const className = r.diagnosis?.includes('Maligno') ? 'Maligno' :
-          r.diagnosis?.includes('Benigno') ? 'Benigno' : 'Indeterminado';
-        counts[className] = (counts[className] || 0) + 1;
-      });
-
+      const counts = stats.by_class;
       const labels = Object.keys(counts);
       const data = labels.map(l => counts[l]);
       const backgroundColors = labels.map(l => {
@@ -742,16 +786,9 @@
         });
       }
 
-      // Evolución del riesgo
-      const sorted = diagnostics.slice().sort((a, b) => new Date(a.date) - new Date(b.date));
-      const timeline = sorted.map(r => new Date(r.date).toLocaleDateString());
-
-      const riskLevels = sorted.map(r => {
-        const conf = r.risk_level || 0;
-        if (conf >= 80) return 1; // Bajo riesgo
-        if (conf >= 50) return 2; // Riesgo intermedio
-        return 3; // Alto riesgo
-      });
+      // Evolución del riesgo (promedio diario: 1 bajo, 2 intermedio, 3 alto)
+      const timeline = stats.daily.map(d => new Date(`${d.date}T00:00:00`).toLocaleDateString());
+      const riskLevels = stats.daily.map(d => d.average_risk_level);
 
       const confidenceLineCanvas = qs('#confidenceLine');
       if (confidenceLineCanvas) {
@@ -0,0 +1,156 @@
+"""Estadísticas materializadas del historial.
+
+Cada diagnóstico suma 1 a la fila (paciente, día, clase, decil de confianza)
+de ``DiagnosticStats``. Las consultas del tablero agregan esas filas, cuyo
+número depende de los días con actividad y no del total de diagnósticos.
+
+``post_save`` y ``post_delete`` mantienen los contadores para altas y bajas
+individuales; ``bulk_create`` no emite señales, así que quien lo use debe
+llamar a ``record_diagnostics``.
+"""
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .history import parse_bound
+from .models import DiagnosticHistory, DiagnosticStats
+from .pipeline import get_simplified_class_name
+
+RISK_BUCKETS = 10
+MAX_PATIENTS = 100
+# Mismos umbrales que get_confidence_display: >= 80 bajo, >= 50 intermedio
+RISK_LEVELS = (('low', 8), ('intermediate', 5), ('high', 0))
+RISK_LEVEL_SCORES = {'low': 1, 'intermediate': 2, 'high': 3}
+
+
+def risk_bucket(risk_level):
+    return max(0, min(int(float(risk_level) // 10), RISK_BUCKETS - 1))
+
+
+def risk_level_name(bucket):
+    for name, lowest_bucket in RISK_LEVELS:
+        if bucket >= lowest_bucket:
+            return name
+
+
+def stats_key(diagnostic):
+    return (
+        diagnostic.user_id,
+        timezone.localdate(diagnostic.diagnosis_date),
+        get_simplified_class_name(diagnostic.diagnosis),
+        risk_bucket(diagnostic.risk_level),
+    )
+
+
+def apply_increments(increments):
+    """Suma ``{(user_id, day, clase, decil): delta}`` a los contadores"""
+    for (user_id, day, diagnosis_class, bucket), delta in increments.items():
+        if not delta:
+            continue
+        key = {'user_id': user_id, 'day': day, 'diagnosis_class': diagnosis_class, 'risk_bucket': bucket}
+        if DiagnosticStats.objects.filter(**key).update(count=F('count') + delta) or delta < 0:
+            continue
+        try:
+            # Savepoint: si otro proceso creó la fila primero, se actualiza
+            with transaction.atomic():
+                DiagnosticStats.objects.create(count=delta, **key)
+        except IntegrityError:
+            DiagnosticStats.objects.filter(**key).update(count=F('count') + delta)
+
+
+def record_diagnostics(diagnostics, sign=1):
+    """Registra (o descuenta con ``sign=-1``) diagnósticos ya guardados"""
+    apply_increments(Counter({key: sign * count for key, count in Counter(map(stats_key, diagnostics)).items()}))
+
+
+@receiver(post_save, sender=DiagnosticHistory, dispatch_uid='diagnostic_stats_insert')
+def _diagnostic_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_diagnostics([instance])
+
+
+@receiver(post_delete, sender=DiagnosticHistory, dispatch_uid='diagnostic_stats_delete')
+def _diagnostic_deleted(sender, instance, **kwargs):
+    record_diagnostics([instance], sign=-1)
+
+
+def visible_stats(user):
+    """Médicos ven las estadísticas globales, pacientes solo las suyas"""
+    if user.role == 'doctor':
+        return DiagnosticStats.objects.all()
+    return DiagnosticStats.objects.filter(user=user)
+
+
+def filter_stats(queryset, params, user):
+    """``patient`` (número de identificación, solo médicos), ``date_from`` / ``date_to``"""
+    patient = params.get('patient')
+    if patient and user.role == 'doctor':
+        queryset = queryset.filter(user__identification_number=patient)
+    if params.get('date_from'):
+        queryset = queryset.filter(day__gte=timezone.localdate(parse_bound(params['date_from'])))
+    if params.get('date_to'):
+        queryset = queryset.filter(day__lte=timezone.localdate(parse_bound(params['date_to'], end_of_day=True)))
+    return queryset
+
+
+def summarize(queryset, include_patients=False):
+    """Totales por clase, histograma de confianza, serie diaria y por paciente"""
+    rows = queryset.values('day', 'diagnosis_class', 'risk_bucket').annotate(total=Sum('count')).order_by()
+    by_class = Counter()
+    histogram = [0] * RISK_BUCKETS
+    levels = Counter()
+    daily = defaultdict(lambda: {'count': 0, 'by_class': Counter(), 'risk_score': 0})
+    for row in rows:
+        total = row['total']
+        if not total:
+            continue
+        level = risk_level_name(row['risk_bucket'])
+        by_class[row['diagnosis_class']] += total
+        histogram[row['risk_bucket']] += total
+        levels[level] += total
+        day = daily[row['day']]
+        day['count'] += total
+        day['by_class'][row['diagnosis_class']] += total
+        day['risk_score'] += RISK_LEVEL_SCORES[level] * total
+
+    result = {
+        'total': sum(by_class.values()),
+        'by_class': dict(by_class),
+        'risk_levels': {name: levels[name] for name, _ in RISK_LEVELS},
+        'risk_histogram': [
+            {'from': i * 10, 'to': (i + 1) * 10, 'count': count} for i, count in enumerate(histogram)
+        ],
+        'daily': [
+            {
+                'date': day.isoformat(),
+                'count': values['count'],
+                'by_class': dict(values['by_class']),
+                # 1 = bajo, 2 = intermedio, 3 = alto (promedio del día)
+                'average_risk_level': round(values['risk_score'] / values['count'], 3),
+            }
+            for day, values in sorted(daily.items())
+        ],
+    }
+    if include_patients:
+        patients = queryset.values(
+            'user__identification_number', 'user__first_name', 'user__last_name'
+        ).annotate(total=Sum('count')).order_by('-total')[:MAX_PATIENTS]
+        result['patients'] = [
+            {
+                'identification_number': row['user__identification_number'],
+                'patient_name': f"{row['user__first_name']} {row['user__last_name']}",
+                'count': row['total'],
+            }
+            for row in patients if row['total']
+        ]
+    return result
+
+
+def diagnostic_stats(user, params):
+    """Estadísticas visibles para ``user``; lanza InvalidQuery con filtros inválidos"""
+    queryset = filter_stats(visible_stats(user), params, user)
+    return summarize(queryset, include_patients=user.role == 'doctor')
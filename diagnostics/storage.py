@@ -0,0 +1,98 @@
+"""Almacén de imágenes direccionado por contenido.
+
+Los bytes originales de cada imagen se guardan una sola vez bajo su SHA-256
+(``ab/cd/abcd…``) en cualquier backend de almacenamiento de Django; la base de
+datos solo conserva la clave. Subir dos veces la misma foto no duplica nada.
+"""
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.module_loading import import_string
+
+
+def content_key(data):
+    """Clave de contenido: SHA-256 en hexadecimal"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    def __init__(self, storage):
+        self.storage = storage
+
+    @staticmethod
+    def key_path(key):
+        return f"{key[:2]}/{key[2:4]}/{key}"
+
+    def exists(self, key):
+        return self.storage.exists(self.key_path(key))
+
+    def save(self, data, key=None):
+        """Guarda ``data`` si no existe todavía y devuelve su clave"""
+        key = key or content_key(data)
+        path = self.key_path(key)
+        if not self.storage.exists(path):
+            saved = self.storage.save(path, ContentFile(data))
+            if saved != path:
+                # Otra petición escribió el mismo contenido en paralelo: el
+                # backend renombró la copia, que sobra
+                self.storage.delete(saved)
+        return key
+
+    def open(self, key, mode='rb'):
+        return self.storage.open(self.key_path(key), mode)
+
+    def read(self, key):
+        with self.open(key) as f:
+            return f.read()
+
+    def size(self, key):
+        return self.storage.size(self.key_path(key))
+
+    def delete(self, key):
+        self.storage.delete(self.key_path(key))
+
+    # Derivados (miniaturas, etc.) guardados junto al original bajo otra ruta
+    @staticmethod
+    def derived_path(key, name):
+        return f"derived/{key[:2]}/{key}/{name}"
+
+    def has_derived(self, key, name):
+        return self.storage.exists(self.derived_path(key, name))
+
+    def save_derived(self, key, name, data):
+        path = self.derived_path(key, name)
+        if not self.storage.exists(path):
+            saved = self.storage.save(path, ContentFile(data))
+            if saved != path:
+                self.storage.delete(saved)
+        return path
+
+    def open_derived(self, key, name, mode='rb'):
+        return self.storage.open(self.derived_path(key, name), mode)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """Almacén configurado en ``DIAGNOSTICS_BLOB_STORAGE`` (por defecto MEDIA_ROOT)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = getattr(settings, 'DIAGNOSTICS_BLOB_STORAGE', None)
+                options = getattr(settings, 'DIAGNOSTICS_BLOB_STORAGE_OPTIONS', {})
+                if backend:
+                    storage = import_string(backend)(**options)
+                else:
+                    storage = FileSystemStorage(
+                        location=os.path.join(settings.MEDIA_ROOT, 'diagnostics', 'blobs'),
+                        **options,
+                    )
+                _store = BlobStore(storage)
+    return _store
@@ -0,0 +1,399 @@
+import base64
+import io
+import os
+import struct
+import tempfile
+import threading
+import uuid
+import zipfile
+from datetime import datetime, timezone
+import zlib
+
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import MemoryFileUploadHandler
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from users.models import User
+
+from .async_views import InferenceGate
+from .batching import MicroBatcher
+from .cache import PredictionCache
+from .history import InvalidQuery, decode_cursor, encode_cursor, paginate
+from .jobs import stored_prediction
+from .management.commands.convert_model import load_image_set
+from .models import DiagnosticHistory, DiagnosticStats
+from .pipeline import _lookup, _store, predict_many
+from .preprocessing import INPUT_SHAPE, preprocess, preprocess_batch
+from .quantization import evaluate, gate
+from .stats import record_diagnostics, risk_bucket, stats_key, summarize
+from .uploads import ImageUploadHandler, UploadTooLarge, read_archive, read_batch_upload, upload_error
+
+
+def image_bytes(color, size=(64, 48), image_format='PNG'):
+    buffered = io.BytesIO()
+    Image.new('RGB', size, color).save(buffered, format=image_format)
+    return buffered.getvalue()
+
+
+def create_patient(identification_number='123'):
+    return User.objects.create_user(
+        email=f'{identification_number}@example.com', password='Passw0rd!', first_name='Ana',
+        last_name='Gómez', identification_number=identification_number, date_of_birth='1990-01-01',
+    )
+
+
+def create_diagnostic(user, diagnosis='Melanoma', risk_level=85):
+    return DiagnosticHistory.objects.create(
+        user=user, patient_name=user.full_name, identification_number=user.identification_number,
+        diagnosis=diagnosis, risk_level=risk_level, probabilities=[0.85, 0.15],
+    )
+
+
+def base64_text(text):
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def png_header(width, height):
+    """PNG válido hasta la cabecera que declara ``width`` x ``height`` (sin los píxeles)"""
+    def chunk(kind, data):
+        return struct.pack('!I', len(data)) + kind + data + struct.pack('!I', zlib.crc32(kind + data))
+    header = struct.pack('!IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(b'\0' * 100)) + chunk(b'IEND', b'')
+
+
+class PreprocessBatchTests(SimpleTestCase):
+    def test_batches_are_not_aliased(self):
+        first = preprocess_batch([io.BytesIO(image_bytes((255, 0, 0)))])
+        expected = first.copy()
+        second = preprocess_batch([io.BytesIO(image_bytes((0, 0, 255)))] * 2)
+        self.assertFalse(np.shares_memory(first, second))
+        np.testing.assert_array_equal(first, expected)
+
+    def test_not_aliased_with_request_buffer(self):
+        batch = preprocess_batch([io.BytesIO(image_bytes((255, 255, 255)))])
+        _, single = preprocess(io.BytesIO(image_bytes((0, 0, 0))))
+        self.assertFalse(np.shares_memory(batch, single))
+        self.assertEqual(batch.shape, (1,) + INPUT_SHAPE)
+        self.assertTrue(np.allclose(batch, 1.0))
+
+    def test_writes_into_out(self):
+        out = np.zeros((2,) + INPUT_SHAPE, dtype=np.float32)
+        result = preprocess_batch([io.BytesIO(image_bytes((0, 0, 0)))] * 2, out=out)
+        self.assertIs(result, out)
+        self.assertTrue(np.allclose(out, -1.0))
+
+
+class QuantizationGateTests(SimpleTestCase):
+    def test_evaluation_batch_survives_calibration_load(self):
+        with tempfile.TemporaryDirectory() as folder:
+            paths = []
+            for name, color in (('eval.png', (255, 0, 0)), ('calibration.png', (0, 0, 255))):
+                paths.append(os.path.join(folder, name))
+                with open(paths[-1], 'wb') as f:
+                    f.write(image_bytes(color))
+            batch = preprocess_batch(paths[:1])
+            expected = batch.copy()
+            _, calibration = load_image_set(paths[1:])
+        np.testing.assert_array_equal(batch, expected)
+        self.assertFalse(np.allclose(batch, calibration))
+
+    def test_evaluate_against_reference(self):
+        labels = np.array([0, 0, 1, 1])
+        reference = np.array([[0.9, 0.1], [0.8, 0.2], [0.3, 0.7], [0.4, 0.6]])
+        probs = np.array([[0.9, 0.1], [0.4, 0.6], [0.3, 0.7], [0.4, 0.6]])
+        metrics = evaluate(probs, labels, reference, positive_index=0)
+        self.assertEqual(metrics['accuracy'], 0.75)
+        self.assertEqual(metrics['sensitivity'], 0.5)
+        self.assertEqual(metrics['argmax_agreement'], 0.75)
+
+    def test_gate_rejects_sensitivity_drop(self):
+        baseline = {'accuracy': 0.9, 'sensitivity': 0.95}
+        accepted = {'accuracy': 0.89, 'sensitivity': 0.95, 'argmax_agreement': 0.99}
+        self.assertEqual(gate(accepted, baseline, 0.02, 0.01, 0.97), [])
+        rejected = {'accuracy': 0.9, 'sensitivity': 0.9, 'argmax_agreement': 0.99}
+        reasons = gate(rejected, baseline, 0.02, 0.01, 0.97)
+        self.assertEqual(len(reasons), 1)
+        self.assertIn('sensitivity', reasons[0])
+        self.assertEqual(len(gate({**accepted, 'argmax_agreement': 0.5}, baseline, 0.02, 0.01, 0.97)), 1)
+
+
+class PredictionCacheTests(SimpleTestCase):
+    def test_versions_coexist(self):
+        cache = PredictionCache(max_entries=10)
+        cache.set('v1', 'abc', [0.9, 0.1])
+        cache.set('v2', 'abc', [0.2, 0.8])
+        self.assertEqual(cache.get('v1', 'abc'), [0.9, 0.1])
+        self.assertEqual(cache.get('v2', 'abc'), [0.2, 0.8])
+        self.assertIsNone(cache.get('v3', 'abc'))
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = PredictionCache(max_entries=2)
+        cache.set('v1', 'a', [1.0])
+        cache.set('v1', 'b', [2.0])
+        cache.get('v1', 'a')
+        cache.set('v1', 'c', [3.0])
+        self.assertIsNone(cache.get('v1', 'b'))
+        self.assertEqual(cache.get('v1', 'a'), [1.0])
+        self.assertEqual(cache.get('v1', 'c'), [3.0])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_probabilities_and_embedding_share_one_entry(self):
+        cache = PredictionCache(max_entries=10)
+        model = MeanModel()
+        model.embeddings = True
+        _store(cache, model, 'abc', [0.7, 0.3], b'vector')
+        self.assertEqual(_lookup(cache, model, 'abc'), ([0.7, 0.3], b'vector'))
+        self.assertEqual(_lookup(cache, model, 'other'), (None, None))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.stats()['entries'], 1)
+
+    def test_entry_without_embedding_is_a_miss_when_embeddings_are_on(self):
+        cache = PredictionCache(max_entries=10)
+        model = MeanModel()
+        _store(cache, model, 'abc', [0.7, 0.3], None)
+        self.assertEqual(_lookup(cache, model, 'abc'), ([0.7, 0.3], None))
+        model.embeddings = True
+        self.assertEqual(_lookup(cache, model, 'abc'), (None, None))
+
+
+@override_settings(IMAGE_UPLOAD_MAX_PIXELS=1_000_000)
+class BatchUploadTests(SimpleTestCase):
+    def parsed(self, data):
+        request = RequestFactory().post('/api/predict/batch/', data)
+        request.upload_handlers = [ImageUploadHandler(request), MemoryFileUploadHandler(request)]
+        request.FILES
+        return request
+
+    def test_rejected_image_does_not_stop_the_batch(self):
+        request = self.parsed({'images': [
+            SimpleUploadedFile('ok.png', image_bytes((255, 0, 0))),
+            SimpleUploadedFile('bomb.png', png_header(20000, 20000)),
+            SimpleUploadedFile('notes.png', b'not an image at all' * 10),
+            SimpleUploadedFile('last.jpg', image_bytes((0, 255, 0), image_format='JPEG')),
+        ]})
+        self.assertIsNone(upload_error(request))
+        items, rejected = read_batch_upload(request)
+        self.assertEqual([name for name, _ in items], ['ok.png', 'last.jpg'])
+        self.assertEqual([name for name, _ in rejected], ['bomb.png', 'notes.png'])
+        self.assertIsInstance(rejected[0][1], UploadTooLarge)
+
+    def test_single_image_is_rejected_outright(self):
+        request = self.parsed({'image': SimpleUploadedFile('bomb.png', png_header(20000, 20000))})
+        self.assertIsInstance(upload_error(request), UploadTooLarge)
+        self.assertNotIn('image', request.FILES)
+
+    def test_archive_members_checked_for_pixels(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('ok.png', image_bytes((0, 0, 255)))
+            zf.writestr('bomb.png', png_header(20000, 20000))
+            zf.writestr('damaged.png', image_bytes((0, 255, 0)))
+        # Un byte cambiado en los datos del último miembro: su CRC-32 ya no coincide
+        data = bytearray(archive.getvalue())
+        with zipfile.ZipFile(io.BytesIO(bytes(data))) as zf:
+            info = zf.getinfo('damaged.png')
+        offset = info.header_offset + 30 + len(info.filename) + len(info.extra) + 20
+        data[offset] ^= 0xFF
+        items, rejected = read_archive(io.BytesIO(bytes(data)), max_images=10, max_bytes=10 * 1024 * 1024)
+        self.assertEqual([name for name, _ in items], ['ok.png'])
+        self.assertEqual([name for name, _ in rejected], ['bomb.png', 'damaged.png'])
+        self.assertEqual(str(rejected[1][1]), 'Imagen dañada en el zip')
+
+
+class MeanModel:
+    """Modelo de prueba: la 'probabilidad' es la media de cada imagen"""
+
+    embeddings = False
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def model_version(self):
+        return 'test'
+
+    def predict_batch(self, batch):
+        self.batch_sizes.append(len(batch))
+        return batch.reshape(len(batch), -1).mean(axis=1, keepdims=True), None
+
+
+@override_settings(PREDICTION_CACHE_ENABLED=False, INFERENCE_BATCH_CHUNK=2)
+class PredictManyTests(SimpleTestCase):
+    def test_results_stay_aligned_across_chunks(self):
+        images = [image_bytes((0, 0, 0)), b'broken', image_bytes((255, 255, 255)),
+                  image_bytes((255, 255, 255)), b'broken', image_bytes((0, 0, 0))]
+        model = MeanModel()
+        results, embeddings = predict_many(model, images)
+        self.assertEqual(model.batch_sizes, [1, 2, 1])
+        self.assertIsInstance(results[1], Exception)
+        self.assertIsInstance(results[4], Exception)
+        self.assertEqual([round(results[i][0]) for i in (0, 2, 3, 5)], [-1, 1, 1, -1])
+        self.assertEqual(embeddings, [None] * len(images))
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.batch_sizes = []
+
+    def row_sums(self, batch):
+        self.batch_sizes.append(len(batch))
+        return batch.reshape(len(batch), -1).sum(axis=1)
+
+    def predict_concurrently(self, batcher, count):
+        results = [None] * count
+
+        def work(i):
+            results[i] = batcher.predict(np.full((2, 2), i, dtype=np.float32), timeout=5)
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_requests_share_a_pass(self):
+        batcher = MicroBatcher(self.row_sums, max_batch_size=4, max_wait_ms=1000)
+        results = self.predict_concurrently(batcher, 4)
+        batcher.stop()
+        self.assertEqual(self.batch_sizes, [4])
+        self.assertEqual([float(r) for r in results], [0.0, 4.0, 8.0, 12.0])
+        self.assertEqual(batcher.stats()['fill_histogram'], {'4': 1})
+
+    def test_tuple_outputs_are_split_per_row(self):
+        batcher = MicroBatcher(lambda batch: (batch[:, 0, 0], batch[:, 1, 1] * 10), max_batch_size=2)
+        probs, embedding = batcher.predict(np.full((2, 2), 3, dtype=np.float32), timeout=5)
+        batcher.stop()
+        self.assertEqual((float(probs), float(embedding)), (3.0, 30.0))
+
+    def test_errors_reach_every_waiting_request(self):
+        def fail(batch):
+            raise RuntimeError('modelo caído')
+
+        batcher = MicroBatcher(fail, max_batch_size=1)
+        with self.assertRaisesMessage(RuntimeError, 'modelo caído'):
+            batcher.predict(np.zeros((2, 2), dtype=np.float32), timeout=5)
+        batcher.stop()
+
+    def test_stopped_batcher_predicts_directly(self):
+        batcher = MicroBatcher(self.row_sums, max_batch_size=4)
+        batcher.stop()
+        self.assertEqual(float(batcher.predict(np.ones((2, 2), dtype=np.float32))), 4.0)
+        self.assertEqual(self.batch_sizes, [1])
+        self.assertEqual(batcher.stats()['batches'], 0)
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        diagnosis_date = datetime(2024, 5, 17, 13, 45, 12, 345678, tzinfo=timezone.utc)
+        diagnostic_id = uuid.uuid4()
+        cursor = encode_cursor(diagnosis_date, diagnostic_id)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), (diagnosis_date, diagnostic_id))
+
+    def test_tampered_cursors_are_rejected(self):
+        valid = encode_cursor(datetime(2024, 5, 17, tzinfo=timezone.utc), uuid.uuid4())
+        tampered = [
+            'not base64!',
+            valid[:-6],
+            base64_text('2024-05-17T00:00:00+00:00'),
+            base64_text('yesterday|' + str(uuid.uuid4())),
+            base64_text('2024-05-17T00:00:00+00:00|not-a-uuid'),
+            base64_text('2024-05-17T00:00:00+00:00|a|b'),
+            'gICA',
+        ]
+        for cursor in tampered:
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidQuery):
+                decode_cursor(cursor)
+
+
+class PaginationTests(TestCase):
+    def test_pages_cover_every_row_once(self):
+        user = create_patient()
+        ids = {create_diagnostic(user).id for _ in range(5)}
+        # Misma fecha para todas: el id desempata
+        DiagnosticHistory.objects.update(diagnosis_date=datetime(2024, 5, 17, tzinfo=timezone.utc))
+        seen, params = [], {'limit': '2'}
+        while True:
+            rows, cursor = paginate(DiagnosticHistory.objects.all(), params)
+            seen.extend(row['id'] for row in rows)
+            if cursor is None:
+                break
+            params = {'limit': '2', 'cursor': cursor}
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(set(seen), ids)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+
+class StatsConsistencyTests(TestCase):
+    def assertStatsMatchHistory(self):
+        summary = summarize(DiagnosticStats.objects.all())
+        rows = list(DiagnosticHistory.objects.all())
+        self.assertEqual(summary['total'], len(rows))
+        by_class = {}
+        for row in rows:
+            diagnosis_class = stats_key(row)[2]
+            by_class[diagnosis_class] = by_class.get(diagnosis_class, 0) + 1
+        self.assertEqual(summary['by_class'], by_class)
+        histogram = [0] * 10
+        for row in rows:
+            histogram[risk_bucket(row.risk_level)] += 1
+        self.assertEqual([bucket['count'] for bucket in summary['risk_histogram']], histogram)
+
+    def test_counts_follow_inserts_and_deletes(self):
+        ana, luis = create_patient('123'), create_patient('456')
+        first = create_diagnostic(ana, 'Maligno', 85)
+        create_diagnostic(ana, 'Benigno', 40)
+        create_diagnostic(luis, 'Maligno', 92)
+        bulk = DiagnosticHistory.objects.bulk_create([
+            DiagnosticHistory(user=luis, patient_name=luis.full_name, identification_number='456',
+                              diagnosis='Benigno', risk_level=15, probabilities=[0.15, 0.85])
+            for _ in range(2)
+        ])
+        record_diagnostics(bulk)
+        self.assertStatsMatchHistory()
+
+        first.delete()
+        self.assertStatsMatchHistory()
+        DiagnosticHistory.objects.filter(user=luis, diagnosis='Benigno').delete()
+        self.assertStatsMatchHistory()
+        ana.delete()
+        self.assertStatsMatchHistory()
+        self.assertEqual(summarize(DiagnosticStats.objects.all())['total'], 1)
+
+
+class StoredPredictionTests(TestCase):
+    def test_result_comes_from_the_stored_row(self):
+        diagnostic = create_diagnostic(create_patient(), 'Melanoma (Maligno)', 85.5)
+        diagnostic.model_version = 'v1'
+        diagnostic.save(update_fields=['model_version'])
+        diagnostic.refresh_from_db()
+        result = stored_prediction(diagnostic)
+        self.assertEqual(result['predicted_class'], 'Melanoma (Maligno)')
+        self.assertEqual(result['simplified_class'], 'Maligno')
+        self.assertEqual((result['predicted_index'], result['confidence']), (0, 85.5))
+        self.assertEqual(result['model_version'], 'v1')
+
+
+class InferenceGateTests(SimpleTestCase):
+    def test_pending_limit_holds_across_threads(self):
+        gate = InferenceGate(concurrency=1, max_pending=5)
+        start = threading.Barrier(20)
+        admitted = []
+
+        def work():
+            start.wait()
+            admitted.append(gate.try_acquire())
+
+        threads = [threading.Thread(target=work) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(admitted.count(True), 5)
+        self.assertEqual(gate.pending, 5)
+        gate.release()
+        self.assertTrue(gate.try_acquire())
+        self.assertFalse(gate.try_acquire())
+        gate.executor.shutdown()
@@ -0,0 +1,238 @@
+"""Lectura y validación de las imágenes subidas."""
+import io
+import os
+import zipfile
+import zlib
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from PIL import Image, UnidentifiedImageError
+
+from .preprocessing import sniff_format
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp')
+
+# Campos multipart que se inspeccionan mientras llegan; en los del lote una
+# imagen rechazada no detiene la lectura de las demás
+IMAGE_FIELDS = ('image', 'images')
+BATCH_FIELDS = ('images',)
+
+
+class UploadError(ValueError):
+    """Subida rechazada (se responde con 400)"""
+
+    status = 400
+
+
+class UploadTooLarge(UploadError):
+    status = 413
+
+
+def image_limits():
+    return (
+        int(getattr(settings, 'IMAGE_UPLOAD_MAX_BYTES', 20 * 1024 * 1024)),
+        int(getattr(settings, 'IMAGE_UPLOAD_MAX_PIXELS', 40_000_000)),
+        int(getattr(settings, 'IMAGE_UPLOAD_MAX_HEADER_BYTES', 256 * 1024)),
+    )
+
+
+def read_header(head):
+    """Formato y dimensiones a partir de los primeros bytes de la imagen.
+
+    PIL solo analiza la cabecera al abrir, sin decodificar píxeles. Devuelve
+    None si todavía no llegaron bytes suficientes (p. ej. un EXIF grande antes
+    del marcador SOF del JPEG) y lanza UploadError si el formato no se acepta.
+    """
+    image_format = sniff_format(head[:16])
+    if image_format is None:
+        if len(head) < 16:
+            return None
+        raise UploadError('Formato de imagen no soportado (se aceptan JPEG, PNG, GIF, BMP y WebP)')
+    try:
+        with Image.open(io.BytesIO(head)) as image:
+            return image_format, image.size
+    except Image.DecompressionBombError:
+        raise UploadTooLarge('La imagen supera el máximo de píxeles permitido')
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        return None
+
+
+def check_dimensions(size, max_pixels):
+    width, height = size
+    if width <= 0 or height <= 0:
+        raise UploadError('Dimensiones de imagen inválidas')
+    if width * height > max_pixels:
+        raise UploadTooLarge(f'La imagen de {width}x{height} supera el máximo de {max_pixels} píxeles')
+
+
+def check_image(data, max_pixels):
+    """Valida formato y píxeles de una imagen ya en memoria (p. ej. de un zip)"""
+    header = read_header(data)
+    if header is None:
+        raise UploadError('Imagen truncada o inválida')
+    check_dimensions(header[1], max_pixels)
+
+
+class RejectedFile(SimpleUploadedFile):
+    """Imagen del lote rechazada al recibirla; ocupa su lugar en request.FILES
+    sin contenido y ``error`` dice por qué"""
+
+    def __init__(self, name, error):
+        super().__init__(name, b'')
+        self.error = error
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Inspecciona las imágenes mientras se recibe el multipart.
+
+    Se coloca antes de los manejadores de Django y les pasa cada fragmento sin
+    retenerlo. Con los primeros KiB identifica el formato por sus magic bytes y
+    lee las dimensiones de la cabecera; un formato no soportado, una imagen
+    con demasiados píxeles (bomba de descompresión) o un archivo demasiado
+    grande detienen la lectura sin guardar el resto del cuerpo. El motivo
+    queda en ``request.upload_error`` para que la vista responda.
+
+    En los campos del lote (``BATCH_FIELDS``) solo se descarta esa imagen: el
+    resto de sus bytes no se guarda y en ``request.FILES`` queda un
+    ``RejectedFile`` con el motivo.
+    """
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.inspecting = field_name in IMAGE_FIELDS
+        self.max_bytes, self.max_pixels, self.max_header_bytes = image_limits()
+        self.head = b''
+        self.received = 0
+        self.header_checked = False
+        self.rejected = None
+        if self.inspecting and content_length and content_length > self.max_bytes:
+            self._reject(UploadTooLarge(f'La imagen supera el máximo de {self.max_bytes} bytes'))
+
+    def _reject(self, error):
+        if self.field_name in BATCH_FIELDS:
+            self.rejected = error
+            return
+        self.request.upload_error = error
+        # Sin connection_reset Django descarta el resto del cuerpo sin guardarlo
+        raise StopUpload()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.inspecting:
+            return raw_data
+        if self.rejected is not None:
+            # Los manejadores siguientes no reciben el resto de la imagen rechazada
+            return None
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self._reject(UploadTooLarge(f'La imagen supera el máximo de {self.max_bytes} bytes'))
+            return None
+        if not self.header_checked:
+            self.head += raw_data
+            try:
+                header = read_header(self.head)
+                if header is None and len(self.head) >= self.max_header_bytes:
+                    raise UploadError('No se pudo leer la cabecera de la imagen')
+                if header is not None:
+                    check_dimensions(header[1], self.max_pixels)
+            except UploadError as e:
+                self._reject(e)
+                return None
+            if header is not None:
+                self.header_checked = True
+                self.head = b''
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.inspecting and self.rejected is None and not self.header_checked:
+            # Archivo más corto que una cabecera completa
+            error = UploadError('Imagen truncada o inválida')
+            if self.field_name not in BATCH_FIELDS:
+                self.request.upload_error = error
+                return None
+            self.rejected = error
+        if self.rejected is not None:
+            # Ningún otro manejador entrega su copia parcial
+            return RejectedFile(self.file_name, self.rejected)
+        return None
+
+
+def upload_error(request):
+    """Error registrado por ImageUploadHandler al leer la petición, o None"""
+    return getattr(request, 'upload_error', None)
+
+
+def batch_limits():
+    return (
+        int(getattr(settings, 'BATCH_PREDICT_MAX_IMAGES', 1000)),
+        int(getattr(settings, 'BATCH_PREDICT_MAX_BYTES', 512 * 1024 * 1024)),
+    )
+
+
+def read_archive(archive, max_images, max_bytes):
+    """Imágenes de un .zip como (lista de (nombre, bytes), lista de (nombre, error)).
+
+    Los límites del lote se comprueban con los tamaños declarados antes de
+    descomprimir nada; cada imagen pasa luego los mismos controles de tamaño,
+    formato y píxeles que una subida y, si no los pasa, solo ella falla.
+    """
+    try:
+        zf = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise UploadError('El archivo no es un zip válido')
+
+    with zf:
+        members = [
+            info for info in zf.infolist()
+            if not info.is_dir()
+            and not os.path.basename(info.filename).startswith('.')
+            and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+        if len(members) > max_images:
+            raise UploadError(f'Máximo {max_images} imágenes por lote')
+        if sum(info.file_size for info in members) > max_bytes:
+            raise UploadError(f'El lote descomprimido supera {max_bytes} bytes')
+
+        max_image_bytes, max_pixels, _ = image_limits()
+        items, rejected = [], []
+        for info in members:
+            try:
+                if info.file_size > max_image_bytes:
+                    raise UploadTooLarge(f'La imagen supera el máximo de {max_image_bytes} bytes')
+                try:
+                    data = zf.read(info)
+                except (zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError, EOFError):
+                    # CRC incorrecto, cifrado, compresión no soportada o datos truncados
+                    raise UploadError('Imagen dañada en el zip')
+                check_image(data, max_pixels)
+            except UploadError as e:
+                rejected.append((info.filename, e))
+                continue
+            items.append((info.filename, data))
+        return items, rejected
+
+
+def read_batch_upload(request):
+    """Imágenes de una petición por lotes: campos ``images`` múltiples y/o un
+    ``archive`` zip. Devuelve (lista de (nombre, bytes), lista de (nombre,
+    error) de las imágenes rechazadas)."""
+    max_images, max_bytes = batch_limits()
+    files = request.FILES
+    if upload_error(request) is not None:
+        raise upload_error(request)
+    items, rejected = [], []
+    for f in files.getlist('images'):
+        if isinstance(f, RejectedFile):
+            rejected.append((f.name, f.error))
+        else:
+            items.append((f.name, f.read()))
+    archive = request.FILES.get('archive')
+    if archive is not None:
+        archive_items, archive_rejected = read_archive(archive, max_images - len(items) - len(rejected), max_bytes)
+        items.extend(archive_items)
+        rejected.extend(archive_rejected)
+    if not items and not rejected:
+        raise UploadError("No se enviaron imágenes (campos 'images' o 'archive')")
+    if len(items) + len(rejected) > max_images:
+        raise UploadError(f'Máximo {max_images} imágenes por lote')
+    return items, rejected
@@ -1,9 +1,23 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('predict/', views.api_predict, name='api_predict'),  # ✅ CORRECTO
+    path('predict/batch/', views.api_predict_batch, name='api_predict_batch'),
+    path('jobs/<uuid:job_id>/', views.prediction_job, name='prediction_job'),
+    path('ready/', views.readiness, name='readiness'),
+    path('predict/stats/', views.inference_stats, name='inference_stats'),
     path('diagnostics/', views.diagnostic_history, name='diagnostic_history'),  # ✅ CORRECTO
+    path('diagnostics/export/', views.export_diagnostics, name='export_diagnostics'),
+    path('diagnostics/stats/', views.diagnostic_statistics, name='diagnostic_statistics'),
     path('diagnostics/<uuid:diagnostic_id>/', views.diagnostic_detail, name='diagnostic_detail'),  # ✅ CORRECTO
+    path('diagnostics/<uuid:diagnostic_id>/image/', views.diagnostic_image, name='diagnostic_image'),
+    path('diagnostics/<uuid:diagnostic_id>/similar/', views.similar_diagnostics, name='similar_diagnostics'),
+    path('diagnostics/<uuid:diagnostic_id>/explain/', views.diagnostic_explanation, name='diagnostic_explanation'),
+
+    # Variantes ASGI nativas (servir con skin_cancer_dashboard.asgi)
+    path('async/predict/', async_views.api_predict, name='async_api_predict'),
+    path('async/diagnostics/', async_views.diagnostic_history, name='async_diagnostic_history'),
+    path('async/diagnostics/<uuid:diagnostic_id>/', async_views.diagnostic_detail, name='async_diagnostic_detail'),
 ]
\ No newline at end of file
@@ -1,175 +1,243 @@
-import io
-import json
-import os
-import base64
-from django.http import JsonResponse, HttpResponse
+import logging
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.db import transaction
 from django.shortcuts import render
-from django.views.decorators.csrf import csrf_exempt
+from django.urls import reverse
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 
-# imports para modelo
-from PIL import Image, ImageOps
-import numpy as np
-from keras.models import load_model
-from .models import DiagnosticHistory
-from users.models import User
-
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-# carga del modelo al iniciar el servidor (solo una vez)
-MODEL_PATH = os.path.join(BASE_DIR, 'keras_model.h5')
-LABELS_PATH = os.path.join(BASE_DIR, 'labels.txt')
-
-# Cargar modelo y etiquetas
-model = None
-class_names = []
-try:
-    model = load_model(MODEL_PATH, compile=False)
-except Exception as e:
-    print("Error cargando modelo:", e)
-
-try:
-    with open(LABELS_PATH, 'r', encoding='utf-8') as f:
-        class_names = [line.strip() for line in f.readlines()]
-except Exception as e:
-    print("Error cargando labels:", e)
+from .cache import get_prediction_cache
+from .embeddings import similar_diagnostics as find_similar
+from .export import FORMATS as EXPORT_FORMATS, IMAGE_MODES, export_stream
+from .explain import METHODS as EXPLAIN_METHODS, ensure_overlay, explain_in_background, model_for, overlay_name
+from .history import InvalidQuery, filter_diagnostics, paginate, serialize_detail, serialize_row, visible_diagnostics
+from .jobs import enqueue, job_payload, parse_priority
+from .media import serve_derived, serve_image, thumbnail_sizes
+from .metrics import render as render_metrics, stage
+from .models import DiagnosticHistory, PredictionJob
+from .pipeline import describe_prediction, parse_tta, predict_many, predict_served
+from .registry import get_registry
+from .renditions import rendition_specs, renditions_in_background
+from .stats import diagnostic_stats, record_diagnostics
+from .storage import content_key, get_blob_store
+from .uploads import UploadError, read_batch_upload, upload_error
+
+logger = logging.getLogger(__name__)
 
 def index(request):
     return render(request, 'diagnostics/index.html', context={})
 
-def get_confidence_display(confidence_percentage):
-    """Convierte porcentaje a nivel de semáforo y rango aproximado"""
-    rounded_confidence = round(confidence_percentage / 5) * 5
-    
-    if confidence_percentage >= 80:
-        return "🟢 Bajo riesgo", f"≈ {rounded_confidence}%"
-    elif confidence_percentage >= 50:
-        return "🟡 Riesgo intermedio", f"≈ {rounded_confidence}%"
-    else:
-        return "🔴 Alto riesgo", f"≈ {rounded_confidence}%"
-
-def get_user_friendly_class_name(full_class_name):
-    """Convierte nombres técnicos a nombres comprensibles para el usuario"""
-    if "Maligno" in full_class_name:
-        return "Maligno (sospecha de melanoma)"
-    elif "Benigno" in full_class_name:
-        return "Benigno (no peligroso)"
-    elif "Indeterminado" in full_class_name or "Desconocido" in full_class_name:
-        return "Indeterminado (evaluación médica recomendada)"
-    else:
-        return full_class_name
-
-def get_simplified_class_name(full_class_name):
-    """Extrae solo la parte principal del nombre de la clase para gráficos"""
-    if "Maligno" in full_class_name:
-        return "Maligno"
-    elif "Benigno" in full_class_name:
-        return "Benigno"
-    elif "Indeterminado" in full_class_name or "Desconocido" in full_class_name:
-        return "Indeterminado"
-    else:
-        return full_class_name
+def wants_async(request):
+    return (request.query_params.get('mode') or request.data.get('mode')) == 'async'
+
+def enqueue_response(request, items, default_priority, rejected=()):
+    """Encola las imágenes y responde 202 con los trabajos creados (y las
+    imágenes rechazadas al recibirlas, si las hay)"""
+    try:
+        priority = parse_priority(request.data.get('priority'), default_priority)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    jobs = enqueue(request.user, items, priority) if items else []
+    payload = {
+        'jobs': [{
+            'job_id': str(job.id),
+            'filename': job.filename,
+            'status_url': reverse('prediction_job', args=[job.id]),
+        } for job in jobs],
+    }
+    if rejected:
+        payload['rejected'] = [{'filename': filename, 'error': str(error)} for filename, error in rejected]
+    return Response(payload, status=202)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def api_predict(request):
-    print(f"🔍 Predict llamado por: {request.user.email}")
-    print(f"🔍 Headers de autorización: {request.headers.get('Authorization')}")
-    print(f"🔍 Usuario autenticado: {request.user.is_authenticated}")
     """
     Endpoint: POST /api/predict/
     Form data: file field named 'image'
+    Con mode=async la imagen se encola y se responde 202 con el id del trabajo
+    Con tta=1 (o tta=K) se promedian K vistas aumentadas y se reporta su dispersión
     """
-    if model is None:
-        return Response({'error': 'Modelo no cargado en el servidor'}, status=500)
-
-    # obtener archivo
+    logger.debug("Predict llamado por el usuario %s", request.user.pk)
+    # obtener archivo (ImageUploadHandler ya validó formato, tamaño y píxeles)
     image_file = request.FILES.get('image')
+    error = upload_error(request)
+    if error is not None:
+        return Response({'error': str(error)}, status=error.status)
     if image_file is None:
         return Response({'error': 'No file provided'}, status=400)
 
+    if wants_async(request):
+        return enqueue_response(request, [(image_file.name, image_file.read())], PredictionJob.PRIORITY_CLINICIAN)
+
     try:
-        # Leer imagen en PIL
-        image = Image.open(image_file).convert('RGB')
-
-        # Preprocessing idéntico al que usaste
-        size = (224, 224)
-        image = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
-        image_array = np.asarray(image)
-        normalized_image_array = (image_array.astype(np.float32) / 127.5) - 1
-        data = np.ndarray(shape=(1, 224, 224, 3), dtype=np.float32)
-        data[0] = normalized_image_array
-
-        # Predecir
-        prediction = model.predict(data)
-        probs = prediction[0].tolist()
-        index = int(np.argmax(prediction[0]))
-        
-        # Obtener nombre original y convertirlo a formato amigable
-        original_class_name = class_names[index] if index < len(class_names) else f"Clase {index}"
-        user_friendly_class = get_user_friendly_class_name(original_class_name)
-        simplified_class = get_simplified_class_name(original_class_name)
-        
-        confidence = float(prediction[0][index]) * 100.0
-        
-        # Calcular nivel de confianza y rango
-        confidence_level, confidence_range = get_confidence_display(confidence)
+        views = parse_tta(request.query_params.get('tta') or request.data.get('tta'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
+    registry = get_registry()
+    if not registry.ensure_loaded():
+        return Response({'error': 'Modelo no cargado en el servidor'}, status=500)
+
+    try:
+        # Bytes originales: se guardan tal cual, sin volver a codificar
+        image_bytes = image_file.read()
+        image_hash = content_key(image_bytes)
+
+        # Versión activa (o candidata en modo canary) para esta imagen
+        probs, model, tta, embedding = predict_served(registry, image_bytes, image_hash, views)
+
+        prediction = describe_prediction(probs, model.class_names)
+        confidence = prediction.pop('risk_level')
 
-        # Convertir imagen a base64 para guardar
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        # Guardar la imagen original en el almacén por contenido (deduplicada)
+        with stage('blob_store'):
+            image_key = get_blob_store().save(image_bytes, key=image_hash)
 
         # Guardar en base de datos
-        diagnostic = DiagnosticHistory.objects.create(
+        with stage('db_insert'):
+            diagnostic = DiagnosticHistory.objects.create(
+                user=request.user,
+                patient_name=request.user.full_name,
+                identification_number=request.user.identification_number,
+                diagnosis=prediction['predicted_class'],
+                risk_level=confidence,
+                probabilities=probs,
+                image_key=image_key,
+                model_version=model.version,
+                embedding=embedding,
+            )
+        # Versiones reducidas y mapas de EXPLAIN_AFTER_PREDICT, fuera del tiempo de respuesta
+        transaction.on_commit(lambda: renditions_in_background([diagnostic]))
+        transaction.on_commit(lambda: explain_in_background(diagnostic))
+
+        if tta is not None:
+            prediction['tta'] = tta
+        return Response({'id': str(diagnostic.id), 'model_version': model.version, **prediction})
+
+    except Exception as e:
+        logger.exception("Error en la predicción")
+        return Response({'error': str(e)}, status=500)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def api_predict_batch(request):
+    """
+    Endpoint: POST /api/predict/batch/
+    Form data: varios campos 'images' y/o un 'archive' (.zip)
+    Con mode=async cada imagen se encola como trabajo de prioridad 'bulk'
+    Una imagen rechazada (formato, tamaño, píxeles) solo falla ella
+    """
+    try:
+        items, rejected = read_batch_upload(request)
+    except UploadError as e:
+        return Response({'error': str(e)}, status=e.status)
+
+    if wants_async(request):
+        return enqueue_response(request, items, PredictionJob.PRIORITY_BULK, rejected)
+
+    registry = get_registry()
+    if not registry.ensure_loaded():
+        return Response({'error': 'Modelo no cargado en el servidor'}, status=500)
+
+    hashes = [content_key(data) for _, data in items]
+    model = registry.current()
+    outcomes, embeddings = predict_many(model, [data for _, data in items], hashes)
+
+    store = get_blob_store()
+    class_names = model.class_names
+    results = []
+    rows = []
+    for (filename, data), image_hash, outcome, embedding in zip(items, hashes, outcomes, embeddings):
+        if isinstance(outcome, Exception):
+            results.append({'filename': filename, 'error': str(outcome)})
+            continue
+        prediction = describe_prediction(outcome, class_names)
+        confidence = prediction.pop('risk_level')
+        rows.append(DiagnosticHistory(
             user=request.user,
             patient_name=request.user.full_name,
             identification_number=request.user.identification_number,
-            diagnosis=user_friendly_class,
+            diagnosis=prediction['predicted_class'],
             risk_level=confidence,
-            probabilities=probs,
-            image_data=img_str
-        )
-
-        return Response({
-            'id': str(diagnostic.id),
-            'probabilities': probs,
-            'predicted_index': index,
-            'predicted_class': user_friendly_class,
-            'simplified_class': simplified_class,
-            'confidence': round(confidence, 2),
-            'confidence_level': confidence_level,
-            'confidence_range': confidence_range
-        })
+            probabilities=outcome,
+            image_key=store.save(data, key=image_hash),
+            model_version=model.version,
+            embedding=embedding,
+        ))
+        results.append({'filename': filename, 'id': str(rows[-1].id), **prediction})
+    results.extend({'filename': filename, 'error': str(error)} for filename, error in rejected)
 
-    except Exception as e:
-        return Response({'error': str(e)}, status=500)
+    with stage('db_insert'), transaction.atomic():
+        DiagnosticHistory.objects.bulk_create(rows)
+        record_diagnostics(rows)
+        transaction.on_commit(lambda: renditions_in_background(rows))
+
+    return Response({
+        'count': len(results),
+        'succeeded': len(rows),
+        'failed': len(results) - len(rows),
+        'results': results,
+    })
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def diagnostic_history(request):
-    """Obtener historial de diagnósticos según el rol"""
-    if request.user.role == 'doctor':
-        # Médicos ven todos los diagnósticos
-        diagnostics = DiagnosticHistory.objects.all().order_by('-diagnosis_date')
-    else:
-        # Pacientes solo ven sus diagnósticos
-        diagnostics = DiagnosticHistory.objects.filter(user=request.user).order_by('-diagnosis_date')
-    
-    data = []
-    for diagnostic in diagnostics:
-        data.append({
-            'id': str(diagnostic.id),
-            'patient_name': diagnostic.patient_name,
-            'identification_number': diagnostic.identification_number,
-            'date': diagnostic.diagnosis_date.strftime('%d/%m/%Y, %H:%M:%S'),
-            'diagnosis': diagnostic.diagnosis,
-            'risk_level': float(diagnostic.risk_level),
-        })
-    
-    return Response(data)
+    """Obtener historial de diagnósticos según el rol (paginado por cursor)
+
+    Parámetros: limit, cursor, patient, date_from, date_to, diagnosis, risk_min, risk_max
+    """
+    try:
+        diagnostics = filter_diagnostics(visible_diagnostics(request.user), request.query_params, request.user)
+        rows, next_cursor = paginate(diagnostics, request.query_params)
+    except InvalidQuery as e:
+        return Response({'error': str(e)}, status=400)
+
+    return Response({'results': [serialize_row(row) for row in rows], 'next_cursor': next_cursor})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_diagnostics(request):
+    """
+    Endpoint: GET /api/diagnostics/export/ (solo médicos)
+    Parámetros: output=csv|ndjson|parquet, images=none|url|inline y los
+    mismos filtros del historial. Las filas se envían a medida que se leen.
+    """
+    output_format = request.query_params.get('output', 'csv')
+    if output_format not in EXPORT_FORMATS:
+        return Response({'error': f'Formato no permitido, opciones: {list(EXPORT_FORMATS)}'}, status=400)
+    images = request.query_params.get('images', 'none')
+    if images not in IMAGE_MODES:
+        return Response({'error': f'images debe ser una de: {list(IMAGE_MODES)}'}, status=400)
+    try:
+        queryset = filter_diagnostics(visible_diagnostics(request.user), request.query_params, request.user)
+        stream = export_stream(queryset, output_format, images)
+    except InvalidQuery as e:
+        return Response({'error': str(e)}, status=400)
+    except ImportError as e:
+        return Response({'error': str(e)}, status=501)
+
+    content_type, extension = EXPORT_FORMATS[output_format]
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    filename = f"diagnosticos_{timezone.now():%Y%m%d_%H%M%S}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def diagnostic_statistics(request):
+    """Estadísticas agregadas según el rol, desde los contadores materializados
+
+    Parámetros: patient, date_from, date_to
+    """
+    try:
+        return Response(diagnostic_stats(request.user, request.query_params))
+    except InvalidQuery as e:
+        return Response({'error': str(e)}, status=400)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -181,15 +249,144 @@ def diagnostic_detail(request, diagnostic_id):
         else:
             diagnostic = DiagnosticHistory.objects.get(id=diagnostic_id, user=request.user)
         
-        return Response({
-            'id': str(diagnostic.id),
-            'patient_name': diagnostic.patient_name,
-            'identification_number': diagnostic.identification_number,
-            'date': diagnostic.diagnosis_date.strftime('%d/%m/%Y, %H:%M:%S'),
-            'diagnosis': diagnostic.diagnosis,
-            'risk_level': float(diagnostic.risk_level),
-            'probabilities': diagnostic.probabilities,
-            'image_data': diagnostic.image_data
-        })
+        return Response(serialize_detail(diagnostic))
+    except DiagnosticHistory.DoesNotExist:
+        return Response({'error': 'Diagnóstico no encontrado'}, status=404)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def similar_diagnostics(request, diagnostic_id):
+    """Diagnósticos más parecidos (embedding de la penúltima capa del modelo)
+
+    Parámetros: k (máximo SIMILAR_DIAGNOSTICS_MAX_K), scope=all|patient
+    (patient = seguimiento de la misma persona; los pacientes solo ven los suyos)
+    """
+    fields = ('id', 'user_id', 'model_version', 'embedding')
+    try:
+        diagnostic = visible_diagnostics(request.user).only(*fields).get(id=diagnostic_id)
+    except DiagnosticHistory.DoesNotExist:
+        return Response({'error': 'Diagnóstico no encontrado'}, status=404)
+    if diagnostic.embedding is None:
+        return Response({'error': 'El diagnóstico no tiene embedding'}, status=404)
+
+    max_k = getattr(settings, 'SIMILAR_DIAGNOSTICS_MAX_K', 50)
+    k = request.query_params.get('k', '10')
+    if not k.isdigit() or not 1 <= int(k) <= max_k:
+        return Response({'error': f'k debe ser un entero entre 1 y {max_k}'}, status=400)
+    scope = request.query_params.get('scope', 'all')
+    if scope not in ('all', 'patient'):
+        return Response({'error': 'scope debe ser all o patient'}, status=400)
+
+    same_patient = scope == 'patient' or request.user.role != 'doctor'
+    with stage('similarity_search'):
+        matches = find_similar(diagnostic, int(k), user_id=diagnostic.user_id if same_patient else None)
+    return Response({
+        'id': str(diagnostic.id),
+        'model_version': diagnostic.model_version,
+        'results': [{**serialize_row(row), 'similarity': round(score, 4)} for row, score in matches],
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def diagnostic_image(request, diagnostic_id):
+    """Imagen de un diagnóstico en streaming y cacheable; con ?size=N una
+    miniatura y con ?rendition=<nombre> una de DIAGNOSTICS_RENDITIONS"""
+    fields = ('id', 'user_id', 'image_key', 'diagnosis_date')
+    try:
+        if request.user.role == 'doctor':
+            diagnostic = DiagnosticHistory.objects.only(*fields).get(id=diagnostic_id)
+        else:
+            diagnostic = DiagnosticHistory.objects.only(*fields).get(id=diagnostic_id, user=request.user)
+    except DiagnosticHistory.DoesNotExist:
+        return Response({'error': 'Diagnóstico no encontrado'}, status=404)
+
+    if not diagnostic.image_key:
+        return Response({'error': 'El diagnóstico no tiene imagen'}, status=404)
+
+    size = request.query_params.get('size')
+    if size is not None:
+        if not size.isdigit() or int(size) not in thumbnail_sizes():
+            return Response({'error': f'Tamaño no permitido, opciones: {list(thumbnail_sizes())}'}, status=400)
+        size = int(size)
+    rendition = request.query_params.get('rendition')
+    if rendition is not None and rendition not in rendition_specs():
+        return Response({'error': f'Versión no disponible, opciones: {list(rendition_specs())}'}, status=400)
+
+    return serve_image(request, diagnostic, size, rendition)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def diagnostic_explanation(request, diagnostic_id):
+    """Mapa de calor PNG (RGBA 224x224) para superponer al recorte de la imagen
+
+    Parámetro: method=occlusion|gradcam. Se calcula una vez por imagen y
+    versión del modelo, y luego se sirve cacheado.
+    """
+    fields = ('id', 'user_id', 'image_key', 'diagnosis_date', 'model_version')
+    try:
+        diagnostic = visible_diagnostics(request.user).only(*fields).get(id=diagnostic_id)
     except DiagnosticHistory.DoesNotExist:
-        return Response({'error': 'Diagnóstico no encontrado'}, status=404)
\ No newline at end of file
+        return Response({'error': 'Diagnóstico no encontrado'}, status=404)
+    if not diagnostic.image_key:
+        return Response({'error': 'El diagnóstico no tiene imagen'}, status=404)
+
+    method = request.query_params.get('method', 'occlusion')
+    if method not in EXPLAIN_METHODS:
+        return Response({'error': f'Método no permitido, opciones: {list(EXPLAIN_METHODS)}'}, status=400)
+
+    registry = get_registry()
+    if not registry.ensure_loaded():
+        return Response({'error': 'Modelo no cargado en el servidor'}, status=500)
+    model = model_for(diagnostic)
+    if method == 'gradcam' and not model.model.supports_gradcam:
+        return Response({'error': f'Grad-CAM no está disponible con el motor {model.model.name}'}, status=400)
+
+    name = overlay_name(method, model.version)
+    etag = f'"{diagnostic.image_key}-{method}-{model.version}"'
+    response = serve_derived(request, diagnostic, name, etag, lambda: ensure_overlay(diagnostic, method, model))
+    response['X-Model-Version'] = model.version
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def inference_stats(request):
+    """Estadísticas del motor de inferencia y de la caché de predicciones (solo médicos)"""
+    registry = get_registry()
+    if not registry.is_loaded:
+        return Response({'error': 'Modelo no cargado en el servidor'}, status=500)
+    cache = get_prediction_cache()
+    return Response({
+        'batching': registry.batcher.stats(),
+        'cache': cache.stats() if cache is not None else None,
+    })
+
+def metrics(request):
+    """Endpoint: GET /metrics (formato de exposición de Prometheus).
+
+    Solo se atiende a las IP de METRICS_ALLOWED_IPS; el resto recibe 404.
+    """
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponse(status=404)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def readiness(request):
+    """Sonda de disponibilidad: 200 cuando el modelo está cargado y precalentado"""
+    status = get_registry().status()
+    return Response(status, status=200 if status['ready'] else 503)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def prediction_job(request, job_id):
+    """Estado y resultado de una predicción asíncrona"""
+    try:
+        jobs = PredictionJob.objects.select_related('diagnostic')
+        if request.user.role == 'doctor':
+            job = jobs.get(id=job_id)
+        else:
+            job = jobs.get(id=job_id, user=request.user)
+    except PredictionJob.DoesNotExist:
+        return Response({'error': 'Trabajo no encontrado'}, status=404)
+    return Response(job_payload(job))
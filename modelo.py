@@ -1,36 +1,26 @@
-from keras.models import load_model  # TensorFlow is required for Keras to work
-from PIL import Image, ImageOps  # Install pillow instead of PIL
+import os
+
 import numpy as np
 
+from diagnostics.backends import default_artifact_path, get_backend
+from diagnostics.preprocessing import preprocess_batch
+
 # Disable scientific notation for clarity
 np.set_printoptions(suppress=True)
 
+# Choose the inference backend: keras (default), tflite or onnx.
+# Converted artifacts are produced with `python manage.py convert_model`
+backend_name = os.environ.get("INFERENCE_BACKEND", "keras")
+
 # Load the model
-model = load_model("keras_model.h5", compile=False)
+model = get_backend(backend_name, default_artifact_path("keras_model.h5", backend_name)).load()
 
 # Load the labels
 class_names = open("labels.txt", "r").readlines()
 
-# Create the array of the right shape to feed into the keras model
-# The 'length' or number of images you can put into the array is
-# determined by the first position in the shape tuple, in this case 1
-data = np.ndarray(shape=(1, 224, 224, 3), dtype=np.float32)
-
-# Replace this with the path to your image
-image = Image.open("B.jpg").convert("RGB")
-
-# resizing the image to be at least 224x224 and then cropping from the center
-size = (224, 224)
-image = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
-
-# turn the image into a numpy array
-image_array = np.asarray(image)
-
-# Normalize the image
-normalized_image_array = (image_array.astype(np.float32) / 127.5) - 1
-
-# Load the image into the array
-data[0] = normalized_image_array
+# Decode (downscaled while decoding for JPEG), crop from the center to 224x224
+# and normalize into a newly allocated float32 batch
+data = preprocess_batch(["B.jpg"])
 
 # Predicts the model
 prediction = model.predict(data)
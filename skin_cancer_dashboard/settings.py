@@ -1,3 +1,4 @@
+import logging
 import os
 from pathlib import Path
 from datetime import timedelta
@@ -33,6 +34,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'diagnostics.middleware.MetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'skin_cancer_dashboard.urls'
@@ -105,13 +107,35 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Almacén de imágenes de diagnóstico (direccionado por SHA-256). Por defecto
+# FileSystemStorage en MEDIA_ROOT/diagnostics/blobs; admite cualquier backend de
+# Django, p. ej. 'storages.backends.s3boto3.S3Boto3Storage'
+DIAGNOSTICS_BLOB_STORAGE = os.environ.get('DIAGNOSTICS_BLOB_STORAGE') or None
+DIAGNOSTICS_BLOB_STORAGE_OPTIONS = {}
+
+# Lados (px) permitidos para las miniaturas de /api/diagnostics/<id>/image/?size=N
+DIAGNOSTICS_THUMBNAIL_SIZES = (128, 256, 512)
+
+# Versiones generadas en segundo plano al guardar cada imagen y servidas con
+# ?rendition=<nombre>: (lado máximo en px, formato de Pillow, calidad). Los
+# formatos que este Pillow no sepa codificar (p. ej. 'AVIF') se omiten. Si hay
+# más de DIAGNOSTICS_RENDITION_MAX_PENDING imágenes esperando, las nuevas quedan
+# para `manage.py generate_renditions`
+DIAGNOSTICS_RENDITIONS = {
+    'thumb': (128, 'JPEG', 80),
+    'medium': (512, 'JPEG', 85),
+    'medium_webp': (512, 'WEBP', 80),
+}
+DIAGNOSTICS_RENDITION_WORKERS = int(os.environ.get('DIAGNOSTICS_RENDITION_WORKERS', 2))
+DIAGNOSTICS_RENDITION_MAX_PENDING = 256
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -127,6 +151,15 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Autenticación sin consulta por petición (users.authentication): usuarios en
+# memoria por proceso durante AUTH_USER_CACHE_SECONDS y datos del token (rol,
+# nombre, identificación) confiables hasta AUTH_TOKEN_CLAIMS_MAX_AGE segundos
+# después de emitido. Una desactivación hecha en otro proceso tarda como mucho
+# el mayor de los dos plazos en aplicarse
+AUTH_USER_CACHE_SECONDS = int(os.environ.get('AUTH_USER_CACHE_SECONDS', 60))
+AUTH_USER_CACHE_MAX_ENTRIES = 10000
+AUTH_TOKEN_CLAIMS_MAX_AGE = int(os.environ.get('AUTH_TOKEN_CLAIMS_MAX_AGE', 300))
+
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:8000",
@@ -140,6 +173,147 @@ CORS_ALLOW_CREDENTIALS = True
 MODEL_PATH = os.path.join(BASE_DIR, 'keras_model.h5')
 LABELS_PATH = os.path.join(BASE_DIR, 'labels.txt')
 
+# Motor de inferencia: 'keras' (keras_model.h5), 'tflite', 'onnx' o 'service'. Los artefactos
+# convertidos se generan con `python manage.py convert_model` junto al .h5
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'keras')
+INFERENCE_MODEL_PATH = os.environ.get('INFERENCE_MODEL_PATH') or None
+INFERENCE_NUM_THREADS = int(os.environ['INFERENCE_NUM_THREADS']) if os.environ.get('INFERENCE_NUM_THREADS') else None
+
+# Versiones del modelo lado a lado (`python manage.py model_versions`). Cada
+# proceso revisa registry.json cada MODEL_RELOAD_INTERVAL segundos y cambia de
+# versión en caliente, sin reiniciar
+MODEL_VERSIONS_DIR = os.environ.get('MODEL_VERSIONS_DIR', os.path.join(BASE_DIR, 'models'))
+MODEL_RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', 5))
+
+# Variante cuantizada con el motor TFLite: 'dynamic', 'float16', 'int8' o 'auto'
+# (la aceptada más rápida). Solo se sirven las que `python manage.py
+# quantize_model` aceptó frente al modelo float32
+INFERENCE_MODEL_VARIANT = os.environ.get('INFERENCE_MODEL_VARIANT') or None
+QUANTIZATION_MAX_ACCURACY_DROP = 0.01
+QUANTIZATION_MAX_SENSITIVITY_DROP = 0.0
+QUANTIZATION_MIN_AGREEMENT = 0.98
+
+# Servicio local de inferencia (`python manage.py run_inference_service`). Con
+# INFERENCE_BACKEND='service' los workers web le envían los tensores por el socket
+INFERENCE_SERVICE_SOCKET = os.environ.get('INFERENCE_SERVICE_SOCKET', '/tmp/melanoma-inference.sock')
+INFERENCE_SERVICE_BACKEND = os.environ.get('INFERENCE_SERVICE_BACKEND', 'tflite')
+INFERENCE_SERVICE_PROCESSES = None  # None = la mitad de los núcleos
+INFERENCE_SERVICE_INTRA_OP_THREADS = None  # None = núcleos asignados a cada proceso
+INFERENCE_SERVICE_INTER_OP_THREADS = 1
+# Conexiones que cada worker web reparte por turnos entre los procesos del
+# servicio; None = INFERENCE_SERVICE_PROCESSES (o la mitad de los núcleos)
+INFERENCE_SERVICE_CONNECTIONS = None
+
+# Precalentar el modelo al arrancar (servidores web); los comandos de manage.py
+# lo dejan apagado para no importar TensorFlow
+DIAGNOSTICS_WARMUP_ON_STARTUP = os.environ.get('DIAGNOSTICS_WARMUP_ON_STARTUP', '0') == '1'
+
+# Subidas de imágenes: se inspeccionan mientras llegan (ImageUploadHandler) y se
+# rechazan por formato, tamaño o píxeles antes de recibir el cuerpo completo
+IMAGE_UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 40_000_000
+IMAGE_UPLOAD_MAX_HEADER_BYTES = 256 * 1024
+FILE_UPLOAD_HANDLERS = [
+    'diagnostics.uploads.ImageUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Predicción por lotes (/api/predict/batch/): límites, hilos de preprocesamiento
+# (un pool por proceso) y tamaño de cada pasada del modelo, que es también el
+# bloque que se decodifica de una vez
+BATCH_PREDICT_MAX_IMAGES = 1000
+BATCH_PREDICT_MAX_BYTES = 512 * 1024 * 1024
+BATCH_PREDICT_WORKERS = None  # None = os.cpu_count()
+INFERENCE_BATCH_CHUNK = 64
+# Django limita por defecto a 100 archivos por petición multipart
+DATA_UPLOAD_MAX_NUMBER_FILES = BATCH_PREDICT_MAX_IMAGES + 1
+
+# Cola asíncrona (mode=async): workers de `manage.py run_prediction_workers`
+PREDICTION_WORKERS = 2
+PREDICTION_JOB_BATCH_SIZE = 16
+
+# Endpoints ASGI (/api/async/...): pasadas simultáneas del modelo, peticiones en
+# espera antes de responder 429 y segundos sugeridos en Retry-After
+ASYNC_INFERENCE_CONCURRENCY = None  # None = os.cpu_count()
+ASYNC_INFERENCE_MAX_PENDING = 64
+ASYNC_RETRY_AFTER_SECONDS = 1
+
+# Caché de predicciones por hash de imagen + versión del modelo. LRU en proceso
+# y, opcionalmente, un alias de CACHES compartido entre workers
+PREDICTION_CACHE_ENABLED = True
+PREDICTION_CACHE_MAX_ENTRIES = 10000
+PREDICTION_CACHE_ALIAS = os.environ.get('PREDICTION_CACHE_ALIAS') or None
+PREDICTION_CACHE_TIMEOUT = 7 * 24 * 3600
+
+# Preprocesamiento: filtro de remuestreo (lanczos, bicubic, bilinear, ...) y
+# decodificación JPEG reducida (modo draft)
+PREPROCESS_RESAMPLE = os.environ.get('PREPROCESS_RESAMPLE', 'lanczos')
+PREPROCESS_JPEG_DRAFT = os.environ.get('PREPROCESS_JPEG_DRAFT', '1') == '1'
+
+# Embeddings de la penúltima capa (float16 por diagnóstico) para
+# /api/diagnostics/<id>/similar/; el índice en memoria lee las filas nuevas
+# como mucho cada EMBEDDING_INDEX_REFRESH_SECONDS
+EMBEDDINGS_ENABLED = os.environ.get('EMBEDDINGS_ENABLED', '1') == '1'
+EMBEDDING_INDEX_REFRESH_SECONDS = float(os.environ.get('EMBEDDING_INDEX_REFRESH_SECONDS', 2))
+SIMILAR_DIAGNOSTICS_MAX_K = 50
+
+# Aumentación en tiempo de prueba (parámetro `tta` de /api/predict/): vistas
+# por imagen, evaluadas en una sola pasada, y si se aplica sin pedirla
+TTA_VIEWS = int(os.environ.get('TTA_VIEWS', 8))
+TTA_DEFAULT = os.environ.get('TTA_DEFAULT', '0') == '1'
+
+# Mapas de explicabilidad (/api/diagnostics/<id>/explain/): parche y paso de
+# la oclusión (en píxeles del recorte 224x224), variantes por pasada, métodos
+# a calcular en segundo plano tras cada predicción (p. ej. "occlusion,gradcam")
+# y máximo de diagnósticos esperando en esa cola
+EXPLAIN_OCCLUSION_PATCH = int(os.environ.get('EXPLAIN_OCCLUSION_PATCH', 32))
+EXPLAIN_OCCLUSION_STRIDE = int(os.environ.get('EXPLAIN_OCCLUSION_STRIDE', 16))
+EXPLAIN_BATCH_SIZE = int(os.environ.get('EXPLAIN_BATCH_SIZE', 128))
+EXPLAIN_AFTER_PREDICT = tuple(m for m in os.environ.get('EXPLAIN_AFTER_PREDICT', '').split(',') if m)
+EXPLAIN_BACKGROUND_MAX_PENDING = 32
+
+# Micro-lotes de inferencia: máximo de imágenes por pasada y espera máxima (ms)
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get('INFERENCE_MAX_BATCH_SIZE', 16))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 10))
+
+# Métricas (/metrics, formato Prometheus): IP autorizadas a consultarlas
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip]
+
+# Perfilado por muestreo de peticiones con la cabecera `X-Profile: 1`; las pilas
+# plegadas (flamegraph / speedscope) se guardan en PROFILE_DIR
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+PROFILING_INTERVAL = 0.005
+PROFILE_DIR = BASE_DIR / 'profiles'
+
+# Registro: los mensajes INFO/DEBUG se acumulan en memoria y se escriben por
+# bloques, en lugar de un print por petición. Un WARNING o más grave vacía el
+# búfer de inmediato (no espera a llenarse) y al terminar el proceso
+# logging.shutdown escribe lo pendiente
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'standard': {'format': '%(asctime)s %(levelname)s %(name)s %(process)d: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'standard'},
+        'buffered': {
+            'class': 'logging.handlers.MemoryHandler',
+            'capacity': 200,
+            'flushLevel': logging.WARNING,
+            'flushOnClose': True,
+            'target': 'console',
+        },
+    },
+    'root': {'handlers': ['buffered'], 'level': 'WARNING'},
+    'loggers': {
+        'diagnostics': {'handlers': ['buffered'], 'level': LOG_LEVEL, 'propagate': False},
+        'users': {'handlers': ['buffered'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
 # En desarrollo
 DEBUG = True
 
@@ -4,10 +4,13 @@ from django.views.generic import TemplateView
 from django.conf import settings
 from django.conf.urls.static import static
 
+from diagnostics.views import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('users.urls')),
     path('api/', include('diagnostics.urls')),
+    path('metrics', metrics, name='metrics'),
     
     # Ruta para el dashboard (requiere autenticación)
     path('dashboard/', TemplateView.as_view(template_name='diagnostics/index.html'), name='dashboard'),
@@ -0,0 +1,149 @@
+"""Autenticación JWT sin consultar ``users_user`` en cada petición.
+
+``JWTAuthentication`` de simplejwt lee el usuario de la base de datos en cada
+petición autenticada. ``CachedJWTAuthentication`` primero busca en una caché
+en memoria del proceso (``AUTH_USER_CACHE_SECONDS``). Si el usuario no está,
+lo reconstruye con los datos del token (``users.tokens.USER_CLAIMS``) cuando
+el token se emitió hace menos de ``AUTH_TOKEN_CLAIMS_MAX_AGE`` segundos. Si el
+token es más antiguo, lo lee de la base de datos como simplejwt.
+
+Los campos que no van en el token (email, teléfono...) quedan diferidos:
+Django los lee la primera vez que se usan, como con ``.only()``. Guardar o
+borrar un usuario lo saca de la caché del proceso y deja de confiar en los
+tokens emitidos antes del cambio. En otros procesos, una desactivación tarda
+como mucho el mayor de los dos plazos en aplicarse.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+from .tokens import USER_CLAIMS
+
+
+class UserCache:
+    """LRU con expiración de usuarios por id; seguro entre hilos.
+
+    Guarda y entrega copias: cada petición recibe su propia instancia, así
+    lo que una vista cambie o cargue en ella no se ve en otros hilos.
+    """
+
+    def __init__(self, ttl=60.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # id → instante del último cambio (tokens anteriores no son confiables)
+        self._changed = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < now:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+        return copy.copy(entry[1])
+
+    def set(self, user_id, user):
+        user = copy.copy(user)
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._changed[user_id] = time.time()
+
+    def changed_since(self, user_id, timestamp):
+        """True si el usuario cambió en este proceso en o después de ``timestamp``"""
+        with self._lock:
+            changed = self._changed.get(user_id)
+            if changed is not None and changed < time.time() - self.ttl - claims_max_age():
+                # Ningún token vigente que confíe en sus datos es tan antiguo
+                del self._changed[user_id]
+                changed = None
+        return changed is not None and changed >= timestamp
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def claims_max_age():
+    return getattr(settings, 'AUTH_TOKEN_CLAIMS_MAX_AGE', 300)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = UserCache(
+                    ttl=getattr(settings, 'AUTH_USER_CACHE_SECONDS', 60),
+                    max_entries=getattr(settings, 'AUTH_USER_CACHE_MAX_ENTRIES', 10000),
+                )
+    return _cache
+
+
+@receiver(post_save, sender=User, dispatch_uid='user_cache_save')
+@receiver(post_delete, sender=User, dispatch_uid='user_cache_delete')
+def _user_changed(sender, instance, **kwargs):
+    get_user_cache().invalidate(str(instance.pk))
+
+
+def user_from_claims(token):
+    """Usuario con los campos del token y el resto diferidos, o None si el
+    token no los trae o ya no son confiables"""
+    if any(claim not in token for claim in USER_CLAIMS) or 'iat' not in token:
+        return None
+    issued_at = token['iat']
+    if issued_at < time.time() - claims_max_age():
+        return None
+    user_id = str(token[api_settings.USER_ID_CLAIM])
+    if get_user_cache().changed_since(user_id, issued_at):
+        return None
+    values = {'id': user_id, 'is_active': True, **{claim: token[claim] for claim in USER_CLAIMS}}
+    # from_db recibe los valores en el orden de los campos del modelo
+    fields = [field for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db('default', [field.attname for field in fields],
+                        [field.to_python(values[field.attname]) for field in fields])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication con caché de usuarios y datos del token"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken('El token no identifica a ningún usuario')
+
+        cache = get_user_cache()
+        user = cache.get(user_id)
+        if user is None:
+            user = user_from_claims(validated_token)
+            if user is None:
+                user = super().get_user(validated_token)
+            cache.set(user_id, user)
+        if not user.is_active:
+            raise AuthenticationFailed('Usuario inactivo', code='user_inactive')
+        return user
@@ -98,4 +98,12 @@ class User(AbstractBaseUser):
         return self.role == 'doctor'
     
     class Meta:
-        db_table = 'users_user'
\ No newline at end of file
+        db_table = 'users_user'
+
+class RevokedToken(models.Model):
+    """Token de refresco ya rotado (BLACKLIST_AFTER_ROTATION); se busca por ``jti``"""
+    jti = models.CharField(max_length=255, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'users_revokedtoken'
@@ -0,0 +1,81 @@
+import time
+import uuid
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import UserCache, user_from_claims
+from .models import User
+
+
+def cached_user(**values):
+    return User(id=uuid.uuid4(), email='ana@example.com', first_name='Ana', last_name='Gómez',
+                identification_number='123', role='patient', **values)
+
+
+class UserCacheTests(SimpleTestCase):
+    def test_hits_are_private_copies(self):
+        cache = UserCache(ttl=60)
+        user = cached_user()
+        cache.set('1', user)
+        user.first_name = 'Cambiado'
+        first = cache.get('1')
+        self.assertEqual(first.first_name, 'Ana')
+        first.last_name = 'Otro'
+        second = cache.get('1')
+        self.assertIsNot(first, second)
+        self.assertEqual(second.last_name, 'Gómez')
+        self.assertIsNot(first._state, second._state)
+
+    def test_entries_expire(self):
+        cache = UserCache(ttl=60)
+        cache.set('1', cached_user())
+        with mock.patch('users.authentication.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get('1'))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = UserCache(ttl=60, max_entries=2)
+        cache.set('1', cached_user())
+        cache.set('2', cached_user())
+        cache.get('1')
+        cache.set('3', cached_user())
+        self.assertIsNone(cache.get('2'))
+        self.assertIsNotNone(cache.get('1'))
+
+    def test_invalidate_distrusts_older_tokens(self):
+        cache = UserCache(ttl=60)
+        cache.set('1', cached_user())
+        issued_at = time.time() - 1
+        cache.invalidate('1')
+        self.assertIsNone(cache.get('1'))
+        self.assertTrue(cache.changed_since('1', issued_at))
+        self.assertFalse(cache.changed_since('1', time.time() + 1))
+
+
+class UserFromClaimsTests(SimpleTestCase):
+    def claims(self, **overrides):
+        return {
+            api_settings.USER_ID_CLAIM: str(uuid.uuid4()),
+            'iat': int(time.time()),
+            'role': 'doctor',
+            'first_name': 'Ana',
+            'last_name': 'Gómez',
+            'identification_number': '123',
+            **overrides,
+        }
+
+    def test_builds_user_from_token(self):
+        claims = self.claims()
+        user = user_from_claims(claims)
+        self.assertEqual(str(user.pk), claims[api_settings.USER_ID_CLAIM])
+        self.assertEqual((user.role, user.full_name), ('doctor', 'Ana Gómez'))
+        self.assertTrue(user.is_active)
+        self.assertIn('email', user.get_deferred_fields())
+
+    def test_old_or_incomplete_tokens_are_ignored(self):
+        self.assertIsNone(user_from_claims(self.claims(iat=int(time.time()) - 3600)))
+        claims = self.claims()
+        del claims['role']
+        self.assertIsNone(user_from_claims(claims))
@@ -0,0 +1,54 @@
+"""Tokens JWT con los datos del usuario que usan las vistas.
+
+El token de acceso lleva rol, nombre e identificación, así
+``users.authentication.CachedJWTAuthentication`` puede reconstruir
+``request.user`` sin consultar ``users_user``. La rotación de los tokens de
+refresco se respalda en ``RevokedToken`` (una fila por ``jti`` usado).
+"""
+import random
+
+from django.db import IntegrityError
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import RevokedToken
+
+# Campos del usuario copiados al token (claim = atributo de User)
+USER_CLAIMS = ('role', 'first_name', 'last_name', 'identification_number')
+
+
+class UserRefreshToken(RefreshToken):
+    """RefreshToken cuyo token de acceso hereda USER_CLAIMS"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+
+def token_pair(user):
+    refresh = UserRefreshToken.for_user(user)
+    return {'access_token': str(refresh.access_token), 'refresh_token': str(refresh)}
+
+
+def revoke(token):
+    """Marca el token de refresco como usado; False si ya lo estaba.
+
+    La inserción por clave primaria es a la vez la consulta y la marca, así
+    dos rotaciones simultáneas del mismo token no pueden ganar ambas.
+    """
+    try:
+        RevokedToken.objects.create(
+            jti=token[api_settings.JTI_CLAIM],
+            expires_at=datetime_from_epoch(token['exp']),
+        )
+    except IntegrityError:
+        return False
+    # Limpieza ocasional: pasada la expiración el token ya es inválido
+    if random.random() < 0.01:
+        RevokedToken.objects.filter(expires_at__lt=timezone.now()).delete()
+    return True
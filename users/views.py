@@ -2,10 +2,13 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth import authenticate
+from .authentication import get_user_cache
 from .models import User
 from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserSerializer
+from .tokens import revoke, token_pair
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -13,11 +16,9 @@ def register(request):
     serializer = UserRegistrationSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
-        refresh = RefreshToken.for_user(user)
         return Response({
             'user': UserSerializer(user).data,
-            'access_token': str(refresh.access_token),
-            'refresh_token': str(refresh)
+            **token_pair(user),
         }, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -32,11 +33,12 @@ def login(request):
         try:
             user = User.objects.get(email=email)
             if user.check_password(password):
-                refresh = RefreshToken.for_user(user)
+                # El token lleva los datos del usuario: no se emite a cuentas desactivadas
+                if not user.is_active:
+                    return Response({'error': 'Cuenta desactivada'}, status=status.HTTP_401_UNAUTHORIZED)
                 return Response({
                     'user': UserSerializer(user).data,
-                    'access_token': str(refresh.access_token),
-                    'refresh_token': str(refresh)
+                    **token_pair(user),
                 })
             else:
                 return Response({'error': 'Credenciales inválidas'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -45,8 +47,37 @@ def login(request):
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def refresh(request):
+    """
+    Endpoint: POST /api/auth/refresh/
+    Body: refresh_token. Devuelve un token de acceso nuevo (con los datos
+    actuales del usuario) y, con ROTATE_REFRESH_TOKENS, otro de refresco; el
+    anterior queda revocado si BLACKLIST_AFTER_ROTATION está activo.
+    """
+    try:
+        token = RefreshToken(request.data.get('refresh_token') or request.data.get('refresh'))
+    except TokenError:
+        return Response({'error': 'Token de refresco inválido o expirado'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    user = User.objects.filter(pk=token.get(api_settings.USER_ID_CLAIM), is_active=True).first()
+    if user is None:
+        return Response({'error': 'Usuario no encontrado o inactivo'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    if not api_settings.ROTATE_REFRESH_TOKENS:
+        return Response({'access_token': token_pair(user)['access_token']})
+    if api_settings.BLACKLIST_AFTER_ROTATION and not revoke(token):
+        return Response({'error': 'El token de refresco ya fue usado'}, status=status.HTTP_401_UNAUTHORIZED)
+    return Response(token_pair(user))
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def profile(request):
-    serializer = UserSerializer(request.user)
-    return Response(serializer.data)
\ No newline at end of file
+    user = request.user
+    if user.get_deferred_fields():
+        # Usuario reconstruido desde el token: el perfil necesita la fila completa
+        user = User.objects.get(pk=user.pk)
+        get_user_cache().set(str(user.pk), user)
+    serializer = UserSerializer(user)
+    return Response(serializer.data)